@@ -44,7 +44,8 @@ foreach ($file in $csvFiles) {
         $Utf8NoBom = New-Object System.Text.UTF8Encoding $false
         [System.IO.File]::WriteAllLines("$(Get-Location)\tmp_$file", $content, $Utf8NoBom)
         docker cp "tmp_$file" "namenode:/tmp/$file"
-        docker exec namenode hdfs dfs -put -f /tmp/$file ${hdfsDataPath}/${file}
+        docker exec namenode hdfs dfs -mkdir -p ${hdfsDataPath}/batch=0
+        docker exec namenode hdfs dfs -put -f /tmp/$file ${hdfsDataPath}/batch=0/${file}
         docker exec namenode rm /tmp/$file
         Remove-Item "tmp_$file"
     }
@@ -53,10 +54,15 @@ foreach ($file in $csvFiles) {
 # 6. ВЫПОЛНЕНИЕ HIVE И ЭКСПОРТ
 if (Test-Path "./$hiveScriptName") {
     Write-Host "Executing Hive Script..." -ForegroundColor Yellow
-    docker cp "./$hiveScriptName" ${containerName}:/tmp/init_hive.sql
+    # Ручная загрузка всегда кладёт данные в партицию batch=0
+    $partitionDdl = "ALTER TABLE events ADD IF NOT EXISTS PARTITION (batch=0) LOCATION '${hdfsDataPath}/batch=0';"
+    $script = (Get-Content "./$hiveScriptName" -Raw -Encoding UTF8) -replace '-- @INGEST_PARTITIONS', $partitionDdl
+    [System.IO.File]::WriteAllText("$(Get-Location)\tmp_$hiveScriptName", $script, (New-Object System.Text.UTF8Encoding $false))
+    docker cp "./tmp_$hiveScriptName" ${containerName}:/tmp/init_hive.sql
+    Remove-Item "tmp_$hiveScriptName"
     
     # Запуск вашего SQL-скрипта
-    docker exec $containerName beeline -u "jdbc:hive2://127.0.0.1:10000/default" -n root -f /tmp/init_hive.sql
+    docker exec $containerName beeline -u "jdbc:hive2://127.0.0.1:10000/default" -n root --hivevar events_table=events --hivevar since_batch=-1 -f /tmp/init_hive.sql
 
     Write-Host "Exporting results to ${finalCsvName}..." -ForegroundColor Cyan
     
@@ -66,23 +72,9 @@ if (Test-Path "./$hiveScriptName") {
         drone_id, 
         drone_efficiency, 
         processed_zones, 
-        CAST(avg_battery_during_mission AS DECIMAL(5,2)), 
+        CAST(avg_battery_during_mission AS DECIMAL(5,2)) AS avg_battery_during_mission, 
         unique_zones_handled 
-    FROM (
-        SELECT 
-            drone_id,
-            CASE 
-                WHEN processed_zones >= 5 THEN 'Highly Effective'
-                WHEN processed_zones >= 2 THEN 'Effective'
-                ELSE 'Needs Optimization'
-            END as drone_efficiency,
-            processed_zones,
-            battery as avg_battery_during_mission,
-            zone_id as unique_zones_handled
-        FROM drone_db.drone_analytics
-        WHERE zone_priority_class = 'High'
-          AND event_type IN ('zone_claimed', 'zone_processed')
-    ) t 
+    FROM drone_db.drone_report
     LIMIT 1000
 "@
     
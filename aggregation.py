@@ -0,0 +1,233 @@
+"""Агрегаты сырых событий за один проход с ограниченной памятью.
+
+Файл (или шарды `<stem>-part-NNNNN`) режется на задачи: диапазоны байт CSV,
+row group'ы Parquet или пакеты Feather-кеша из raw_events. Каждая задача читается блоками по BLOCK_BYTES и сворачивается
+в RawAggregates; частичные агрегаты сливаются через merge(), поэтому задачи можно
+раздать по процессам. Память — O(блок + число дронов + сетка), от размера файла не зависит.
+
+    python aggregation.py drone_events_million.csv --workers 8
+"""
+import argparse
+import glob
+import io
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # нужен только для Parquet и Feather-кеша
+    pa = pq = None
+
+import density_tiles
+import enrichment
+import raw_events
+import spatial_index
+
+# --- ПАРАМЕТРЫ ---
+USECOLS = ["drone_id", "event_type", "x", "y", "battery", "mode"]
+BLOCK_BYTES = 64 * 1024 * 1024      # сколько CSV читаем за раз внутри задачи
+TASK_BYTES = 256 * 1024 * 1024      # диапазон байт на одну задачу
+
+
+class RawAggregates:
+    """Сливаемые частичные агрегаты: все KPI и входы графиков по сырым данным"""
+
+    def __init__(self):
+        self.total_events = 0
+        self.event_counts = Counter()
+        self.drone_events = pd.Series(dtype="int64")    # все строки дрона
+        self.drone_bat_sum = pd.Series(dtype="float64")
+        self.drone_bat_n = pd.Series(dtype="int64")     # строки с известной батареей
+        self.priority_bat_sum = np.zeros(len(enrichment.PRIORITY_CLASSES))
+        self.priority_bat_n = np.zeros(len(enrichment.PRIORITY_CLASSES), dtype=np.int64)
+        self.tiles = density_tiles.DensityPyramid()
+
+    def update(self, chunk):
+        """Добавить пакет строк (DataFrame с колонками из USECOLS, лишних может не быть)"""
+        self.total_events += len(chunk)
+        if "event_type" in chunk:
+            # Из Parquet event_type приходит категорией — пустые категории не считаем
+            counts = chunk["event_type"].value_counts(dropna=True)
+            self.event_counts.update(counts[counts > 0].to_dict())
+        if "drone_id" in chunk:
+            drones = chunk["drone_id"].dropna()
+            self._add("drone_events", drones.value_counts())
+            if "battery" in chunk:
+                valid = chunk.dropna(subset=["drone_id", "battery"])
+                by_drone = valid.groupby("drone_id")["battery"]
+                self._add("drone_bat_sum", by_drone.sum())
+                self._add("drone_bat_n", by_drone.size())
+        if {"x", "y"}.issubset(chunk.columns):
+            self.tiles.update(chunk)
+            if "battery" in chunk:
+                # Класс приоритета — из таблицы ячеек сетки (spatial_index), без строк на каждую точку
+                cells = chunk["cell"] if "cell" in chunk else None
+                priority = spatial_index.priority_codes(chunk["x"], chunk["y"], cells)
+                battery = chunk["battery"].to_numpy(dtype=float)
+                known = ~np.isnan(battery)
+                n = len(enrichment.PRIORITY_CLASSES)
+                self.priority_bat_sum += np.bincount(priority[known], weights=battery[known], minlength=n)
+                self.priority_bat_n += np.bincount(priority[known], minlength=n)
+        return self
+
+    def _add(self, name, series):
+        setattr(self, name, getattr(self, name).add(series, fill_value=0))
+
+    def merge(self, other):
+        """Слить агрегаты другой части (порядок частей не важен)"""
+        self.total_events += other.total_events
+        self.event_counts.update(other.event_counts)
+        for name in ("drone_events", "drone_bat_sum", "drone_bat_n"):
+            self._add(name, getattr(other, name))
+        self.priority_bat_sum += other.priority_bat_sum
+        self.priority_bat_n += other.priority_bat_n
+        self.tiles.merge(other.tiles)
+        return self
+
+    # --- Готовые таблицы для дашборда ---
+
+    @property
+    def unique_drones(self):
+        return len(self.drone_events)
+
+    def event_counts_frame(self):
+        return pd.DataFrame(self.event_counts.most_common(), columns=["event_type", "count"])
+
+    def drone_stats(self):
+        n = self.drone_bat_n[self.drone_bat_n > 0]
+        return pd.DataFrame({
+            "drone_id": n.index,
+            "avg_battery": (self.drone_bat_sum[n.index] / n).to_numpy(),
+            "count": n.astype("int64").to_numpy(),
+        })
+
+    def priority_battery(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = self.priority_bat_sum / self.priority_bat_n
+        return pd.DataFrame({"Приоритет зоны": enrichment.PRIORITY_CLASSES, "Ср. батарея": means})
+
+
+# --- Разбиение входа на задачи ---
+
+def resolve_inputs(path):
+    """Сам файл или его шарды `<stem>-part-NNNNN<ext>` от headless_simulation"""
+    if os.path.exists(path):
+        return [path]
+    stem, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(stem)}-part-[0-9]*{ext}"))
+
+
+def csv_header(path):
+    with open(path, "rb") as f:
+        line = f.readline()
+    return len(line), line.decode("utf-8-sig").strip().split(",")
+
+
+def input_columns(path):
+    """Имена колонок CSV или Parquet"""
+    if path.endswith(".parquet"):
+        return pq.ParquetFile(path).schema_arrow.names
+    return csv_header(path)[1]
+
+
+def plan_tasks(paths, task_bytes=TASK_BYTES):
+    """Задачи ("csv", путь, начало, конец), ("parquet", путь, row group), ("feather", путь, пакет)"""
+    tasks = []
+    for path in paths:
+        if raw_events.sidecar_fresh(path):
+            # Актуальный Feather-кеш читается через mmap без разбора CSV
+            side = raw_events.sidecar_path(path)
+            with pa.memory_map(side) as source:
+                batches = pa.ipc.open_file(source).num_record_batches
+            tasks.extend(("feather", side, i) for i in range(batches))
+            continue
+        if path.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError("pyarrow is required to aggregate Parquet: pip install pyarrow")
+            groups = pq.ParquetFile(path).num_row_groups
+            tasks.extend(("parquet", path, i) for i in range(groups))
+            continue
+        data_start, _ = csv_header(path)
+        size = os.path.getsize(path)
+        starts = range(data_start, size, task_bytes)
+        tasks.extend(("csv", path, s, min(s + task_bytes, size)) for s in starts)
+    return tasks
+
+
+def iter_csv_range(path, start, end, block_bytes=BLOCK_BYTES):
+    """Строки, которые НАЧИНАЮТСЯ в [start, end), блоками-DataFrame"""
+    _, columns = csv_header(path)
+    usecols = [c for c in USECOLS if c in columns]
+    with open(path, "rb") as f:
+        # Строку, начатую до start, дочитывает предыдущая задача
+        f.seek(start - 1)
+        f.readline()
+        pos = f.tell()
+        while pos < end:
+            block = f.read(min(block_bytes, end - pos))
+            if block and not block.endswith(b"\n"):
+                block += f.readline()
+            if not block:
+                break
+            pos += len(block)
+            yield pd.read_csv(io.BytesIO(block), header=None, names=columns, usecols=usecols)
+
+
+def run_task(task):
+    aggs = RawAggregates()
+    if task[0] == "feather":
+        _, path, i = task
+        with pa.memory_map(path) as source:
+            batch = pa.ipc.open_file(source).get_batch(i)
+            columns = [c for c in USECOLS if c in batch.schema.names]
+            aggs.update(batch.select(columns).to_pandas())
+    elif task[0] == "parquet":
+        _, path, group = task
+        pf = pq.ParquetFile(path)
+        columns = [c for c in USECOLS if c in pf.schema_arrow.names]
+        aggs.update(pf.read_row_group(group, columns=columns).to_pandas())
+    else:
+        _, path, start, end = task
+        for chunk in iter_csv_range(path, start, end):
+            aggs.update(chunk)
+    return aggs
+
+
+def aggregate(path, workers=1, task_bytes=TASK_BYTES):
+    """Агрегаты по всему файлу/шардам; workers > 1 — задачи в пуле процессов"""
+    tasks = plan_tasks(resolve_inputs(path), task_bytes)
+    total = RawAggregates()
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            total.merge(run_task(task))
+        return total
+    with Pool(min(workers, len(tasks))) as pool:
+        for part in pool.imap_unordered(run_task, tasks):
+            total.merge(part)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV/Parquet или имя без -part-NNNNN для шардов")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--task-mb", type=int, default=TASK_BYTES // 2**20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    aggs = aggregate(args.input, args.workers, args.task_mb * 2**20)
+    elapsed = time.perf_counter() - started
+    print(f"Events: {aggs.total_events:,}  drones: {aggs.unique_drones:,}  "
+          f"outside grid: {aggs.tiles.outside:,}  ({elapsed:.1f}s, {aggs.total_events / elapsed:,.0f} rows/s)")
+    print(aggs.event_counts_frame().to_string(index=False))
+    print(aggs.priority_battery().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Потоковый экспорт результата запроса в CSV (Excel), Parquet и Feather.
+
+Строки приходят пакетами из hive_client (query()), каждый пакет сразу уходит во
+все выбранные форматы — результат целиком в памяти не держится. Файлы пишутся
+во временные и подменяются атомарно, чтобы дашборд не прочитал половину.
+"""
+import csv
+import os
+from decimal import Decimal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # нужен только для parquet/feather
+    pa = pq = None
+
+FORMATS = ("csv", "parquet", "feather")
+# Типы HiveServer2 (cursor.description) → фабрики pyarrow. DECIMAL пишем как float64:
+# pyhive отдаёт Decimal без объявленной точности, а вывод типа по значениям первого
+# пакета (99.50 → decimal128(4,2)) ломается на следующем (100.00)
+ARROW_TYPES = {
+    "BOOLEAN_TYPE": "bool_", "TINYINT_TYPE": "int8", "SMALLINT_TYPE": "int16", "INT_TYPE": "int32",
+    "BIGINT_TYPE": "int64", "FLOAT_TYPE": "float32", "DOUBLE_TYPE": "float64", "DECIMAL_TYPE": "float64",
+    "STRING_TYPE": "string", "VARCHAR_TYPE": "string", "CHAR_TYPE": "string",
+}
+
+
+def finish(path, ok):
+    """Подменить файл готовым .tmp или убрать .tmp после ошибки"""
+    if ok:
+        os.replace(path + ".tmp", path)
+    else:
+        os.remove(path + ".tmp")
+
+
+class CsvSink:
+    """CSV для Excel: BOM пишется сразу, без повторного чтения файла"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self._f = open(path + ".tmp", "w", encoding="utf-8-sig", newline='')
+        self._writer = csv.writer(self._f, lineterminator='\n')
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self, ok=True):
+        self._f.close()
+        finish(self.path, ok)
+
+
+def column_array(values, arrow_type=None):
+    """Колонка пакета в Arrow; Decimal — как float, decimal128 по значениям не выводим"""
+    if arrow_type is None or pa.types.is_floating(arrow_type):
+        values = [float(v) if isinstance(v, Decimal) else v for v in values]
+    return pa.array(values, type=arrow_type)
+
+
+class ArrowSink:
+    """Parquet / Feather (Arrow IPC): схема из типов колонок запроса,
+    неизвестные типы (SQLite-заглушка) — по первому пакету"""
+
+    def __init__(self, path, columns, fmt, types=None):
+        if pa is None:
+            raise RuntimeError(f"pyarrow is required for {fmt} export: pip install pyarrow")
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self.types = [getattr(pa, ARROW_TYPES[t])() if t in ARROW_TYPES else None
+                      for t in types or [None] * len(columns)]
+        self.schema = None
+        self._writer = None
+
+    def _open(self, inferred):
+        # Колонка целиком из NULL в первом пакете — считаем её числовой (все метрики экспорта такие)
+        self.schema = pa.schema([(name, t or (pa.float64() if i == pa.null() else i))
+                                 for name, t, i in zip(self.columns, self.types, inferred)])
+        tmp = self.path + ".tmp"
+        if self.fmt == "parquet":
+            self._writer = pq.ParquetWriter(tmp, self.schema, compression="snappy")
+        else:
+            self._writer = pa.ipc.new_file(tmp, self.schema)
+
+    def _to_batch(self, rows):
+        arrays = [column_array(list(col), t) for col, t in zip(zip(*rows), self.types)]
+        if self.schema is None:
+            self._open([arr.type for arr in arrays])
+        arrays = [arr.cast(field.type) for arr, field in zip(arrays, self.schema)]
+        return pa.record_batch(arrays, schema=self.schema)
+
+    def write(self, rows):
+        batch = self._to_batch(rows)
+        if self.fmt == "parquet":
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self, ok=True):
+        if self._writer is None:
+            if not ok:
+                return
+            # Пустой результат — файл только со схемой, иначе остался бы прошлый прогон
+            self._open([pa.null()] * len(self.columns))
+        self._writer.close()
+        finish(self.path, ok)
+
+
+def output_paths(base_path, formats):
+    """drone_swarm_analytics.csv + ["parquet"] → {"parquet": "drone_swarm_analytics.parquet"}"""
+    stem = os.path.splitext(base_path)[0]
+    return {fmt: base_path if fmt == "csv" else f"{stem}.{fmt}" for fmt in formats}
+
+
+def limit_query(query, limit):
+    """Добавить LIMIT (0 / None — без ограничения)"""
+    return f"{query} LIMIT {int(limit)}" if limit else query
+
+
+def export_query(client, query, base_path, formats=("csv",), limit=None, batch_size=10_000):
+    """Выполнить запрос и записать результат во все форматы за один проход.
+    Возвращает (число строк, {формат: путь})"""
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown export formats: {', '.join(sorted(unknown))}")
+    paths = output_paths(base_path, formats)
+    columns, types, batches = client.query(limit_query(query, limit), batch_size)
+    sinks = [CsvSink(path, columns) if fmt == "csv" else ArrowSink(path, columns, fmt, types)
+             for fmt, path in paths.items()]
+    total, ok = 0, False
+    try:
+        for rows in batches:
+            for sink in sinks:
+                sink.write(rows)
+            total += len(rows)
+        ok = True
+    finally:
+        for sink in sinks:
+            sink.close(ok)
+    return total, paths
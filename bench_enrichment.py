@@ -0,0 +1,127 @@
+"""Сверка enrichment.py с правилами init_hive.sql и замер ускорения против построчного apply.
+
+    python bench_enrichment.py --check            # CASE-выражения из init_hive.sql vs NumPy и ячейки сетки
+    python bench_enrichment.py --rows 200000      # apply(axis=1) vs векторизация
+"""
+import argparse
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import enrichment
+import spatial_index
+
+HIVE_SCRIPT_NAME = "init_hive.sql"
+
+# Правило состояния батареи из прежней drone_analytics (в init_hive.sql его больше нет)
+BATTERY_STATUS_SQL = """CASE
+        WHEN battery > 70 THEN 'High'
+        WHEN battery BETWEEN 30 AND 70 THEN 'Medium'
+        ELSE 'Critical'
+    END"""
+
+
+def hive_case(script, alias):
+    """Текст CASE ... END, который в init_hive.sql помечен `as <alias>`"""
+    matches = re.findall(r"(CASE\s+WHEN(?:(?!\bCASE\b).)*?END)\s+as\s+" + alias, script, re.DOTALL | re.IGNORECASE)
+    if not matches:
+        raise ValueError(f"CASE ... END as {alias} not found in {HIVE_SCRIPT_NAME}")
+    return matches[0]
+
+
+def sample_frame(rows, seed=0):
+    """Случайные события + граничные значения порогов и пропуски"""
+    rng = np.random.default_rng(seed)
+    cx, cy = enrichment.FIELD_CENTER
+    edges = [(cx + d, cy) for d in (0, 199.999, 200, 200.001, 399.999, 400, 400.001)] + [(np.nan, cy)]
+    x = np.concatenate([rng.uniform(200, 1200, rows), [e[0] for e in edges]])
+    y = np.concatenate([rng.uniform(200, 500, rows), [e[1] for e in edges]])
+    battery = np.concatenate([rng.uniform(0, 100, rows), [29.9, 30, 50, 70, 70.1, 80, np.nan, 100]])
+    zones = np.concatenate([rng.integers(0, 10, rows).astype(float), [0, 1, 2, 4, 5, 6, np.nan, 100]])
+    return pd.DataFrame({"x": x, "y": y, "battery": battery, "processed_zones": zones})
+
+
+def check(rows=10_000):
+    with open(HIVE_SCRIPT_NAME, encoding="utf-8") as f:
+        script = f.read()
+    df = sample_frame(rows)
+    df["dist_to_center"] = enrichment.distance_to_center(df["x"], df["y"])
+    conn = sqlite3.connect(":memory:")
+    df.to_sql("t", conn, index=False)
+
+    rules = {
+        "zone_priority_class": (hive_case(script, "zone_priority_class"),
+                                enrichment.zone_priority_class(df["x"], df["y"])),
+        # Тот же CASE против таблицы приоритетов ячеек сетки (aggregation, sketches)
+        "zone_priority_cells": (hive_case(script, "zone_priority_class"),
+                                spatial_index.priority_class(df["x"], df["y"])),
+        # В drone_report правило считается по SUM(processed_zones) — сверяем на готовых суммах
+        "drone_efficiency": (hive_case(script, "drone_efficiency").replace("SUM(processed_zones)", "processed_zones"),
+                             enrichment.drone_efficiency(df["processed_zones"])),
+        "battery_status": (BATTERY_STATUS_SQL, enrichment.battery_status(df["battery"])),
+    }
+    failed = False
+    for name, (case_sql, expected) in rules.items():
+        hive = np.array([r[0] for r in conn.execute(f"SELECT {case_sql} FROM t")], dtype=object)
+        mismatches = int((hive != expected).sum())
+        failed |= mismatches > 0
+        print(f"{name:>20}: {len(df):,} rows, {mismatches} mismatches")
+    if failed:
+        raise SystemExit("enrichment.py diverges from init_hive.sql")
+
+
+def classify_priority_row(row):
+    """Прежняя построчная реализация из dashboard.py"""
+    dist = np.sqrt((row['x'] - 800)**2 + (row['y'] - 350)**2)
+    if dist < 200:
+        return 'High'
+    elif dist <= 400:
+        return 'Medium'
+    else:
+        return 'Low'
+
+
+def assign_efficiency_row(bat):
+    if bat >= 80:
+        return 'High'
+    elif bat >= 50:
+        return 'Medium'
+    else:
+        return 'Low'
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def benchmark(rows):
+    df = sample_frame(rows).dropna()
+    slow, t_slow = timed(lambda d: d.apply(classify_priority_row, axis=1), df)
+    fast, t_fast = timed(enrichment.zone_priority_class, df["x"], df["y"])
+    assert (slow.to_numpy() == fast).all()
+    print(f"zone priority   : apply {t_slow:8.3f}s | numpy {t_fast:8.4f}s | x{t_slow / t_fast:,.0f}")
+
+    slow, t_slow = timed(lambda s: s.apply(assign_efficiency_row), df["battery"])
+    fast, t_fast = timed(enrichment.battery_efficiency, df["battery"])
+    assert (slow.to_numpy() == fast).all()
+    print(f"battery effic.  : apply {t_slow:8.3f}s | numpy {t_fast:8.4f}s | x{t_slow / t_fast:,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="Сверить правила с init_hive.sql")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+    if args.check:
+        check()
+    else:
+        benchmark(args.rows)
+
+
+if __name__ == "__main__":
+    main()
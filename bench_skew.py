@@ -0,0 +1,91 @@
+"""Замер перекоса по drone_id = -1 в агрегации drone_summary (init_hive.sql, шаг 4).
+
+Эмулирует shuffle Hive: строка уходит на редьюсер (hash(drone_id) & MAX_INT) % R,
+после чего каждый редьюсер считает свою часть агрегатов. Сравниваются:
+  before — одна ветка GROUP BY drone_id с COUNT(DISTINCT) по всем событиям;
+  after  — разведчики (-1) отдельной веткой: map-side частичные агрегаты
+           (одна строка на маппер), рабочие дроны — как раньше.
+
+    python bench_skew.py --records 1000000 --reducers 8 --mappers 8
+    python bench_skew.py --input drone_events_million.csv
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import headless_simulation as sim
+
+INT_MAX = 0x7FFFFFFF
+
+
+def load_events(path=None, records=1_000_000):
+    if path:
+        return pd.read_csv(path, usecols=["drone_id", "zone_id", "battery", "event_type"])
+    cols = sim.simulate_range(0, records // 500 + 1)
+    df = pd.DataFrame({k: cols[k] for k in ["drone_id", "zone_id", "battery", "event_type"]})
+    return df.head(records)
+
+
+def reducer_of(keys, reducers):
+    """Раздача ключей по редьюсерам как в Hive (hashCode(int) = само значение)"""
+    return (keys.astype(np.int64) & INT_MAX) % reducers
+
+
+def reduce_work(part):
+    """Работа одного редьюсера: агрегаты drone_summary по его ключам"""
+    work = part["event_type"] != sim.EV_DISCOVERED
+    return part.assign(high_zone=part["zone_id"].where(work)).groupby("drone_id").agg(
+        events=("battery", "size"), battery_sum=("battery", "sum"), high_unique_zones=("high_zone", "nunique"))
+
+
+def time_reducers(df, reducers):
+    rows, secs = np.zeros(reducers, dtype=np.int64), np.zeros(reducers)
+    for r, part in df.groupby(reducer_of(df["drone_id"].to_numpy(), reducers)):
+        started = time.perf_counter()
+        reduce_work(part)
+        secs[r] = time.perf_counter() - started
+        rows[r] = len(part)
+    return rows, secs
+
+
+def scout_partials(df, mappers):
+    """Map-side агрегация ветки разведчиков: по одной строке на маппер"""
+    battery = df.loc[df["drone_id"] == -1, "battery"].to_numpy()
+    return pd.DataFrame([{"drone_id": -1, "zone_id": -1, "event_type": sim.EV_DISCOVERED,
+                          "battery": chunk.sum()} for chunk in np.array_split(battery, mappers)])
+
+
+def report(title, rows, secs):
+    print(f"\n{title}")
+    print(f"{'reducer':>8} {'rows':>10} {'sec':>8}")
+    for r, (n, s) in enumerate(zip(rows, secs)):
+        print(f"{r:>8} {n:>10,} {s:>8.3f}")
+    busy = secs[rows > 0]
+    print(f"max/mean rows: {rows.max() / max(rows[rows > 0].mean(), 1):.2f}  "
+          f"max/mean time: {busy.max() / max(busy.mean(), 1e-9):.2f}  "
+          f"straggler: {secs.max():.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="CSV с событиями (по умолчанию генерируем)")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--reducers", type=int, default=8)
+    parser.add_argument("--mappers", type=int, default=8)
+    args = parser.parse_args()
+
+    df = load_events(args.input, args.records)
+    if not pd.api.types.is_numeric_dtype(df["event_type"]):
+        df["event_type"] = df["event_type"].map({name: i for i, name in enumerate(sim.EVENT_TYPES)})
+    print(f"Events: {len(df):,}, scouts (drone_id = -1): {(df['drone_id'] == -1).mean():.1%}")
+
+    report("BEFORE: single GROUP BY drone_id", *time_reducers(df, args.reducers))
+
+    after = pd.concat([df[df["drone_id"] != -1], scout_partials(df, args.mappers)], ignore_index=True)
+    report("AFTER: scouts split out and pre-aggregated map-side", *time_reducers(after, args.reducers))
+
+
+if __name__ == "__main__":
+    main()
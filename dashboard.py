@@ -2,43 +2,120 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import glob
 import os
+import pickle
+import time
 import plotly.express as px
 import plotly.graph_objects as go
 
+import aggregation
+import density_tiles
+import enrichment
+import live_stream
+import raw_events
+import sketches
+import spatial_index
+import telemetry
+
 st.set_page_config(page_title="Аналитика дронов", layout="wide")
 st.title(" Аналитика дронов")
+render_started = time.perf_counter()
+
+@st.cache_resource
+def dashboard_metrics():
+    """Один Recorder на процесс сервера: загрузки и агрегаты пишутся только при промахе кеша"""
+    return telemetry.Recorder("dashboard")
 
 def safe_load_csv(path, **kwargs):
     if not os.path.exists(path):
         return None
     try:
+        if path.endswith(".feather"):
+            return pd.read_feather(path, **kwargs)
         return pd.read_csv(path, **kwargs)
     except Exception as e:
         st.error(f"Ошибка при загрузке {path}: {e}")
         return None
 
 # ===================================================================
-#  СЫРЫЕ ДАННЫЕ (до 1 млн строк)
+#  КЕШ ДАННЫХ: общий для всех сессий, ключ — путь + размер + mtime файла
 # ===================================================================
-raw_file = "drone_events_million.csv"
-raw_df = safe_load_csv(raw_file, nrows=1_000_000)
+RAW_CACHE_ENTRIES = 2   # сколько версий сырых данных держим в памяти
+AGG_CACHE_ENTRIES = 8
+AGG_WORKERS = os.cpu_count()   # процессы для агрегации сырых данных
+PREVIEW_ROWS = 20
 
-if raw_df is not None:
-    st.header(" Сырые события дронов (выборка 1M строк)")
+def file_signature(path):
+    """(размер, mtime) файла — новый CSV даёт новый ключ кеша, старый вытесняется"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
 
+@st.cache_resource(max_entries=RAW_CACHE_ENTRIES, show_spinner="Загрузка данных...")
+def load_cached(path, signature, **kwargs):
+    # Кадр общий для всех сессий и не копируется — дальше его только читаем
+    with dashboard_metrics().timer("load", nbytes=signature[0], file=path) as span:
+        df = safe_load_csv(path, **kwargs)
+        span["rows"] = len(df) if df is not None else None
+    return df
+
+@st.cache_resource(max_entries=RAW_CACHE_ENTRIES, show_spinner="Загрузка сырых событий...")
+def load_raw_cached(path, signature, nrows):
+    # Только первые nrows строк с компактными типами: память не растёт с размером файла
+    try:
+        with dashboard_metrics().timer("load", file=path) as span:
+            df = raw_events.read_csv_typed(path, nrows=nrows)
+            span["rows"] = len(df)
+        return df
+    except Exception as e:
+        st.error(f"Ошибка при загрузке {path}: {e}")
+        return None
+
+# cache_resource, а не cache_data: пирамида плотности — десятки МБ, копировать её на каждый rerun незачем
+@st.cache_resource(max_entries=AGG_CACHE_ENTRIES, show_spinner="Расчёт агрегатов по всем событиям...")
+def raw_aggregates(path, signature):
+    """Всё, что рисуется по сырым данным, за один проход по файлу любого размера"""
+    inputs = aggregation.resolve_inputs(path)
+    columns = set(aggregation.input_columns(inputs[0]))
+    with dashboard_metrics().timer("aggregate", nbytes=sum(sig[0] for sig in signature), file=path,
+                                   workers=AGG_WORKERS) as span:
+        agg = aggregation.aggregate(path, workers=AGG_WORKERS)
+        span["rows"] = agg.total_events
+    return aggregates_view(agg, columns)
+
+def aggregates_view(agg, columns):
+    """Входы графиков из RawAggregates — общие для файла и живого потока"""
+    aggs = {
+        "total_events": agg.total_events,
+        "unique_drones": agg.unique_drones,
+    }
+    if 'event_type' in columns:
+        aggs["event_counts"] = agg.event_counts_frame()
+    if {'drone_id', 'battery'}.issubset(columns):
+        aggs["drone_stats"] = agg.drone_stats()
+    if {'x', 'y'}.issubset(columns):
+        aggs["tiles"] = agg.tiles
+    if {'x', 'y', 'battery'}.issubset(columns):
+        aggs["priority_battery"] = agg.priority_battery()
+    return aggs
+
+def render_raw(aggs, preview):
+    """KPI и графики по агрегатам сырых событий"""
     with st.expander(" Просмотр данных"):
-        st.dataframe(raw_df.head(20), use_container_width=True)
+        st.dataframe(preview, use_container_width=True)
 
     st.markdown("###  Ключевые метрики дронов")
 
     col_kpi1, col_kpi2 = st.columns(2)
 
-    total_events = len(raw_df)
+    total_events = aggs["total_events"]
     with col_kpi1:
         st.metric(label="Всего событий", value=f"{total_events:,}")
 
-    unique_drones = raw_df['drone_id'].nunique() if 'drone_id' in raw_df.columns else 0
+    unique_drones = aggs["unique_drones"]
     with col_kpi2:
         st.metric(label="Уникальных дронов", value=str(unique_drones))
 
@@ -46,9 +123,8 @@ if raw_df is not None:
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("📌 Распределение типов событий")
-        if 'event_type' in raw_df.columns:
-            event_counts = raw_df['event_type'].value_counts().reset_index()
-            event_counts.columns = ['event_type', 'count']
+        if "event_counts" in aggs:
+            event_counts = aggs["event_counts"]
             fig = px.pie(
                 event_counts,
                 names='event_type',
@@ -62,13 +138,10 @@ if raw_df is not None:
     # === ГРАФИК 2: Средняя батарея по топ-10 дронам ===
     with col2:
         st.subheader(" Ср. уровень батареи (Топ-10 активных дронов)")
-        if {'drone_id', 'battery'}.issubset(raw_df.columns):
-            valid_bat = raw_df.dropna(subset=['battery']).copy()
-            if not valid_bat.empty:
+        if "drone_stats" in aggs:
+            if not aggs["drone_stats"].empty:
                 drone_stats = (
-                    valid_bat.groupby('drone_id')
-                    .agg(avg_battery=('battery', 'mean'), count=('battery', 'size'))
-                    .reset_index()
+                    aggs["drone_stats"]
                     .nlargest(10, 'count')
                     .sort_values('avg_battery', ascending=False)
                 )
@@ -107,20 +180,10 @@ if raw_df is not None:
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("Нет данных для сравнения эффективности и батареи.")
-    elif {'battery'}.issubset(raw_df.columns):
-        raw_df['timestamp'] = pd.to_datetime(raw_df['timestamp'], errors='coerce')
-        valid_bat = raw_df.dropna(subset=['battery', 'drone_id']).copy()
-
-        if not valid_bat.empty:
-            drone_avg_bat = valid_bat.groupby('drone_id')['battery'].mean().reset_index()
-            def assign_efficiency(bat):
-                if bat >= 80:
-                    return 'High'
-                elif bat >= 50:
-                    return 'Medium'
-                else:
-                    return 'Low'
-            drone_avg_bat['drone_efficiency'] = drone_avg_bat['battery'].apply(assign_efficiency)
+    elif "drone_stats" in aggs:
+        if not aggs["drone_stats"].empty:
+            drone_avg_bat = aggs["drone_stats"][['drone_id', 'avg_battery']].rename(columns={'avg_battery': 'battery'})
+            drone_avg_bat['drone_efficiency'] = enrichment.battery_efficiency(drone_avg_bat['battery'])
 
             fig = px.box(
                 drone_avg_bat,
@@ -140,34 +203,34 @@ if raw_df is not None:
 
     # === ГРАФИК 4: Тепловая карта плотности событий (x, y) ===
     st.subheader(" Плотность событий (X-Y координаты)")
-    if {'x', 'y'}.issubset(raw_df.columns):
-        sample_heat = raw_df[['x', 'y']].dropna().sample(min(30000, len(raw_df)))
-        fig = px.density_heatmap(
-            sample_heat,
-            x='x',
-            y='y',
-            nbinsx=60,
-            nbinsy=60,
-            title="Пространственная плотность событий дронов",
-            color_continuous_scale='Viridis'
+    if "tiles" in aggs:
+        tiles = aggs["tiles"]
+        (x_min, x_max), (y_min, y_max) = density_tiles.GRID_RANGE
+        col_f1, col_f2 = st.columns(2)
+        with col_f1:
+            modes = st.multiselect("Режим (mode)", tiles.modes, default=tiles.modes)
+            x_range = st.slider("Окно по X", x_min, x_max, (x_min, x_max))
+        with col_f2:
+            event_types = st.multiselect("Тип события", tiles.event_types, default=tiles.event_types)
+            y_range = st.slider("Окно по Y", y_min, y_max, (y_min, y_max))
+        # Уровень пирамиды подбирается под окно: при приближении бины мельче, ячеек столько же
+        grid_x, grid_y, counts, bins = tiles.window(
+            (x_range, y_range),
+            modes=modes if tiles.modes else None,
+            event_types=event_types if tiles.event_types else None,
+        )
+        fig = go.Figure(go.Heatmap(x=grid_x, y=grid_y, z=counts, colorscale='Viridis'))
+        fig.update_layout(
+            title=f"Пространственная плотность событий дронов (сетка {bins}x{bins})",
+            xaxis_title="X Координата",
+            yaxis_title="Y Координата"
         )
-        fig.update_layout(xaxis_title="X Координата", yaxis_title="Y Координата")
         st.plotly_chart(fig, use_container_width=True)
 
     # === ГРАФИК 5: Приоритет зон + батарея ===
     st.subheader(" Уровень батареи по приоритету зоны")
-    if {'x', 'y', 'battery'}.issubset(raw_df.columns):
-        def classify_priority(row):
-            dist = np.sqrt((row['x'] - 800)**2 + (row['y'] - 350)**2)
-            if dist < 200:
-                return 'High'
-            elif dist <= 400:
-                return 'Medium'
-            else:
-                return 'Low'
-        raw_df['zone_priority'] = raw_df.apply(classify_priority, axis=1)
-        priority_battery = raw_df.groupby('zone_priority')['battery'].mean().reindex(['High', 'Medium', 'Low']).reset_index()
-        priority_battery.columns = ['Приоритет зоны', 'Ср. батарея']
+    if "priority_battery" in aggs:
+        priority_battery = aggs["priority_battery"]
         fig = px.bar(
             priority_battery,
             x='Приоритет зоны',
@@ -180,6 +243,135 @@ if raw_df is not None:
         fig.update_traces(textposition='outside')
         st.plotly_chart(fig, use_container_width=True)
 
+# ===================================================================
+#  ЖИВОЙ ПОТОК: снимок агрегатов от live_stream.py, перечитывается сам
+# ===================================================================
+LIVE_STORE = live_stream.LIVE_STORE
+LIVE_REFRESH_SEC = 2
+LIVE_LATENCY_WINDOW = 100   # сколько последних снимков берём в перцентили задержки
+
+@st.cache_resource(max_entries=2)
+def load_live(path, signature):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+@st.fragment(run_every=LIVE_REFRESH_SEC)
+def live_section():
+    signature = file_signature(LIVE_STORE)
+    if signature is None:
+        st.warning(f"⚠️ Снимка `{LIVE_STORE}` ещё нет — запустите `python live_stream.py consume`.")
+        return
+    snapshot = load_live(LIVE_STORE, signature)
+    rendered_at = time.time()
+    # Задержка событие → график: самое старое событие снимка до его первой отрисовки
+    latencies = st.session_state.setdefault("live_latencies", {})
+    if snapshot["oldest_new_sent"] is not None and signature not in latencies:
+        latencies[signature] = rendered_at - snapshot["oldest_new_sent"]
+        for old in list(latencies)[:-LIVE_LATENCY_WINDOW]:
+            del latencies[old]
+
+    st.header(" Живой поток событий")
+    col_l1, col_l2, col_l3 = st.columns(3)
+    with col_l1:
+        st.metric(label="Событий получено", value=f"{snapshot['aggregates'].total_events:,}",
+                  delta=f"+{snapshot['new_events']:,}")
+    with col_l2:
+        st.metric(label="Возраст снимка", value=f"{rendered_at - snapshot['published_at']:.1f} с")
+    with col_l3:
+        if latencies:
+            values = np.array(list(latencies.values()))
+            st.metric(label="Событие → график (p50 / p99)",
+                      value=f"{np.percentile(values, 50):.2f} / {np.percentile(values, 99):.2f} с")
+    lag = snapshot["publish_latency"]
+    st.caption(f"До публикации снимка: p50 {lag['p50']:.2f} с, p99 {lag['p99']:.2f} с; "
+               f"незавершённых зон: {snapshot['open_zones']:,}. Обновление каждые {LIVE_REFRESH_SEC} с.")
+
+    recent = snapshot["recent"]
+    columns = set(recent.columns) if recent is not None else set()
+    render_raw(aggregates_view(snapshot["aggregates"], columns), recent)
+
+    st.subheader(" Жизненный цикл зон")
+    col_z1, col_z2 = st.columns(2)
+    with col_z1:
+        st.dataframe(snapshot["lifecycle_latency"].round(2), use_container_width=True)
+    with col_z2:
+        throughput = snapshot["drone_throughput"]
+        if not throughput.empty:
+            fig = px.bar(
+                throughput,
+                x='drone_id',
+                y='zones_processed',
+                hover_data=['avg_process_sec', 'zones_per_busy_hour'],
+                title="Обработано зон по дронам",
+                labels={'drone_id': 'Дрон', 'zones_processed': 'Обработано зон'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+# ===================================================================
+#  РЕГИОН: детализация по ячейкам сетки (spatial_index), без полного прохода
+# ===================================================================
+@st.cache_resource(max_entries=RAW_CACHE_ENTRIES, show_spinner="Построение пространственного индекса...")
+def load_spatial_indexes(paths, signature):
+    with dashboard_metrics().timer("spatial_index", files=len(paths)):
+        return [spatial_index.load_or_build(p) for p in paths]
+
+def region_section(indexes):
+    st.subheader(" Регион: детализация по ячейкам сетки")
+    (x_min, x_max), (y_min, y_max) = spatial_index.GRID_RANGE
+    col_r1, col_r2 = st.columns(2)
+    with col_r1:
+        x_range = st.slider("Регион по X", x_min, x_max, (600, 1000), step=spatial_index.CELL_SIZE // 4)
+    with col_r2:
+        y_range = st.slider("Регион по Y", y_min, y_max, (200, 500), step=spatial_index.CELL_SIZE // 4)
+    started = time.perf_counter()
+    result = spatial_index.query_all(indexes, (x_range, y_range))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    dashboard_metrics().timing("region_query", elapsed_ms / 1000, rows=int(result["rows_read"]),
+                               cells_boundary=result["cells_boundary"])
+    events, priority = spatial_index.result_tables(result)
+
+    col_m1, col_m2 = st.columns(2)
+    with col_m1:
+        st.metric(label="Событий в регионе", value=f"{int(result['events']):,}")
+    with col_m2:
+        battery = result["battery_sum"] / result["battery_n"] if result["battery_n"] else float("nan")
+        st.metric(label="Ср. батарея в регионе", value=f"{battery:.1f}%")
+    st.caption(f"Ячеек {spatial_index.CELL_SIZE}x{spatial_index.CELL_SIZE}: {result['cells_interior']} внутри "
+               f"(из агрегатов) и {result['cells_boundary']} на границе; прочитано {result['rows_read']:,} из "
+               f"{result['total_rows']:,} строк за {elapsed_ms:.0f} мс.")
+    col_c1, col_c2 = st.columns(2)
+    with col_c1:
+        fig = px.bar(events, x='event_type', y='count', title="Типы событий в регионе",
+                     labels={'event_type': 'Тип события', 'count': 'Событий'})
+        st.plotly_chart(fig, use_container_width=True)
+    with col_c2:
+        fig = px.bar(priority, x='zone_priority_class', y='count', color='zone_priority_class',
+                     color_discrete_map={'High': '#d73027', 'Medium': '#fc8d59', 'Low': '#fee08b'},
+                     title="Приоритет зон в регионе",
+                     labels={'zone_priority_class': 'Приоритет зоны', 'count': 'Событий'})
+        st.plotly_chart(fig, use_container_width=True)
+    with st.expander(f" События региона (первые {len(result['preview']):,})"):
+        st.dataframe(result["preview"], use_container_width=True)
+
+# ===================================================================
+#  СЫРЫЕ ДАННЫЕ (весь файл или его шарды, без ограничения по строкам)
+# ===================================================================
+raw_file = "drone_events_million.csv"
+raw_inputs = aggregation.resolve_inputs(raw_file)
+# Ключ кеша — подписи всех шардов: изменился любой — агрегаты пересчитываются
+raw_sig = tuple(file_signature(p) for p in raw_inputs) if raw_inputs else None
+live_mode = st.sidebar.toggle("Живой поток", value=os.path.exists(LIVE_STORE),
+                              help="Агрегаты от live_stream.py вместо полного файла сырых событий")
+raw_df = load_raw_cached(raw_inputs[0], raw_sig[0], PREVIEW_ROWS) if raw_sig and not live_mode else None
+
+if live_mode:
+    live_section()
+elif raw_df is not None:
+    st.header(" Сырые события дронов")
+    render_raw(raw_aggregates(raw_file, raw_sig), raw_df)
+    csv_inputs = tuple(p for p in raw_inputs if p.endswith(".csv"))
+    if csv_inputs and spatial_index.pa is not None:
+        region_section(load_spatial_indexes(csv_inputs, raw_sig))
 else:
     st.warning(f"⚠️ Файл сырых данных `{raw_file}` не найден.")
 
@@ -187,7 +379,11 @@ else:
 # 📈 ИТОГОВЫЕ ДАННЫЕ
 # ===================================================================
 final_file = "drone_swarm_analytics.csv"
-final_df = safe_load_csv(final_file)
+# start.py экспортирует ещё и Feather — он читается без разбора текста
+final_feather = "drone_swarm_analytics.feather"
+final_path = final_feather if os.path.exists(final_feather) else final_file
+final_sig = file_signature(final_path)
+final_df = load_cached(final_path, final_sig) if final_sig else None
 
 if final_df is not None and not final_df.empty:
     st.header(" Обработанные данные дронов")
@@ -244,6 +440,60 @@ if final_df is not None and not final_df.empty:
             )
             st.plotly_chart(fig, use_container_width=True)
 
+# ===================================================================
+#  СКЕТЧИ: ответы по любому набору партий — слияние, без прохода по событиям
+# ===================================================================
+SKETCH_DIR = sketches.SKETCH_DIR
+
+@st.cache_resource(max_entries=AGG_CACHE_ENTRIES, show_spinner="Загрузка скетчей...")
+def load_sketch_parts(root, signature):
+    """{подпись партии: скетч} — партии start.py, а без них скетчи-спутники шардов сырых событий"""
+    with dashboard_metrics().timer("sketch_load", files=len(signature)):
+        batches = sketches.load_batches(root)
+        if batches:
+            return {f"batch={b}": s for b, s in batches.items()}
+        return {os.path.basename(p): sketches.load_or_build(p) for p in raw_inputs}
+
+def sketch_section():
+    files = sorted(glob.glob(os.path.join(SKETCH_DIR, "batch=*", "*.npz")))
+    if not files and not raw_inputs:
+        return
+    signature = tuple((p, file_signature(p)) for p in files or raw_inputs)
+    parts = load_sketch_parts(SKETCH_DIR, signature)
+    if not parts:
+        return
+    st.header(" Быстрые ответы по скетчам")
+    labels = list(parts)
+    chosen = labels
+    if len(labels) > 1:
+        first, last = st.select_slider("Партии", options=labels, value=(labels[0], labels[-1]))
+        chosen = labels[labels.index(first):labels.index(last) + 1]
+    started = time.perf_counter()
+    merged = sketches.merge_all(parts[label] for label in chosen)
+    summary = merged.summary()
+    drones = merged.drone_frame()
+    merge_ms = (time.perf_counter() - started) * 1000
+
+    col_s1, col_s2, col_s3 = st.columns(3)
+    with col_s1:
+        st.metric(label="Уникальных дронов / зон (≈)", value=f"{summary['unique_drones']:,} / {summary['unique_zones']:,}")
+    with col_s2:
+        st.metric(label="Батарея p50 / p95 / p99",
+                  value=" / ".join(f"{summary[f'battery_p{q}']:.1f}" for q in (50, 95, 99)))
+    with col_s3:
+        st.metric(label="Взятие → обработка p50 / p95 / p99, с",
+                  value=" / ".join(f"{summary[f'claim_to_process_p{q}']:.1f}" for q in (50, 95, 99)))
+    st.caption(f"{len(chosen)} из {len(labels)} партий, {summary['rows']:,} событий; "
+               f"слияние скетчей за {merge_ms:.1f} мс. Уникальные — HyperLogLog (~1.6%), квантили — t-digest.")
+    if not drones.empty:
+        st.dataframe(drones.set_index('drone_id').round(2), use_container_width=True)
+    if merged.sample.frame is not None:
+        with st.expander(f" Случайная выборка ({len(merged.sample.frame):,} строк)"):
+            st.dataframe(merged.sample.frame, use_container_width=True)
+
+if not live_mode:
+    sketch_section()
+
 # ===================================================================
 #  МАСШТАБИРУЕМОСТЬ
 # ===================================================================
@@ -251,8 +501,25 @@ st.header(" Масштабируемость: Время обработки vs 
 
 benchmark_file = "processing_benchmark.csv"
 if os.path.exists(benchmark_file):
-    bench_df = safe_load_csv(benchmark_file)
-    if bench_df is not None and not bench_df.empty:
+    bench_df = load_cached(benchmark_file, file_signature(benchmark_file))
+    if bench_df is not None and not bench_df.empty and 'Stage' in bench_df.columns:
+        # pipeline_benchmark.py: по линии на стадию, размеры от 10k до 10M — логарифмические оси
+        fig = px.line(
+            bench_df.sort_values('Records'),
+            x='Records',
+            y='TimeSec',
+            color='Stage',
+            markers=True,
+            log_x=True,
+            log_y=True,
+            hover_data=['RowsPerSec', 'PeakRssMB'],
+            title="Измеренная масштабируемость по стадиям",
+            labels={'Records': 'Количество записей', 'TimeSec': 'Время (сек)', 'Stage': 'Стадия'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        largest = bench_df[bench_df['Records'] == bench_df['Records'].max()]
+        st.dataframe(largest.set_index('Stage'), use_container_width=True)
+    elif bench_df is not None and not bench_df.empty:
         fig = px.line(
             bench_df,
             x='Records',
@@ -264,6 +531,7 @@ if os.path.exists(benchmark_file):
         fig.update_traces(line_color='#2ca02c')
         st.plotly_chart(fig, use_container_width=True)
 else:
+    st.caption("Замеров ещё нет — `python pipeline_benchmark.py` создаст processing_benchmark.csv. Ниже — иллюстрация.")
     sim_data = pd.DataFrame({
         "Records": [10_000, 50_000, 100_000, 200_000, 500_000, 1_000_000],
         "TimeSec": [2.1, 4.8, 9.3, 18.7, 46.2, 92.5]
@@ -279,8 +547,107 @@ else:
     fig.update_traces(line_color='#ff7f0e', line_dash='dot')
     st.plotly_chart(fig, use_container_width=True)
 
+# ===================================================================
+#  ТЕЛЕМЕТРИЯ: куда уходит время по прогонам всех компонентов (telemetry.jsonl)
+# ===================================================================
+TELEMETRY_FILE = telemetry.TELEMETRY_FILE
+# Метрика верхнего уровня компонента: её теги stage складываются в прогон без двойного счёта
+TELEMETRY_TOP_METRIC = {"start": "stage", "training": "spark_stage"}
+THROUGHPUT_METRICS = ["transcode", "hdfs_upload", "generate", "aggregate", "load"]
+TELEMETRY_RUNS = 30
+
+@st.cache_resource(show_spinner=False)
+def telemetry_tail(path):
+    # Общий для сессий: сам rerun дописывает в файл замер render, поэтому ключ по сигнатуре файла
+    # разбирал бы весь JSONL на каждый клик — Tail читает только новые строки
+    return telemetry.Tail(path)
+
+def telemetry_section():
+    st.header(" Телеметрия конвейера")
+    frame = telemetry_tail(TELEMETRY_FILE).read()
+    if frame.empty:
+        st.caption(f"Замеров ещё нет — их пишут start.py, headless_simulation.py, train_liquidity.py "
+                   f"и сам дашборд в `{TELEMETRY_FILE}`.")
+        return
+    timers = frame[frame["kind"] == "timer"].copy()
+    timers["label"] = timers["stage"].fillna(timers["metric"]) if "stage" in timers.columns else timers["metric"]
+    tab_runs, tab_rate, tab_hive, tab_dash = st.tabs(["По прогонам", "Пропускная способность", "Hive", "Дашборд"])
+
+    with tab_runs:
+        components = sorted(timers["component"].unique())
+        component = st.selectbox("Компонент", components,
+                                 index=components.index("start") if "start" in components else 0)
+        rows = timers[timers["component"] == component]
+        top = TELEMETRY_TOP_METRIC.get(component)
+        if top in set(rows["metric"]):
+            rows = rows[rows["metric"] == top]
+        per_run = rows.groupby(["run_id", "label"], as_index=False).agg(seconds=("value", "sum"),
+                                                                         started=("time", "min"))
+        recent = per_run.groupby("run_id")["started"].min().nlargest(TELEMETRY_RUNS).index
+        per_run = per_run[per_run["run_id"].isin(recent)].sort_values("started")
+        fig = px.bar(per_run, x='run_id', y='seconds', color='label',
+                     title=f"{component}: время по шагам в каждом прогоне (последние {TELEMETRY_RUNS})",
+                     labels={'run_id': 'Прогон', 'seconds': 'Время (сек)', 'label': 'Шаг'})
+        st.plotly_chart(fig, use_container_width=True)
+        share = per_run.groupby("label")["seconds"].mean().sort_values(ascending=False)
+        st.dataframe(pd.DataFrame({"Среднее за прогон, с": share.round(3),
+                                   "Доля": (share / share.sum()).round(3)}), use_container_width=True)
+
+    with tab_rate:
+        rates = timers[timers["metric"].isin(THROUGHPUT_METRICS)]
+        col_t1, col_t2 = st.columns(2)
+        with col_t1:
+            if "mb_per_sec" in rates.columns and rates["mb_per_sec"].notna().any():
+                fig = px.line(rates.dropna(subset=["mb_per_sec"]), x='time', y='mb_per_sec', color='metric',
+                              markers=True, title="МБ/с: перекодировка, загрузка в HDFS, чтение",
+                              labels={'time': 'Время', 'mb_per_sec': 'МБ/с', 'metric': 'Метрика'})
+                st.plotly_chart(fig, use_container_width=True)
+        with col_t2:
+            if "rows_per_sec" in rates.columns and rates["rows_per_sec"].notna().any():
+                fig = px.line(rates.dropna(subset=["rows_per_sec"]), x='time', y='rows_per_sec', color='metric',
+                              markers=True, log_y=True, title="Строк/с",
+                              labels={'time': 'Время', 'rows_per_sec': 'Строк/с', 'metric': 'Метрика'})
+                st.plotly_chart(fig, use_container_width=True)
+        gauges = frame[frame["kind"] == "gauge"]
+        if not gauges.empty:
+            last = gauges.sort_values("time").groupby(["component", "metric"]).tail(1)
+            st.dataframe(last[["component", "metric", "value", "unit", "time"]].set_index(["component", "metric"]),
+                         use_container_width=True)
+
+    with tab_hive:
+        hive = timers[timers["metric"] == "hive_statement"]
+        if hive.empty:
+            st.caption("Операторов Hive ещё не было — их замеряет start.py.")
+        else:
+            slowest = hive.groupby("statement").agg(runs=("run_id", "nunique"), avg_sec=("value", "mean"),
+                                                    max_sec=("value", "max")).nlargest(15, "avg_sec")
+            fig = px.bar(slowest.reset_index(), x='avg_sec', y='statement', orientation='h',
+                         title="Самые долгие операторы init_hive.sql (среднее по прогонам)",
+                         labels={'avg_sec': 'Время (сек)', 'statement': 'Оператор'})
+            fig.update_yaxes(autorange="reversed")
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(slowest.round(3), use_container_width=True)
+
+    with tab_dash:
+        own = timers[timers["component"] == "dashboard"]
+        if own.empty:
+            st.caption("Замеры дашборда появятся после первой перерисовки.")
+        else:
+            fig = px.scatter(own, x='time', y='value', color='metric', log_y=True,
+                             title="Загрузка, агрегация и отрисовка дашборда",
+                             labels={'time': 'Время', 'value': 'Время (сек)', 'metric': 'Шаг'})
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(own.groupby("metric")["value"].describe(percentiles=[0.5, 0.95])
+                         [["count", "50%", "95%", "max"]].round(3), use_container_width=True)
+
+telemetry_section()
+
+# Перерисовка целиком (без фрагмента живого потока); кеш-попадания дают быстрые замеры
+dashboard_metrics().timing("render", time.perf_counter() - render_started, live=live_mode)
+
 # ===================================================================
 #  Футер
 # ===================================================================
 st.markdown("---")
-st.caption("💡 Дашборд автоматически обновляется при изменении CSV-файлов. Обновите страницу, чтобы увидеть новые результаты.")
+st.caption("💡 Дашборд автоматически обновляется при изменении CSV-файлов. Обновите страницу, чтобы увидеть новые результаты. "
+           f"В режиме «Живой поток» сырые события обновляются сами каждые {LIVE_REFRESH_SEC} с.")
@@ -0,0 +1,125 @@
+"""Пирамида 2D-гистограмм плотности событий (x, y) по всему набору данных.
+
+Считается один раз вместе с остальными агрегатами (aggregation.RawAggregates):
+копится только самый мелкий уровень FINEST_BINS x FINEST_BINS отдельно для каждой
+пары (mode, event_type), грубые уровни получаются суммированием блоков 2x2.
+Результат точный и одинаковый на каждом прогоне, а в браузер уходит только
+окно выбранного уровня — не больше ~TARGET_BINS² ячеек при любом объёме данных.
+"""
+import numpy as np
+import pandas as pd
+
+# --- ПАРАМЕТРЫ ---
+GRID_RANGE = ((200, 1200), (200, 700))   # поле (POLYGON в headless_simulation) + база отказавших дронов (800, 650)
+LEVELS = (64, 128, 256, 512)             # бинов по каждой оси; каждый следующий уровень в 2 раза мельче
+FINEST_BINS = LEVELS[-1]
+TARGET_BINS = 128                        # сколько бинов по оси показываем в окне
+
+
+def bin_edges(bins):
+    (x0, x1), (y0, y1) = GRID_RANGE
+    return np.linspace(x0, x1, bins + 1), np.linspace(y0, y1, bins + 1)
+
+
+def cell_index(values, lo, hi, bins):
+    """Номер бина; правая граница входит в последний бин, как в np.histogram2d"""
+    idx = np.floor((values - lo) / (hi - lo) * bins).astype(np.int64)
+    idx[values == hi] = bins - 1
+    return idx
+
+
+def factorize(frame, column):
+    """Коды и значения колонки; нет колонки или NaN — значение None"""
+    if column not in frame:
+        return np.zeros(len(frame), dtype=np.int64), [None]
+    codes, uniques = pd.factorize(frame[column])
+    values = [v.item() if hasattr(v, "item") else v for v in uniques]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(values), codes)
+        values.append(None)
+    return codes.astype(np.int64), values
+
+
+class DensityPyramid:
+    """Сливаемые счётчики плотности: {(mode, event_type): counts[x, y]} на уровне FINEST_BINS"""
+
+    def __init__(self):
+        self.counts = {}
+        self.outside = 0   # точки вне GRID_RANGE
+
+    def update(self, chunk):
+        xy = chunk.dropna(subset=["x", "y"])
+        (x0, x1), (y0, y1) = GRID_RANGE
+        x = xy["x"].to_numpy(dtype=float)
+        y = xy["y"].to_numpy(dtype=float)
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        self.outside += int((~inside).sum())
+        xy, x, y = xy[inside], x[inside], y[inside]
+        cells = FINEST_BINS * FINEST_BINS
+        flat = cell_index(x, x0, x1, FINEST_BINS) * FINEST_BINS + cell_index(y, y0, y1, FINEST_BINS)
+        # Один bincount на все пары (mode, event_type) пакета
+        mode_codes, modes = factorize(xy, "mode")
+        event_codes, event_types = factorize(xy, "event_type")
+        key = mode_codes * len(event_types) + event_codes
+        counts = np.bincount(key * cells + flat, minlength=len(modes) * len(event_types) * cells)
+        counts = counts.reshape(len(modes), len(event_types), FINEST_BINS, FINEST_BINS)
+        for i, mode in enumerate(modes):
+            for j, event_type in enumerate(event_types):
+                if counts[i, j].any():
+                    self._add((mode, event_type), counts[i, j])
+        return self
+
+    def _add(self, key, counts):
+        if key in self.counts:
+            self.counts[key] += counts
+        else:
+            self.counts[key] = counts.astype(np.int64)
+
+    def merge(self, other):
+        for key, counts in other.counts.items():
+            self._add(key, counts)
+        self.outside += other.outside
+        return self
+
+    @property
+    def modes(self):
+        return sorted({m for m, _ in self.counts if m is not None})
+
+    @property
+    def event_types(self):
+        return sorted({e for _, e in self.counts if e is not None})
+
+    def level(self, bins, modes=None, event_types=None):
+        """counts[x, y] уровня bins по выбранным mode / event_type (None — все)"""
+        if bins not in LEVELS:
+            raise ValueError(f"bins must be one of {LEVELS}")
+        total = np.zeros((FINEST_BINS, FINEST_BINS), dtype=np.int64)
+        for (mode, event_type), counts in self.counts.items():
+            if modes is not None and mode not in modes:
+                continue
+            if event_types is not None and event_type not in event_types:
+                continue
+            total += counts
+        factor = FINEST_BINS // bins
+        return total.reshape(bins, factor, bins, factor).sum(axis=(1, 3))
+
+    def pick_level(self, bbox):
+        """Самый мелкий уровень, при котором в окне не больше TARGET_BINS бинов по каждой оси"""
+        (x0, x1), (y0, y1) = GRID_RANGE
+        (bx0, bx1), (by0, by1) = bbox
+        share = max((bx1 - bx0) / (x1 - x0), (by1 - by0) / (y1 - y0))
+        fitting = [bins for bins in LEVELS if bins * share <= TARGET_BINS]
+        return fitting[-1] if fitting else LEVELS[0]
+
+    def window(self, bbox=None, modes=None, event_types=None):
+        """(центры x, центры y, counts[y, x], bins) для окна ((x0, x1), (y0, y1))"""
+        bbox = bbox or GRID_RANGE
+        bins = self.pick_level(bbox)
+        counts = self.level(bins, modes, event_types)
+        xs, ys = bin_edges(bins)
+        # Берём бины, пересекающиеся с окном
+        col = (xs[1:] > bbox[0][0]) & (xs[:-1] < bbox[0][1])
+        row = (ys[1:] > bbox[1][0]) & (ys[:-1] < bbox[1][1])
+        centers_x = (xs[:-1] + xs[1:]) / 2
+        centers_y = (ys[:-1] + ys[1:]) / 2
+        return centers_x[col], centers_y[row], counts[np.ix_(col, row)].T, bins
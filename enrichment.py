@@ -0,0 +1,70 @@
+"""Правила обогащения событий — одна векторизованная реализация для дашборда и Spark.
+
+Те же правила в HiveQL живут в init_hive.sql (приоритет зоны, эффективность дрона);
+их совпадение проверяет `python bench_enrichment.py --check`.
+"""
+import numpy as np
+
+# --- ПАРАМЕТРЫ ---
+FIELD_CENTER = (800, 350)
+PRIORITY_BINS = (200, 400)     # < 200 High, 200..400 Medium, иначе Low
+BATTERY_STATUS_BINS = (30, 70)  # > 70 High, 30..70 Medium, иначе Critical
+EFFICIENCY_BINS = (50, 80)      # ср. батарея: >= 80 High, >= 50 Medium, иначе Low
+DRONE_EFFICIENCY_BINS = (2, 5)  # обработанные зоны: >= 5 Highly Effective, >= 2 Effective
+
+PRIORITY_CLASSES = ['High', 'Medium', 'Low']
+BATTERY_STATUSES = ['High', 'Medium', 'Critical']
+EFFICIENCY_CLASSES = ['High', 'Medium', 'Low']
+DRONE_EFFICIENCY_CLASSES = ['Highly Effective', 'Effective', 'Needs Optimization']
+
+
+def distance_to_center(x, y):
+    return np.hypot(np.asarray(x, dtype=float) - FIELD_CENTER[0], np.asarray(y, dtype=float) - FIELD_CENTER[1])
+
+
+def zone_priority_class(x, y):
+    """Приоритет зоны по расстоянию до центра поля (NaN → 'Low', как ELSE в Hive)"""
+    dist = distance_to_center(x, y)
+    low, high = PRIORITY_BINS
+    return np.select([dist < low, (dist >= low) & (dist <= high)], PRIORITY_CLASSES[:2], PRIORITY_CLASSES[2])
+
+
+def zone_priority_code(x, y):
+    """То же, что zone_priority_class, но индексом в PRIORITY_CLASSES (0 — High)"""
+    dist = distance_to_center(x, y)
+    low, high = PRIORITY_BINS
+    return np.select([dist < low, dist <= high], [0, 1], 2).astype(np.int8)
+
+
+def battery_status(battery):
+    """Состояние батареи при событии (NaN → 'Critical')"""
+    battery = np.asarray(battery, dtype=float)
+    low, high = BATTERY_STATUS_BINS
+    return np.select([battery > high, (battery >= low) & (battery <= high)],
+                     BATTERY_STATUSES[:2], BATTERY_STATUSES[2])
+
+
+def _bucket(values, bins, classes):
+    """np.digitize по возрастающим порогам; classes — от верхнего класса к нижнему, NaN → нижний"""
+    values = np.asarray(values, dtype=float)
+    idx = np.where(np.isnan(values), 0, np.digitize(values, bins))
+    return np.array(classes[::-1], dtype=object)[idx]
+
+
+def battery_efficiency(avg_battery):
+    """Оценка эффективности дрона по среднему заряду (порог включается в верхний класс)"""
+    return _bucket(avg_battery, EFFICIENCY_BINS, EFFICIENCY_CLASSES)
+
+
+def drone_efficiency(processed_zones):
+    """Эффективность дрона по числу обработанных зон (как drone_report в init_hive.sql)"""
+    return _bucket(processed_zones, DRONE_EFFICIENCY_BINS, DRONE_EFFICIENCY_CLASSES)
+
+
+def enrich(df):
+    """Копия кадра событий с dist_to_center, zone_priority_class и battery_status"""
+    return df.assign(
+        dist_to_center=distance_to_center(df['x'], df['y']),
+        zone_priority_class=zone_priority_class(df['x'], df['y']),
+        battery_status=battery_status(df['battery']),
+    )
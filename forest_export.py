@@ -0,0 +1,177 @@
+"""Выгрузка Random Forest из Spark в массивы NumPy и его вычисление без JVM.
+
+Все деревья PipelineModel (train_liquidity.py) склеиваются в общие массивы узлов;
+вместе с ними в .npz лежат словари StringIndexer (state, mode, приоритет зоны,
+метки event_type). Forest считает вероятности так же, как Spark:
+каждое дерево даёт нормированные счётчики классов листа, они суммируются и
+нормируются, предсказание — argmax (при равенстве — меньший индекс).
+
+    forest = Forest.load("drone_forest.npz")
+    forest.predict_events([{"drone_id": 3, "zone_id": 17, "x": 640.2, ...}])
+"""
+import json
+
+import numpy as np
+
+import enrichment
+
+# Признаки, которые считаются из сырого события, а не берутся из него
+DERIVED = {"dist_to_center", "state_index", "mode_index", "priority_index"}
+# Индексированная колонка → исходное поле события
+INDEXED = {"state_index": "state", "mode_index": "mode", "priority_index": "zone_priority_class"}
+
+
+# --- Выгрузка из Spark (нужен живой PipelineModel) ---
+
+def _tree_arrays(root, num_classes, offset):
+    """Обход дерева Spark (py4j) в ширину → списки узлов с глобальными индексами"""
+    nodes, queue = [], [root]
+    while queue:
+        node = queue.pop(0)
+        idx = offset + len(nodes)
+        if node.getClass().getSimpleName() == "InternalNode":
+            split = node.split()
+            entry = {"feature": split.featureIndex(), "threshold": 0.0, "cat_mask": 0, "is_cat": False}
+            if split.getClass().getSimpleName() == "CategoricalSplit":
+                cats = [int(c) for c in split.leftCategories()]
+                if max(cats, default=0) >= 64:
+                    raise ValueError("categorical splits with more than 64 categories are not supported")
+                entry.update(is_cat=True, cat_mask=sum(1 << c for c in cats))
+            else:
+                entry["threshold"] = split.threshold()
+            # Дети встанут в конец очереди: их индексы = offset + (уже узлов + в очереди)
+            entry["left"] = offset + len(nodes) + len(queue) + 1
+            entry["right"] = entry["left"] + 1
+            queue += [node.leftChild(), node.rightChild()]
+            entry["value"] = np.zeros(num_classes)
+        else:
+            stats = np.array(list(node.impurityStats().stats()), dtype=float)
+            total = stats.sum()
+            entry = {"feature": -1, "threshold": 0.0, "cat_mask": 0, "is_cat": False, "left": idx, "right": idx,
+                     "value": stats / total if total else np.zeros(num_classes)}
+        nodes.append(entry)
+    return nodes
+
+
+def export_pipeline(model, path, feature_columns):
+    """PipelineModel [StringIndexer, VectorAssembler, RandomForest] → .npz"""
+    indexer, rf = model.stages[0], model.stages[-1]
+    labels = dict(zip(indexer.getOutputCols(), indexer.labelsArray))
+    nodes, roots, depth = [], [], 0
+    for tree in rf.trees:
+        roots.append(len(nodes))
+        nodes += _tree_arrays(tree._java_obj.rootNode(), rf.numClasses, len(nodes))
+        depth = max(depth, tree.depth)
+    meta = {
+        "labels": labels["label"],
+        "feature_columns": list(feature_columns),
+        "index_labels": {col: labels[col] for col in INDEXED if col in labels},
+        "depth": depth,
+    }
+    np.savez_compressed(
+        path,
+        feature=np.array([n["feature"] for n in nodes], dtype=np.int32),
+        threshold=np.array([n["threshold"] for n in nodes], dtype=np.float64),
+        left=np.array([n["left"] for n in nodes], dtype=np.int32),
+        right=np.array([n["right"] for n in nodes], dtype=np.int32),
+        is_cat=np.array([n["is_cat"] for n in nodes], dtype=bool),
+        cat_mask=np.array([n["cat_mask"] for n in nodes], dtype=np.uint64),
+        value=np.array([n["value"] for n in nodes], dtype=np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        meta=np.array(json.dumps(meta)),
+    )
+    return path
+
+
+def verify_against_spark(model, forest, events_df, rows=10_000):
+    """Предсказания Spark и Forest на одних событиях; возвращает (строк, расхождений)"""
+    scored = model.transform(events_df.limit(rows)).toPandas()
+    spark_pred = scored["prediction"].to_numpy().astype(int)
+    ours = forest.predict_index(forest.features(scored.to_dict("records")))
+    return len(scored), int((spark_pred != ours).sum())
+
+
+# --- Вычисление без JVM ---
+
+class Forest:
+    """Лес в плоских массивах: векторно по пакету событий или по одному в чистом Python"""
+
+    def __init__(self, arrays):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.is_cat = arrays["is_cat"]
+        self.cat_mask = arrays["cat_mask"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        meta = json.loads(str(arrays["meta"]))
+        self.labels = meta["labels"]
+        self.feature_columns = meta["feature_columns"]
+        self.depth = meta["depth"]
+        # StringIndexer кастует числа в строки: mode=0 → "0"
+        self.index_maps = {col: {label: i for i, label in enumerate(values)}
+                           for col, values in meta["index_labels"].items()}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls({k: arrays[k] for k in arrays.files})
+
+    # --- признаки ---
+
+    def _index(self, col, value):
+        mapping = self.index_maps[col]
+        key = str(value)
+        if key not in mapping and isinstance(value, float) and value.is_integer():
+            key = str(int(value))
+        if key not in mapping:
+            raise ValueError(f"unseen {INDEXED[col]} value {value!r}")
+        return mapping[key]
+
+    def features(self, events):
+        """Список событий (dict) → матрица признаков в порядке обучения"""
+        n = len(events)
+        X = np.empty((n, len(self.feature_columns)))
+        x = np.array([float(e["x"]) for e in events])
+        y = np.array([float(e["y"]) for e in events])
+        priority = enrichment.zone_priority_class(x, y)
+        for j, col in enumerate(self.feature_columns):
+            if col == "dist_to_center":
+                X[:, j] = enrichment.distance_to_center(x, y)
+            elif col == "priority_index":
+                X[:, j] = [self._index(col, p) for p in priority]
+            elif col in INDEXED:
+                X[:, j] = [self._index(col, e[INDEXED[col]]) for e in events]
+            else:
+                X[:, j] = [float(e[col]) for e in events]
+        return X
+
+    # --- вычисление ---
+
+    def predict_proba(self, X):
+        """Вероятности классов для матрицы признаков (n, f): все деревья сразу, по уровню за шаг"""
+        X = np.asarray(X, dtype=np.float64)
+        node = np.tile(self.roots, (len(X), 1))
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            feat = self.feature[node]
+            internal = feat >= 0
+            if not internal.any():
+                break
+            xv = X[rows, np.where(internal, feat, 0)]
+            cat_left = (self.cat_mask[node] >> np.clip(xv, 0, 63).astype(np.uint64)) & np.uint64(1)
+            go_left = np.where(self.is_cat[node], cat_left == 1, xv <= self.threshold[node])
+            node = np.where(internal, np.where(go_left, self.left[node], self.right[node]), node)
+        votes = self.value[node].sum(axis=1)
+        total = votes.sum(axis=1, keepdims=True)
+        return np.divide(votes, total, out=np.zeros_like(votes), where=total > 0)
+
+    def predict_index(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+    def predict_events(self, events):
+        """[{событие}] → [(event_type, вероятность)]"""
+        proba = self.predict_proba(self.features(events))
+        best = proba.argmax(axis=1)
+        return [(self.labels[i], float(proba[r, i])) for r, i in enumerate(best)]
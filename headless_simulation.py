@@ -1,8 +1,23 @@
-import csv
-import random
+import argparse
+import heapq
 import os
-import math
-from shapely.geometry import Polygon, Point
+import random
+import sys
+import time
+from array import array
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+from shapely.geometry import Polygon
+
+import telemetry
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet-вывод необязателен
+    pa = pq = None
 
 # --- ПАРАМЕТРЫ ---
 TARGET_RECORDS = 1_000_000
@@ -11,91 +26,763 @@ POLYGON = Polygon([(200, 200), (1200, 200), (1200, 500), (200, 500)])
 BASE_POS = (800, 650)
 MODES = [0, 1]  # MODE_WEEDS, MODE_IRRIGATION
 EVENT_TYPES = ["zone_discovered", "zone_claimed", "zone_processed", "drone_disabled"]
+STATES = ["SCOUT", "CLAIMING", "WORKED", "PAINTED", "DISABLED"]
+COLUMNS = ["timestamp", "event_type", "drone_id", "zone_id", "x", "y", "battery", "state", "mode", "mission_time"]
 DRONE_COUNT = 10
-ZONE_COUNT_PER_SIM = 200  # ~200 зон на симуляцию → ~600 событий
+ZONE_COUNT_PER_SIM = 200  # ~200 зон на симуляцию → ~550 событий
+
+# --- ПАРАМЕТРЫ ПАКЕТНОГО ДВИЖКА ---
+SEED = 42
+SIMS_PER_TASK = 200  # ~110k строк на задачу пула
+SHARD_ROWS = 10_000_000  # строк в одном файле при шардировании
+CSV_ROW = "%r,%s,%d,%d,%r,%r,%r,%s,%d,%r\n"
+
+# --- ПАРАМЕТРЫ PARQUET ---
+HDFS_BLOCK_SIZE = 128 * 1024 * 1024
+PARQUET_BYTES_PER_ROW = 24  # ~размер строки после словаря/snappy (замер на 1M строк)
+PARQUET_ROW_GROUP_ROWS = HDFS_BLOCK_SIZE // PARQUET_BYTES_PER_ROW  # row group ≈ один HDFS-блок
+
+# --- ПАРАМЕТРЫ ДИСКРЕТНО-СОБЫТИЙНОГО РЕЖИМА (--mode events) ---
+DES_DRONES = 1000
+CLAIM_QUEUE = 3  # зон в очереди одного дрона
+DRONE_SPEED = 10.0  # ед. поля в секунду
+WORK_TIME = (1.0, 10.0)  # секунд на обработку зоны
+DRAIN_PER_UNIT = 0.02  # % заряда на единицу пути
+DRAIN_PER_SEC = 0.5  # % заряда на секунду обработки
+BATTERY_RESERVE = 15.0  # % на базе после возврата — иначе зону не берём
+CHARGE_RATE = 2.0  # % в секунду на базе
+SERVICE_SEC = 50.0  # средний цикл зоны (путь + работа + доля зарядки)
+UTILIZATION = 0.9  # поток обнаружений относительно пропускной способности флота
+PENDING_PER_DRONE = 2  # сверх этого обнаруженные зоны остаются невзятыми
+FAILURE_RATE = 2e-6  # отказов на дрон в секунду
+ZONE_BATCH = 4096  # зон за один векторный вызов генератора
+DES_CHUNK_ROWS = 100_000  # строк в пакете записи
+
+# Внутренние события планировщика и состояния дронов
+K_DISCOVER, K_FINISH, K_CHARGED, K_FAILURE = range(4)
+D_IDLE, D_BUSY, D_CHARGING, D_DISABLED = range(4)
+
+# Время генерации, строк/с и память → telemetry.TELEMETRY_FILE
+metrics = telemetry.Recorder("simulation")
+
+# Индексы в EVENT_TYPES / STATES
+EV_DISCOVERED, EV_CLAIMED, EV_PROCESSED, EV_DISABLED = range(4)
+ST_SCOUT, ST_CLAIMING, ST_WORKED, ST_PAINTED, ST_DISABLED = range(5)
+
 
+def points_in_polygon(xs, ys, poly):
+    """Векторизованная проверка точек (ray casting, границы не входят)"""
+    coords = np.asarray(poly.exterior.coords)
+    inside = np.zeros(len(xs), dtype=bool)
+    on_edge = np.zeros(len(xs), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+        crosses = (y1 > ys) != (y2 > ys)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = (x2 - x1) * (ys - y1) / (y2 - y1) + x1
+        inside ^= crosses & (xs < x_cross)
+        # Точки на ребре shapely.contains не считает внутренними
+        cross = (x2 - x1) * (ys - y1) - (y2 - y1) * (xs - x1)
+        on_edge |= (cross == 0) & (np.minimum(x1, x2) <= xs) & (xs <= np.maximum(x1, x2)) \
+            & (np.minimum(y1, y2) <= ys) & (ys <= np.maximum(y1, y2))
+    return inside & ~on_edge
 
-def generate_random_point_in_polygon(poly):
+
+def random_points_in_polygon(rng, poly, n):
+    """n равномерных точек внутри полигона (пакетный rejection sampling)"""
     minx, miny, maxx, maxy = poly.bounds
-    while True:
-        p = Point(random.uniform(minx, maxx), random.uniform(miny, maxy))
-        if poly.contains(p):
-            return (p.x, p.y)
-
-
-def main():
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-
-    with open(OUTPUT_FILE, "w", newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(
-            ["timestamp", "event_type", "drone_id", "zone_id", "x", "y", "battery", "state", "mode", "mission_time"])
-
-        records = 0
-        zone_id = 0
-        sim_id = 0
-
-        while records < TARGET_RECORDS:
-            mode = random.choice(MODES)
-            # Генерируем зоны
-            zones = []
-            for _ in range(ZONE_COUNT_PER_SIM):
-                x, y = generate_random_point_in_polygon(POLYGON)
-                zones.append((zone_id, x, y))
-                zone_id += 1
-
-            # События по зонам
-            for zid, x, y in zones:
-                if records >= TARGET_RECORDS:
-                    break
-
-                # zone_discovered (от сканера)
-                timestamp = round(random.uniform(0, 300), 3)
-                writer.writerow([
-                    timestamp, "zone_discovered", -1, zid, x, y,
-                    100.0, "SCOUT", mode, timestamp
-                ])
-                records += 1
-
-                # zone_claimed (случайный дрон)
-                if random.random() > 0.1 and records < TARGET_RECORDS:  # 90% зон берутся в работу
-                    drone_id = random.randint(0, DRONE_COUNT - 1)
-                    timestamp = round(timestamp + random.uniform(1, 60), 3)
-                    battery = round(random.uniform(40, 100), 1)
-                    writer.writerow([
-                        timestamp, "zone_claimed", drone_id, zid, x, y,
-                        battery, "CLAIMING", mode, timestamp
-                    ])
-                    records += 1
-
-                    # zone_processed
-                    if random.random() > 0.05 and records < TARGET_RECORDS:  # 95% обрабатываются
-                        timestamp = round(timestamp + random.uniform(1, 10), 3)
-                        battery = round(battery - random.uniform(5, 20), 1)
-                        state = "WORKED" if mode == 0 else "PAINTED"
-                        writer.writerow([
-                            timestamp, "zone_processed", drone_id, zid, x, y,
-                            battery, state, mode, timestamp
-                        ])
-                        records += 1
-
-            # Иногда добавляем отказы дронов
-            if random.random() < 0.3 and records < TARGET_RECORDS:
-                drone_id = random.randint(0, DRONE_COUNT - 1)
-                x, y = BASE_POS
-                timestamp = round(random.uniform(0, 300), 3)
-                battery = round(random.uniform(0, 30), 1)
-                writer.writerow([
-                    timestamp, "drone_disabled", drone_id, -1, x, y,
-                    battery, "DISABLED", mode, timestamp
-                ])
-                records += 1
-
-            sim_id += 1
-            if sim_id % 100 == 0:
-                print(f"Generated {records} / {TARGET_RECORDS} records ({sim_id} simulations)")
-
-    print(f" Done! {records} records saved to {OUTPUT_FILE}")
+    ratio = poly.area / ((maxx - minx) * (maxy - miny))
+    xs_out, ys_out, found = [], [], 0
+    while found < n:
+        batch = int((n - found) / ratio * 1.1) + 16
+        xs = rng.uniform(minx, maxx, batch)
+        ys = rng.uniform(miny, maxy, batch)
+        mask = points_in_polygon(xs, ys, poly)
+        xs_out.append(xs[mask])
+        ys_out.append(ys[mask])
+        found += int(mask.sum())
+    return np.concatenate(xs_out)[:n], np.concatenate(ys_out)[:n]
+
+
+def sim_rng(seed, sim_id):
+    """Детерминированный генератор для симуляции (не зависит от числа воркеров)"""
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(sim_id,))))
+
+
+def simulate(sim_id, seed=SEED):
+    """Одна симуляция целиком в виде массивов колонок (в порядке записи)"""
+    rng = sim_rng(seed, sim_id)
+    n = ZONE_COUNT_PER_SIM
+    mode = int(rng.choice(MODES))
+    zone_ids = sim_id * n + np.arange(n, dtype=np.int64)
+    xs, ys = random_points_in_polygon(rng, POLYGON, n)
+
+    # zone_discovered (от сканера)
+    t_disc = np.round(rng.uniform(0, 300, n), 3)
+    # zone_claimed: 90% зон берутся в работу
+    claimed = rng.random(n) > 0.1
+    drones = rng.integers(0, DRONE_COUNT, n)
+    t_claim = np.round(t_disc + rng.uniform(1, 60, n), 3)
+    bat_claim = np.round(rng.uniform(40, 100, n), 1)
+    # zone_processed: 95% взятых обрабатываются
+    processed = claimed & (rng.random(n) > 0.05)
+    t_proc = np.round(t_claim + rng.uniform(1, 10, n), 3)
+    bat_proc = np.round(bat_claim - rng.uniform(5, 20, n), 1)
+
+    # Слоты [discovered, claimed, processed] по каждой зоне, затем маска
+    mask = np.stack([np.ones(n, dtype=bool), claimed, processed], axis=1).ravel()
+    ts = np.stack([t_disc, t_claim, t_proc], axis=1).ravel()[mask]
+    cols = {
+        "timestamp": ts,
+        "event_type": np.tile(np.array([EV_DISCOVERED, EV_CLAIMED, EV_PROCESSED], dtype=np.int8), n)[mask],
+        "drone_id": np.stack([np.full(n, -1), drones, drones], axis=1).ravel()[mask],
+        "zone_id": np.repeat(zone_ids, 3)[mask],
+        "x": np.repeat(xs, 3)[mask],
+        "y": np.repeat(ys, 3)[mask],
+        "battery": np.stack([np.full(n, 100.0), bat_claim, bat_proc], axis=1).ravel()[mask],
+        "state": np.tile(np.array([ST_SCOUT, ST_CLAIMING, ST_WORKED if mode == 0 else ST_PAINTED],
+                                  dtype=np.int8), n)[mask],
+    }
+
+    # Иногда добавляем отказы дронов
+    if rng.random() < 0.3:
+        t_fail = round(float(rng.uniform(0, 300)), 3)
+        extra = {
+            "timestamp": t_fail, "event_type": EV_DISABLED, "drone_id": int(rng.integers(0, DRONE_COUNT)),
+            "zone_id": -1, "x": float(BASE_POS[0]), "y": float(BASE_POS[1]),
+            "battery": round(float(rng.uniform(0, 30)), 1), "state": ST_DISABLED,
+        }
+        cols = {k: np.append(v, np.array(extra[k], dtype=v.dtype)) for k, v in cols.items()}
+
+    cols["mode"] = np.full(len(cols["timestamp"]), mode, dtype=np.int8)
+    cols["mission_time"] = cols["timestamp"]
+    return cols
+
+
+def simulate_range(first_sim, count, seed=SEED):
+    """Несколько подряд идущих симуляций, склеенных в один пакет"""
+    parts = [simulate(s, seed) for s in range(first_sim, first_sim + count)]
+    return {k: np.concatenate([p[k] for p in parts]) for k in COLUMNS}
+
+
+def slice_columns(cols, start, stop):
+    return {k: v[start:stop] for k, v in cols.items()}
+
+
+def format_csv(cols):
+    """Пакет колонок → CSV-текст (без заголовка)"""
+    event_names = np.array(EVENT_TYPES, dtype=object)[cols["event_type"]].tolist()
+    state_names = np.array(STATES, dtype=object)[cols["state"]].tolist()
+    rows = zip(cols["timestamp"].tolist(), event_names, cols["drone_id"].tolist(), cols["zone_id"].tolist(),
+               cols["x"].tolist(), cols["y"].tolist(), cols["battery"].tolist(), state_names,
+               cols["mode"].tolist(), cols["mission_time"].tolist())
+    return "".join(map(CSV_ROW.__mod__, rows))
+
+
+def _render_task(args):
+    """Задача воркера: симуляции → (число строк, колонки, CSV-текст).
+    Для CSV колонки обратно не пересылаются — родителю нужен только текст"""
+    first_sim, count, seed, fmt = args
+    cols = simulate_range(first_sim, count, seed)
+    if fmt == "csv":
+        return len(cols["timestamp"]), None, format_csv(cols)
+    return len(cols["timestamp"]), cols, None
+
+
+def parquet_schema():
+    """Типизированная схема: словари для event_type/state, int8 для mode"""
+    return pa.schema([
+        ("timestamp", pa.float64()),
+        ("event_type", pa.dictionary(pa.int8(), pa.string())),
+        ("drone_id", pa.int32()),
+        ("zone_id", pa.int32()),
+        ("x", pa.float64()),
+        ("y", pa.float64()),
+        ("battery", pa.float64()),
+        ("state", pa.dictionary(pa.int8(), pa.string())),
+        ("mode", pa.int8()),
+        ("mission_time", pa.float64()),
+    ])
+
+
+def to_arrow(cols, schema):
+    """Пакет колонок → pyarrow.Table (коды категорий идут в словарь без копий строк)"""
+    arrays = [
+        pa.array(cols["timestamp"], pa.float64()),
+        pa.DictionaryArray.from_arrays(pa.array(cols["event_type"], pa.int8()), pa.array(EVENT_TYPES)),
+        pa.array(cols["drone_id"].astype(np.int32)),
+        pa.array(cols["zone_id"].astype(np.int32)),
+        pa.array(cols["x"]),
+        pa.array(cols["y"]),
+        pa.array(cols["battery"]),
+        pa.DictionaryArray.from_arrays(pa.array(cols["state"], pa.int8()), pa.array(STATES)),
+        pa.array(cols["mode"], pa.int8()),
+        pa.array(cols["mission_time"]),
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ShardedCsvWriter:
+    """Пишет строки в файлы-шарды по shard_rows строк (каждый со своим заголовком)"""
+
+    def __init__(self, output_file, shard_rows=None):
+        self.output_file = output_file
+        self.shard_rows = shard_rows
+        self.paths = []
+        self._f = None
+        self._rows_in_shard = 0
+
+    def _open_next(self):
+        if self._f:
+            self._f.close()
+        if self.shard_rows:
+            stem, ext = os.path.splitext(self.output_file)
+            path = f"{stem}-part-{len(self.paths):05d}{ext}"
+        else:
+            path = self.output_file
+        self._f = open(path, "w", newline='', encoding='utf-8')
+        self._f.write(",".join(COLUMNS) + "\n")
+        self._rows_in_shard = 0
+        self.paths.append(path)
+
+    def write(self, n_rows, cols, text):
+        if self._f is None:
+            self._open_next()
+        if not self.shard_rows or self._rows_in_shard + n_rows <= self.shard_rows:
+            self._f.write(text)
+            self._rows_in_shard += n_rows
+            return
+        # Пакет не помещается в шард целиком — режем по строкам
+        lines = text.splitlines(keepends=True)
+        pos = 0
+        while pos < n_rows:
+            if self._rows_in_shard >= self.shard_rows:
+                self._open_next()
+            take = min(self.shard_rows - self._rows_in_shard, n_rows - pos)
+            self._f.writelines(lines[pos:pos + take])
+            self._rows_in_shard += take
+            pos += take
+
+    def close(self):
+        if self._f:
+            self._f.close()
+
+
+class ShardedParquetWriter:
+    """Пишет пакеты в Parquet-шарды; row group копится до размера HDFS-блока"""
+
+    def __init__(self, output_file, shard_rows=None, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+        self.output_file = output_file
+        self.shard_rows = shard_rows
+        self.row_group_rows = min(row_group_rows, shard_rows or row_group_rows)
+        self.schema = parquet_schema()
+        self.paths = []
+        self._writer = None
+        self._rows_in_shard = 0
+        self._pending = []
+        self._pending_rows = 0
+
+    def _open_next(self):
+        self._close_shard()
+        if self.shard_rows:
+            stem, ext = os.path.splitext(self.output_file)
+            path = f"{stem}-part-{len(self.paths):05d}{ext}"
+        else:
+            path = self.output_file
+        # version 1.0 — совместимость с parquet-mr из Hive 2.3
+        self._writer = pq.ParquetWriter(path, self.schema, compression="snappy", version="1.0",
+                                        use_dictionary=["event_type", "state"], write_statistics=True)
+        self._rows_in_shard = 0
+        self.paths.append(path)
+
+    def _flush(self):
+        if self._pending:
+            table = pa.concat_tables(self._pending)
+            self._writer.write_table(table, row_group_size=self.row_group_rows)
+            self._pending, self._pending_rows = [], 0
+
+    def _close_shard(self):
+        if self._writer:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+    def write(self, n_rows, cols, text=None):
+        pos = 0
+        while pos < n_rows:
+            if self._writer is None or (self.shard_rows and self._rows_in_shard >= self.shard_rows):
+                self._open_next()
+            take = n_rows - pos
+            if self.shard_rows:
+                take = min(take, self.shard_rows - self._rows_in_shard)
+            take = min(take, self.row_group_rows - self._pending_rows)
+            self._pending.append(to_arrow(slice_columns(cols, pos, pos + take), self.schema))
+            self._pending_rows += take
+            self._rows_in_shard += take
+            pos += take
+            if self._pending_rows >= self.row_group_rows:
+                self._flush()
+
+    def close(self):
+        self._close_shard()
+
+
+def output_path(output_file, fmt):
+    """Расширение выходного файла под формат (.csv / .parquet)"""
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}.parquet" if fmt == "parquet" and ext != ".parquet" else output_file
+
+
+def truncate_text(text, n_rows):
+    """Первые n_rows строк CSV-текста"""
+    end = 0
+    for _ in range(n_rows):
+        end = text.index("\n", end) + 1
+    return text[:end]
+
+
+def generate(records=TARGET_RECORDS, output_file=OUTPUT_FILE, workers=None, seed=SEED,
+             shard_rows=None, sims_per_task=SIMS_PER_TASK, fmt="csv", writer=None):
+    """Пакетная генерация: симуляции раздаются пулу процессов, результат пишется
+    строго по порядку sim_id, поэтому вывод не зависит от числа воркеров."""
+    if fmt == "parquet" and pa is None:
+        raise SystemExit("Для --format parquet нужен pyarrow: pip install pyarrow")
+    output_file = output_path(output_file, fmt)
+    out_dir = os.path.dirname(output_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    if writer is None:
+        writer_cls = ShardedParquetWriter if fmt == "parquet" else ShardedCsvWriter
+        writer = writer_cls(output_file, shard_rows)
+
+    records_done = 0
+    sims_done = 0
+    next_sim = 0
+    started = time.time()
+
+    def tasks():
+        nonlocal next_sim
+        while True:
+            yield (next_sim, sims_per_task, seed, fmt)
+            next_sim += sims_per_task
+
+    task_iter = tasks()
+    with Pool(workers) as pool:
+        # Ограниченное окно задач в полёте → постоянная память
+        in_flight = deque(pool.apply_async(_render_task, (next(task_iter),)) for _ in range(workers * 2))
+        while records_done < records:
+            n_rows, cols, text = in_flight.popleft().get()
+            if records_done + n_rows > records:
+                n_rows = records - records_done
+                cols = slice_columns(cols, 0, n_rows) if cols is not None else None
+                text = truncate_text(text, n_rows) if text is not None else None
+            writer.write(n_rows, cols, text)
+            records_done += n_rows
+            if records_done < records:
+                in_flight.append(pool.apply_async(_render_task, (next(task_iter),)))
+            sims_done += sims_per_task
+            print(f"Generated {records_done} / {records} records ({sims_done} simulations)")
+        pool.terminate()
+    writer.close()
+
+    elapsed = time.time() - started
+    print(f" Done! {records_done} records saved to {', '.join(writer.paths)} "
+          f"in {elapsed:.1f}s ({records_done / max(elapsed, 1e-9):,.0f} rows/s)")
+    metrics.timing("generate", elapsed, rows=records_done, nbytes=sum(os.path.getsize(p) for p in writer.paths),
+                   mode="batch", format=fmt, workers=workers, shards=len(writer.paths))
+    metrics.peak_memory()
+    return writer.paths
+
+
+class Fleet:
+    """Состояние флота в плоских массивах (по элементу на дрон) вместо объекта на дрон.
+
+    plan_* — позиция и заряд после всех зон в очереди: по ним решается, брать ли новую.
+    mode — режим последней взятой зоны (с ним дрон и отказывает).
+    Очередь взятых зон — кольцевой буфер на CLAIM_QUEUE слотов у каждого дрона."""
+
+    __slots__ = ("n", "x", "y", "battery", "plan_x", "plan_y", "plan_battery", "status", "mode", "listed",
+                 "q_head", "q_len", "q_zone", "q_x", "q_y", "q_work", "q_mode")
+
+    def __init__(self, n, modes):
+        self.n = n
+        self.x = array("d", [float(BASE_POS[0])]) * n
+        self.y = array("d", [float(BASE_POS[1])]) * n
+        self.battery = array("d", [100.0]) * n
+        self.plan_x = array("d", self.x)
+        self.plan_y = array("d", self.y)
+        self.plan_battery = array("d", self.battery)
+        self.status = array("b", [D_IDLE]) * n
+        self.mode = array("b", modes)
+        self.listed = array("b", [1]) * n  # дрон стоит в очереди свободных
+        self.q_head = array("b", [0]) * n
+        self.q_len = array("b", [0]) * n
+        self.q_zone = array("q", [0]) * (n * CLAIM_QUEUE)
+        self.q_x = array("d", [0.0]) * (n * CLAIM_QUEUE)
+        self.q_y = array("d", [0.0]) * (n * CLAIM_QUEUE)
+        self.q_work = array("d", [0.0]) * (n * CLAIM_QUEUE)
+        self.q_mode = array("b", [0]) * (n * CLAIM_QUEUE)
+
+    def nbytes(self):
+        return sum(getattr(self, name).itemsize * len(getattr(self, name))
+                   for name in self.__slots__ if name != "n")
+
+
+class EventSimulator:
+    """Дискретно-событийная симуляция роя: единые часы, события планировщика в куче.
+
+    Сканер обнаруживает зоны пуассоновским потоком; зону берёт свободный дрон, если после
+    неё и возврата на базу у него останется BATTERY_RESERVE. Дрон обрабатывает свои зоны
+    по очереди, заряд переносится между зонами, разряженный дрон летит на базу заряжаться.
+    Строки выдаются в момент извлечения события из кучи, поэтому вывод упорядочен по времени."""
+
+    __slots__ = ("fleet", "rng", "py_rng", "heap", "seq", "now", "pending", "available", "rows",
+                 "next_zone", "zones", "discover_rate", "handled")
+
+    def __init__(self, drones=DES_DRONES, seed=SEED):
+        self.rng = np.random.Generator(np.random.PCG64(seed))
+        self.py_rng = random.Random(seed)
+        self.fleet = Fleet(drones, self.rng.choice(MODES, drones).tolist())
+        self.heap = []
+        self.seq = 0
+        self.now = 0.0
+        self.pending = deque()
+        self.available = deque(range(drones))
+        self.rows = []
+        self.next_zone = 0
+        self.zones = iter(())
+        self.discover_rate = drones * UTILIZATION / SERVICE_SEC
+        self.handled = 0
+        self.push(0.0, K_DISCOVER, -1)
+        self.push(self.py_rng.expovariate(drones * FAILURE_RATE), K_FAILURE, -1)
+
+    def push(self, t, kind, drone):
+        self.seq += 1
+        heapq.heappush(self.heap, (t, self.seq, kind, drone))
+
+    def emit(self, event, drone, zone, x, y, battery, state, mode):
+        self.rows.append((self.now, event, drone, zone, x, y, battery, state, mode))
+
+    def new_zone(self):
+        """Следующая обнаруженная зона: (id, x, y, время обработки, режим); генерируются пакетами"""
+        zone = next(self.zones, None)
+        if zone is None:
+            xs, ys = random_points_in_polygon(self.rng, POLYGON, ZONE_BATCH)
+            work = self.rng.uniform(*WORK_TIME, ZONE_BATCH)
+            modes = self.rng.choice(MODES, ZONE_BATCH)
+            ids = range(self.next_zone, self.next_zone + ZONE_BATCH)
+            self.zones = zip(ids, xs.tolist(), ys.tolist(), work.tolist(), modes.tolist())
+            zone = next(self.zones)
+        self.next_zone = zone[0] + 1
+        return zone
+
+    def try_claim(self, d, zone):
+        """Кладёт зону в очередь дрона, если хватит заряда с учётом уже взятых зон"""
+        f = self.fleet
+        zone_id, zx, zy, work, mode = zone
+        cost = ((zx - f.plan_x[d]) ** 2 + (zy - f.plan_y[d]) ** 2) ** 0.5 * DRAIN_PER_UNIT + work * DRAIN_PER_SEC
+        back = ((zx - BASE_POS[0]) ** 2 + (zy - BASE_POS[1]) ** 2) ** 0.5 * DRAIN_PER_UNIT
+        if f.plan_battery[d] - cost - back < BATTERY_RESERVE:
+            return False
+        slot = d * CLAIM_QUEUE + (f.q_head[d] + f.q_len[d]) % CLAIM_QUEUE
+        f.q_zone[slot], f.q_x[slot], f.q_y[slot], f.q_work[slot], f.q_mode[slot] = zone
+        f.mode[d] = mode
+        f.q_len[d] += 1
+        f.plan_x[d], f.plan_y[d] = zx, zy
+        f.plan_battery[d] -= cost
+        self.emit(EV_CLAIMED, d, zone_id, zx, zy, f.battery[d], ST_CLAIMING, mode)
+        if f.status[d] == D_IDLE:
+            self.start_next(d)
+        return True
+
+    def start_next(self, d):
+        """Полёт к первой зоне очереди и её обработка → событие K_FINISH"""
+        f = self.fleet
+        slot = d * CLAIM_QUEUE + f.q_head[d]
+        dist = ((f.q_x[slot] - f.x[d]) ** 2 + (f.q_y[slot] - f.y[d]) ** 2) ** 0.5
+        f.status[d] = D_BUSY
+        self.push(self.now + dist / DRONE_SPEED + f.q_work[slot], K_FINISH, d)
+
+    def go_charge(self, d):
+        f = self.fleet
+        dist = ((BASE_POS[0] - f.x[d]) ** 2 + (BASE_POS[1] - f.y[d]) ** 2) ** 0.5
+        left = f.battery[d] - dist * DRAIN_PER_UNIT
+        f.status[d] = D_CHARGING
+        self.push(self.now + dist / DRONE_SPEED + (100.0 - left) / CHARGE_RATE, K_CHARGED, d)
+
+    def refill(self, d):
+        """Свободный слот очереди: сначала ждущие зоны, затем — в очередь свободных дронов"""
+        f = self.fleet
+        pending = self.pending
+        while pending and f.q_len[d] < CLAIM_QUEUE:
+            if not self.try_claim(d, pending[0]):
+                break
+            pending.popleft()
+        if f.q_len[d] == 0 and f.status[d] == D_IDLE and pending:
+            # Первую ждущую зону не осилить — летим заряжаться
+            self.go_charge(d)
+        elif f.q_len[d] < CLAIM_QUEUE and not f.listed[d]:
+            f.listed[d] = 1
+            if f.q_len[d] == 0:
+                self.available.appendleft(d)  # простаивающие — первыми
+            else:
+                self.available.append(d)
+
+    def on_discover(self):
+        f = self.fleet
+        zone = self.new_zone()
+        zone_id, zx, zy, _, mode = zone
+        self.emit(EV_DISCOVERED, -1, zone_id, zx, zy, 100.0, ST_SCOUT, mode)
+        available = self.available
+        while available:
+            d = available.popleft()
+            f.listed[d] = 0
+            if f.status[d] in (D_CHARGING, D_DISABLED):
+                continue
+            if self.try_claim(d, zone):
+                if f.q_len[d] < CLAIM_QUEUE:
+                    f.listed[d] = 1
+                    available.append(d)
+                break
+            if f.q_len[d] == 0:
+                self.go_charge(d)
+        else:
+            if len(self.pending) < f.n * PENDING_PER_DRONE:
+                self.pending.append(zone)
+        self.push(self.now + self.py_rng.expovariate(self.discover_rate), K_DISCOVER, -1)
+
+    def on_finish(self, d):
+        f = self.fleet
+        slot = d * CLAIM_QUEUE + f.q_head[d]
+        zx, zy, work = f.q_x[slot], f.q_y[slot], f.q_work[slot]
+        dist = ((zx - f.x[d]) ** 2 + (zy - f.y[d]) ** 2) ** 0.5
+        f.battery[d] -= dist * DRAIN_PER_UNIT + work * DRAIN_PER_SEC
+        f.x[d], f.y[d] = zx, zy
+        f.q_head[d] = (f.q_head[d] + 1) % CLAIM_QUEUE
+        f.q_len[d] -= 1
+        mode = f.q_mode[slot]
+        self.emit(EV_PROCESSED, d, f.q_zone[slot], zx, zy, f.battery[d],
+                  ST_WORKED if mode == 0 else ST_PAINTED, mode)
+        if f.q_len[d]:
+            self.start_next(d)
+        else:
+            f.status[d] = D_IDLE
+            # Пустая очередь: план совпадает с фактом (снимаем накопленную погрешность)
+            f.plan_battery[d] = f.battery[d]
+        self.refill(d)
+
+    def on_charged(self, d):
+        f = self.fleet
+        f.x[d] = f.plan_x[d] = float(BASE_POS[0])
+        f.y[d] = f.plan_y[d] = float(BASE_POS[1])
+        f.battery[d] = f.plan_battery[d] = 100.0
+        f.status[d] = D_IDLE
+        self.refill(d)
+
+    def on_failure(self):
+        f = self.fleet
+        d = self.py_rng.randrange(f.n)
+        if f.status[d] != D_DISABLED:
+            # Взятые, но не обработанные зоны остаются брошенными
+            f.status[d] = D_DISABLED
+            f.q_len[d] = 0
+            self.emit(EV_DISABLED, d, -1, f.x[d], f.y[d], f.battery[d], ST_DISABLED, f.mode[d])
+        self.push(self.now + self.py_rng.expovariate(f.n * FAILURE_RATE), K_FAILURE, -1)
+
+    def run(self, min_rows):
+        """Обрабатывает события, пока не накопится min_rows строк; возвращает и очищает их"""
+        heap, status = self.heap, self.fleet.status
+        pop = heapq.heappop
+        while len(self.rows) < min_rows:
+            self.now, _, kind, d = pop(heap)
+            self.handled += 1
+            if kind == K_DISCOVER:
+                self.on_discover()
+            elif d >= 0 and status[d] == D_DISABLED:
+                continue  # событие отказавшего дрона
+            elif kind == K_FINISH:
+                self.on_finish(d)
+            elif kind == K_CHARGED:
+                self.on_charged(d)
+            else:
+                self.on_failure()
+        rows, self.rows = self.rows, []
+        return rows
+
+
+def rows_to_columns(rows):
+    """Строки симулятора → колонки в формате simulate()"""
+    ts, ev, drone, zone, x, y, bat, st, mode = zip(*rows)
+    ts = np.round(np.array(ts), 3)
+    return {
+        "timestamp": ts,
+        "event_type": np.array(ev, dtype=np.int8),
+        "drone_id": np.array(drone, dtype=np.int64),
+        "zone_id": np.array(zone, dtype=np.int64),
+        "x": np.array(x),
+        "y": np.array(y),
+        "battery": np.round(np.array(bat), 1),
+        "state": np.array(st, dtype=np.int8),
+        "mode": np.array(mode, dtype=np.int8),
+        "mission_time": ts,
+    }
+
+
+class CausalityCheck:
+    """Проверка потока: порядок по времени, очередь дрона FIFO не длиннее CLAIM_QUEUE,
+    зона берётся один раз и после обнаружения, после отказа у дрона событий нет"""
+
+    def __init__(self):
+        self.last_ts = -1.0
+        self.discovered = set()
+        self.claimed = set()
+        self.queues = {}
+        self.disabled = set()
+
+    def feed(self, rows):
+        for ts, ev, d, zone, *_ in rows:
+            if ts < self.last_ts:
+                raise AssertionError(f"time goes back: {ts} < {self.last_ts}")
+            self.last_ts = ts
+            if d in self.disabled:
+                raise AssertionError(f"drone {d} acts after drone_disabled at {ts}")
+            if ev == EV_DISCOVERED:
+                self.discovered.add(zone)
+            elif ev == EV_CLAIMED:
+                if zone not in self.discovered or zone in self.claimed:
+                    raise AssertionError(f"zone {zone} claimed twice or before discovery")
+                self.claimed.add(zone)
+                queue = self.queues.setdefault(d, deque())
+                queue.append(zone)
+                if len(queue) > CLAIM_QUEUE:
+                    raise AssertionError(f"drone {d} holds {len(queue)} claims")
+            elif ev == EV_PROCESSED:
+                queue = self.queues.get(d)
+                if not queue or queue.popleft() != zone:
+                    raise AssertionError(f"drone {d} processed zone {zone} out of claim order")
+                self.discovered.discard(zone)
+            else:
+                self.disabled.add(d)
+                self.queues.pop(d, None)
+
+
+def _format_task(cols):
+    return format_csv(cols)
+
+
+def generate_events(records=TARGET_RECORDS, output_file=OUTPUT_FILE, drones=DES_DRONES, seed=SEED,
+                    shard_rows=None, fmt="csv", writer=None, check=False, workers=None):
+    """Дискретно-событийный режим: планировщик в одном процессе (единые часы, строки по
+    возрастанию времени), CSV-текст пакетов форматируют воркеры пула."""
+    if fmt == "parquet" and pa is None:
+        raise SystemExit("Для --format parquet нужен pyarrow: pip install pyarrow")
+    output_file = output_path(output_file, fmt)
+    out_dir = os.path.dirname(output_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    if writer is None:
+        writer_cls = ShardedParquetWriter if fmt == "parquet" else ShardedCsvWriter
+        writer = writer_cls(output_file, shard_rows)
+
+    sim = EventSimulator(drones, seed)
+    checker = CausalityCheck() if check else None
+    workers = workers or os.cpu_count() or 1
+    base_rss = telemetry.peak_rss_mb()   # None без модуля resource (Windows) — RSS не сообщаем
+    records_done = simulated = 0
+    sim_sec = 0.0
+    started = time.time()
+    # На одном ядре пул только добавляет пересылку пакетов — форматируем на месте
+    pool = Pool(workers) if workers > 1 and fmt == "csv" else None
+    try:
+        # Окно пакетов в полёте: пишем строго по порядку, память постоянна
+        in_flight = deque()
+        while records_done < records:
+            while simulated < records and len(in_flight) < workers * 2:
+                chunk_started = time.perf_counter()
+                rows = sim.run(min(DES_CHUNK_ROWS, records - simulated))[:records - simulated]
+                sim_sec += time.perf_counter() - chunk_started
+                if checker:
+                    checker.feed(rows)
+                cols = rows_to_columns(rows)
+                text = pool.apply_async(_format_task, (cols,)) if pool else None
+                in_flight.append((cols, text))
+                simulated += len(rows)
+            cols, text = in_flight.popleft()
+            if text is not None:
+                text = text.get()
+            elif fmt == "csv":
+                text = format_csv(cols)
+            n_rows = len(cols["timestamp"])
+            writer.write(n_rows, cols, text)
+            records_done += n_rows
+            print(f"Generated {records_done} / {records} records (t = {sim.now:,.0f}s simulated)")
+    finally:
+        if pool:
+            pool.terminate()
+    writer.close()
+
+    elapsed = time.time() - started
+    fleet_bytes = sim.fleet.nbytes()
+    heap_bytes = sys.getsizeof(sim.heap) + sum(sys.getsizeof(e) + sys.getsizeof(e[0]) for e in sim.heap)
+    rss = telemetry.peak_rss_mb()
+    print(f" Done! {records_done} records from {drones} drones saved to {', '.join(writer.paths)} "
+          f"in {elapsed:.1f}s ({records_done / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f" Scheduler: {sim.handled:,} events in {sim_sec:.1f}s ({sim.handled / max(sim_sec, 1e-9):,.0f} events/s), "
+          f"heap {len(sim.heap):,}, pending zones {len(sim.pending):,}")
+    memory = (f" Memory: drone state {fleet_bytes / drones:.0f} B/drone ({fleet_bytes / 1e6:.1f} MB), "
+              f"event heap {heap_bytes / drones:.0f} B/drone")
+    if rss is not None:
+        growth = (rss - base_rss) * 2**20
+        memory += f", peak RSS growth {growth / 1e6:.0f} MB ({growth / drones:,.0f} B/drone incl. write buffers)"
+    print(memory)
+    if checker:
+        print(" Check passed: time-ordered, claims FIFO per drone, no events after drone_disabled")
+    # Планировщик отдельно от форматирования и записи — видно, что из них узкое место
+    metrics.timing("simulate", sim_sec, rows=records_done, mode="events", drones=drones)
+    metrics.timing("generate", elapsed, rows=records_done, nbytes=sum(os.path.getsize(p) for p in writer.paths),
+                   mode="events", format=fmt, workers=workers, drones=drones, shards=len(writer.paths))
+    metrics.gauge("scheduler_events_per_sec", round(sim.handled / max(sim_sec, 1e-9)), "events/s", drones=drones)
+    metrics.gauge("drone_state_bytes", round(fleet_bytes / drones, 1), "B/drone", drones=drones)
+    metrics.gauge("event_heap_bytes", round(heap_bytes / drones, 1), "B/drone", drones=drones)
+    metrics.peak_memory(drones=drones)
+    return writer.paths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор событий роя дронов")
+    parser.add_argument("--records", type=int, default=None, help="Сколько строк сгенерировать")
+    parser.add_argument("--scale", type=float, default=None,
+                        help="Масштаб в миллионах строк (--scale 100 → 100M строк)")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Выходной файл (для шардов — шаблон имени)")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию = ядра CPU)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Базовый сид (вывод воспроизводим)")
+    parser.add_argument("--shard-rows", type=int, default=None,
+                        help=f"Строк на файл-шард (по умолчанию шардируем только при > {SHARD_ROWS:,})")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="csv — текст для Hive TEXTFILE, parquet — типизированные колонки со словарями")
+    parser.add_argument("--sims-per-task", type=int, default=SIMS_PER_TASK, help="Симуляций на задачу пула")
+    parser.add_argument("--mode", choices=["batch", "events"], default="batch",
+                        help="batch — независимые симуляции в пуле процессов, "
+                             "events — дискретно-событийная модель флота с единым временем")
+    parser.add_argument("--drones", type=int, default=DES_DRONES, help="events: размер флота")
+    parser.add_argument("--check", action="store_true",
+                        help="events: проверить порядок по времени и причинность по дронам")
+    args = parser.parse_args(argv)
+    if args.records is None:
+        args.records = int(args.scale * 1_000_000) if args.scale else TARGET_RECORDS
+    if args.shard_rows is None and args.records > SHARD_ROWS:
+        args.shard_rows = SHARD_ROWS
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.mode == "events":
+        generate_events(records=args.records, output_file=args.output, drones=args.drones, seed=args.seed,
+                        shard_rows=args.shard_rows, fmt=args.format, check=args.check, workers=args.workers)
+        return
+    generate(records=args.records, output_file=args.output, workers=args.workers, seed=args.seed,
+             shard_rows=args.shard_rows, sims_per_task=args.sims_per_task, fmt=args.format)
 
 
 if __name__ == "__main__":
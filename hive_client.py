@@ -0,0 +1,390 @@
+"""Клиент HiveServer2 для пайплайна вместо запуска beeline на каждый запрос.
+
+HiveClient держит пул постоянных соединений (pyhive) на весь прогон,
+LocalSqlClient — локальная замена на SQLite, исполняющая тот же init_hive.sql
+без кластера. Оба умеют run_script() и query() с выборкой пакетами.
+"""
+import bz2
+import csv
+import glob
+import gzip
+import math
+import os
+import queue
+import re
+import sqlite3
+import weakref
+from contextlib import contextmanager, nullcontext
+
+import telemetry
+
+try:
+    from pyhive import hive
+except ImportError:  # нужен только для настоящего HiveServer2
+    hive = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+HIVE_HOST = "hive-server"
+HIVE_PORT = 10000
+HIVE_USER = "root"
+FETCH_BATCH_ROWS = 10_000
+POOL_SIZE = 2
+PRINT_ROWS = 20  # сколько строк SELECT из скрипта печатать в лог
+
+
+def timed_statement(metrics, statement, backend):
+    """Замер одного оператора скрипта в телеметрию (без Recorder — пустой контекст)"""
+    if metrics is None:
+        return nullcontext()
+    return metrics.timer("hive_statement", statement=telemetry.statement_tag(statement), backend=backend)
+
+
+def split_statements(script):
+    """Разбивает HiveQL-скрипт на операторы по ';' (вне строк и комментариев)"""
+    statements, buf = [], []
+    quote = None
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        if quote:
+            buf.append(ch)
+            if ch == "\\" and i + 1 < len(script):
+                buf.append(script[i + 1])
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in ("'", '"', "`"):
+            quote = ch
+            buf.append(ch)
+        elif script.startswith("--", i):
+            end = script.find("\n", i)
+            i = len(script) if end < 0 else end
+            continue
+        elif ch == ";":
+            statements.append("".join(buf).strip())
+            buf = []
+        else:
+            buf.append(ch)
+        i += 1
+    statements.append("".join(buf).strip())
+    return [s for s in statements if s]
+
+
+def substitute_vars(statement, hivevars):
+    """Подстановка ${hivevar:name} как в beeline --hivevar"""
+    def repl(match):
+        name = match.group(1)
+        if name not in hivevars:
+            raise KeyError(f"hivevar '{name}' is not set")
+        return str(hivevars[name])
+    return re.sub(r"\$\{hivevar:(\w+)\}", repl, statement)
+
+
+class HiveClient:
+    """Пул постоянных соединений к HiveServer2 на весь прогон пайплайна"""
+
+    def __init__(self, host=HIVE_HOST, port=HIVE_PORT, username=HIVE_USER, database="default",
+                 pool_size=POOL_SIZE, log=print, metrics=None):
+        if hive is None:
+            raise RuntimeError("pyhive is not installed: pip install 'pyhive[hive]'")
+        self.log = log
+        self.metrics = metrics
+        self._params = dict(host=host, port=port, username=username, database=database)
+        self._pool = queue.Queue()
+        self._all = []
+        for _ in range(pool_size):
+            conn = hive.Connection(**self._params)
+            self._all.append(conn)
+            self._pool.put(conn)
+
+    @contextmanager
+    def cursor(self):
+        conn = self._pool.get()
+        try:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+        finally:
+            self._pool.put(conn)
+
+    def execute(self, statement):
+        """Выполнить оператор; для SELECT вернуть (колонки, первые PRINT_ROWS строк)"""
+        with self.cursor() as cur:
+            cur.execute(statement)
+            if cur.description:
+                return [d[0] for d in cur.description], cur.fetchmany(PRINT_ROWS)
+        return None
+
+    def query(self, sql, batch_size=FETCH_BATCH_ROWS):
+        """(колонки, типы колонок, генератор пакетов строк) — результат не держится в памяти целиком.
+        Типы — имена из cursor.description HiveServer2 ("INT_TYPE", "DECIMAL_TYPE", ...)"""
+        ctx = self.cursor()
+        cur = ctx.__enter__()
+        try:
+            cur.arraysize = batch_size
+            cur.execute(sql)
+            columns = [d[0].split(".")[-1] for d in cur.description]
+            types = [d[1] for d in cur.description]
+        except BaseException:
+            ctx.__exit__(None, None, None)
+            raise
+
+        def batches():
+            try:
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                release()
+
+        gen = batches()
+        # Соединение вернётся в пул и если генератор бросят, не начав: при сборке мусора
+        release = weakref.finalize(gen, ctx.__exit__, None, None, None)
+        return columns, types, gen
+
+    def run_script(self, script, hivevars=None):
+        """Выполнить скрипт (как beeline -f) в одной сессии пула"""
+        # SET / USE действуют на сессию, поэтому весь скрипт идёт через одно соединение
+        with self.cursor() as cur:
+            for stmt in split_statements(script):
+                stmt = substitute_vars(stmt, hivevars or {})
+                with timed_statement(self.metrics, stmt, "hive"):
+                    cur.execute(stmt)
+                if cur.description:
+                    self._print_result([d[0] for d in cur.description], cur.fetchmany(PRINT_ROWS))
+
+    def _print_result(self, columns, rows):
+        self.log(" | ".join(columns))
+        for row in rows:
+            self.log(" | ".join(str(v) for v in row))
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+        self._all = []
+
+
+def find_top_level(sql, keyword, start=0):
+    """Позиция ключевого слова вне скобок и строк (или -1)"""
+    depth, quote = 0, None
+    pattern = re.compile(rf"\b{keyword}\b", re.IGNORECASE)
+    for i in range(start, len(sql)):
+        ch = sql[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and pattern.match(sql, i) and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+            return i
+    return -1
+
+
+def quote(name):
+    """Идентификатор SQLite в двойных кавычках (имена колонок результата бывают выражениями)"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def strip_balanced(sql, start):
+    """Индекс сразу после скобочной группы, начинающейся в sql[start] == '('"""
+    depth = 0
+    for i in range(start, len(sql)):
+        if sql[i] == "(":
+            depth += 1
+        elif sql[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise ValueError("unbalanced parentheses")
+
+
+class LocalSqlClient:
+    """Локальная замена Hive на SQLite: тот же init_hive.sql без кластера.
+
+    Таблицы создаются без Hive-специфики (хранилище, бакеты), партиционные
+    колонки становятся обычными. ALTER TABLE ... ADD PARTITION ... LOCATION
+    загружает CSV (в том числе .gz/.bz2) и Parquet из hdfs_root + LOCATION,
+    INSERT OVERWRITE заменяет только те партиции, что есть в результате
+    (как динамические партиции Hive).
+    """
+
+    IGNORED = re.compile(r"^\s*(SET|USE|ANALYZE|MSCK|CREATE\s+DATABASE)\b", re.IGNORECASE)
+
+    def __init__(self, path=":memory:", hdfs_root="local_hdfs", log=print, metrics=None):
+        self.log = log
+        self.metrics = metrics
+        self.hdfs_root = hdfs_root
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.create_function("SQRT", 1, lambda v: None if v is None else math.sqrt(v))
+        self.conn.create_function("POW", 2, lambda a, b: None if a is None else math.pow(a, b))
+        self.partitions = {}  # таблица → список партиционных колонок
+
+    # --- трансляция HiveQL → SQLite ---
+
+    def _translate_create(self, stmt):
+        m = re.match(r"CREATE\s+(?:EXTERNAL\s+)?TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([\w.]+)\s*", stmt, re.IGNORECASE)
+        if not m or not stmt[m.end():].startswith("("):
+            # CTAS: отрезаем STORED AS ... перед AS SELECT
+            return re.sub(r"\s+STORED\s+AS\s+\w+", "", re.sub(r"CREATE\s+EXTERNAL", "CREATE", stmt, flags=re.I),
+                          flags=re.I)
+        table = m.group(2)
+        cols_end = strip_balanced(stmt, m.end())
+        columns = stmt[m.end() + 1:cols_end - 1].strip()
+        rest = stmt[cols_end:]
+        part = re.search(r"PARTITIONED\s+BY\s*\(", rest, re.IGNORECASE)
+        part_cols = []
+        if part:
+            p_end = strip_balanced(rest, part.end() - 1)
+            part_spec = rest[part.end():p_end - 1]
+            columns += ",\n    " + part_spec.strip()
+            part_cols = [c.strip().split()[0].strip("`") for c in part_spec.split(",")]
+        self.partitions[table.split(".")[-1]] = part_cols
+        return f"CREATE TABLE {m.group(1) or ''}{table} ({columns})"
+
+    def _translate_alter(self, stmt):
+        m = re.match(r"ALTER\s+TABLE\s+([\w.]+)\s+(ADD|DROP)\s+IF\s+(?:NOT\s+)?EXISTS\s+PARTITION\s*\(([^)]*)\)"
+                     r"(?:\s+LOCATION\s+'([^']*)')?", stmt, re.IGNORECASE)
+        if not m:
+            raise ValueError(f"Unsupported ALTER TABLE in local mode: {stmt[:80]}")
+        table, action, spec, location = m.groups()
+        table = table.split(".")[-1]
+        values = dict((k.strip().strip("`"), v.strip().strip("'")) for k, v in
+                      (kv.split("=") for kv in spec.split(",")))
+        where = " AND ".join(f"{quote(k)} = ?" for k in values)
+        self.conn.execute(f"DELETE FROM {table} WHERE {where}", list(values.values()))
+        if action.upper() == "ADD":
+            self._load_location(table, values, location)
+        return None
+
+    def _load_location(self, table, part_values, location):
+        """Загрузить файлы партиции из локального зеркала HDFS"""
+        local_dir = os.path.join(self.hdfs_root, location.lstrip("/"))
+        if not os.path.isdir(local_dir):
+            # Hive прочитал бы пустую партицию, но здесь это почти всегда незагруженные данные
+            raise FileNotFoundError(f"partition location {location} not found in {self.hdfs_root}")
+        cols = [r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")]
+        data_cols = [c for c in cols if c not in part_values]
+        placeholders = ", ".join("?" for _ in cols)
+        insert = f"INSERT INTO {table} ({', '.join(quote(c) for c in cols)}) VALUES ({placeholders})"
+        extra = list(part_values.values())
+        for path in sorted(glob.glob(os.path.join(local_dir, "*"))):
+            if path.endswith(".parquet"):
+                if pq is None:
+                    raise RuntimeError("pyarrow is required to load parquet partitions locally")
+                for batch in pq.ParquetFile(path).iter_batches(columns=data_cols):
+                    rows = zip(*(batch.column(c).to_pylist() for c in data_cols))
+                    self.conn.executemany(insert, (list(r) + extra for r in rows))
+            else:
+                # Сжатые части start.py: кодек по расширению, как у TEXTFILE в Hive
+                opener = {".gz": gzip.open, ".bz2": bz2.open}.get(os.path.splitext(path)[1], open)
+                with opener(path, "rt", newline="", encoding="utf-8") as f:
+                    self.conn.executemany(insert, (row + extra for row in csv.reader(f) if row))
+
+    def _insert_overwrite(self, select_sql, table, with_clause=""):
+        """INSERT OVERWRITE с динамическими партициями: заменить только затронутые партиции"""
+        table = table.split(".")[-1]
+        part_cols = self.partitions.get(table, [])
+        self.conn.execute("DROP TABLE IF EXISTS _overwrite")
+        self.conn.execute(f"CREATE TEMP TABLE _overwrite AS {with_clause} {select_sql}")
+        if part_cols:
+            # позиционно: хвост результата — партиционные колонки
+            tmp_cols = [r[1] for r in self.conn.execute("PRAGMA temp.table_info(_overwrite)")]
+            tail = tmp_cols[-len(part_cols):]
+            match = " AND ".join(f"t.{quote(p)} = o.{quote(q)}" for p, q in zip(part_cols, tail))
+            self.conn.execute(f"DELETE FROM {table} WHERE rowid IN "
+                              f"(SELECT t.rowid FROM {table} t JOIN _overwrite o ON {match})")
+        else:
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.execute(f"INSERT INTO {table} SELECT * FROM _overwrite")
+        self.conn.execute("DROP TABLE _overwrite")
+
+    def _translate_insert(self, stmt):
+        # Форма Hive "WITH ... FROM (...) u INSERT OVERWRITE TABLE t ... SELECT ..."
+        ins = find_top_level(stmt, "INSERT")
+        if ins > 0:
+            with_clause, from_part = "", stmt[:ins].strip()
+            if re.match(r"WITH\b", from_part, re.IGNORECASE):
+                frm = find_top_level(from_part, "FROM")
+                with_clause, from_part = from_part[:frm], from_part[frm:]
+            insert_part = stmt[ins:]
+            m = re.match(r"INSERT\s+OVERWRITE\s+TABLE\s+([\w.]+)(?:\s+PARTITION\s*\([^)]*\))?\s*(SELECT\s.*)$",
+                         insert_part, re.IGNORECASE | re.DOTALL)
+            select_sql = f"{m.group(2)} {from_part}"
+            return self._insert_overwrite(select_sql, m.group(1), with_clause)
+        m = re.match(r"INSERT\s+OVERWRITE\s+TABLE\s+([\w.]+)(?:\s+PARTITION\s*\([^)]*\))?\s*(.*)$",
+                     stmt, re.IGNORECASE | re.DOTALL)
+        return self._insert_overwrite(m.group(2), m.group(1))
+
+    def translate(self, stmt):
+        """HiveQL → SQL для SQLite (None — оператор уже выполнен или не нужен)"""
+        if self.IGNORED.match(stmt):
+            return None
+        stmt = re.sub(r"\bdrone_db\.", "", stmt)
+        stmt = re.sub(r"\bIF\s*\(", "IIF(", stmt)
+        head = stmt.lstrip()[:40].upper()
+        if head.startswith("CREATE") and re.match(r"CREATE\s+(EXTERNAL\s+)?TABLE", head):
+            return self._translate_create(stmt)
+        if head.startswith("ALTER TABLE"):
+            return self._translate_alter(stmt)
+        if re.match(r"(WITH\b.*|FROM\b.*)?INSERT\s+OVERWRITE", stmt.lstrip(), re.IGNORECASE | re.DOTALL) \
+                and find_top_level(stmt, "INSERT") >= 0:
+            return self._translate_insert(stmt)
+        return stmt
+
+    # --- общий интерфейс с HiveClient ---
+
+    def execute(self, statement):
+        sql = self.translate(statement)
+        if sql is None:
+            return None
+        cur = self.conn.execute(sql)
+        if cur.description:
+            return [d[0] for d in cur.description], cur.fetchmany(PRINT_ROWS)
+        return None
+
+    def query(self, sql, batch_size=FETCH_BATCH_ROWS):
+        cur = self.conn.execute(self.translate(sql))
+        columns = [d[0] for d in cur.description]
+        types = [None] * len(columns)  # SQLite типов колонок не сообщает
+
+        def batches():
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        return columns, types, batches()
+
+    def run_script(self, script, hivevars=None):
+        for stmt in split_statements(script):
+            stmt = substitute_vars(stmt, hivevars or {})
+            with timed_statement(self.metrics, stmt, "local"):
+                result = self.execute(stmt)
+            if result:
+                columns, rows = result
+                self.log(" | ".join(columns))
+                for row in rows:
+                    self.log(" | ".join(str(v) for v in row))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def connect(backend="hive", **kwargs):
+    """Фабрика клиента: 'hive' — HiveServer2, 'local' — SQLite-заглушка"""
+    if backend == "local":
+        return LocalSqlClient(**kwargs)
+    return HiveClient(**kwargs)
@@ -0,0 +1,193 @@
+"""Сжатая загрузка против текста: байты, время загрузки и время запроса → ingest_benchmark.csv.
+
+Каждый кодек (none, gzip, bzip2) проходит путь start.py: перекодировка cp1251 → UTF-8
+в PartWriter (сжатые части по COMPRESS_PART_MB), загрузка, запрос-скан всей партии.
+Порог COMPRESS_MIN_MB здесь не действует — сравниваются сами кодеки.
+
+--backend local (по умолчанию) — без кластера: загрузка — копия в локальное зеркало
+HDFS, запрос — полный скан сплитов в пуле процессов, как map-задачи Hive. Несжатый
+текст режется на сплиты по COMPRESS_PART_MB байт, сжатый — по частям.
+--backend hive — hdfs dfs -put в BENCH_HDFS_PATH/<кодек> и тот же запрос в HiveServer2
+по внешней TEXTFILE-таблице над этим каталогом.
+
+Прочитано байт — сколько отдаёт datanode на полный скан: для TEXTFILE это весь файл.
+
+    python ingest_benchmark.py drone_events_million.csv
+    python ingest_benchmark.py drone_events_million.csv --backend hive --codecs none gzip
+"""
+import argparse
+import io
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import hive_client
+import start
+import telemetry
+
+# --- ПАРАМЕТРЫ ---
+CODECS = ["none", "gzip", "bzip2"]
+WORK_DIR = "bench_ingest"
+OUTPUT_FILE = "ingest_benchmark.csv"
+BENCH_HDFS_PATH = "/drone_bench"
+BENCH_TABLE = "drone_db.events_bench"
+WORKERS = os.cpu_count()
+QUERY = "SELECT event_type, COUNT(*) AS events, SUM(battery) AS battery FROM {table} GROUP BY event_type"
+
+
+def prepare(src, codec, work_dir):
+    """Перекодировка как в start.py; возвращает (части, секунды)"""
+    out_dir = os.path.join(work_dir, "staging", codec)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    begin, end = start.header_end(src), start.last_line_end(src, os.path.getsize(src))
+    started = time.perf_counter()
+    with start.PartWriter(os.path.join(out_dir, "events"), None if codec == "none" else codec) as out:
+        start.transcode_stream(src, out, begin, end)
+    return out.paths, time.perf_counter() - started
+
+
+def plan_splits(parts, split_bytes=start.COMPRESS_PART_BYTES):
+    """Сплиты (путь, начало, конец): несжатый файл — диапазонами байт, сжатая часть — целиком"""
+    splits = []
+    for path in parts:
+        if path.endswith(".csv"):
+            size = os.path.getsize(path)
+            splits.extend((path, s, min(s + split_bytes, size)) for s in range(0, size, split_bytes))
+        else:
+            splits.append((path, None, None))
+    return splits
+
+
+def scan_split(task):
+    """Map-задача запроса: (event_type → [событий, сумма батареи], прочитано байт)"""
+    path, begin, end, columns = task
+    if begin is None:
+        frame = pd.read_csv(path, header=None, names=columns, usecols=["event_type", "battery"])
+        read = os.path.getsize(path)
+    else:
+        with open(path, "rb") as f:
+            # Строку, начатую до begin, дочитывает предыдущий сплит
+            if begin:
+                f.seek(begin - 1)
+                f.readline()
+            pos = f.tell()
+            data = f.read(max(end - pos, 0))
+            if data and not data.endswith(b"\n"):
+                data += f.readline()
+        read = len(data)
+        if not data:
+            return {}, read
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=columns,
+                            usecols=["event_type", "battery"])
+    grouped = frame.groupby("event_type")["battery"].agg(["count", "sum"])
+    return {k: [int(c), float(s)] for k, (c, s) in grouped.iterrows()}, read
+
+
+def local_run(parts, codec, columns, work_dir, workers):
+    """Загрузка в зеркало HDFS и скан в пуле процессов: (сек загрузки, сек запроса, байт, результат)"""
+    dest = os.path.join(work_dir, "local_hdfs", codec)
+    shutil.rmtree(dest, ignore_errors=True)
+    os.makedirs(dest)
+    started = time.perf_counter()
+    uploaded = [shutil.copyfile(p, os.path.join(dest, os.path.basename(p))) for p in parts]
+    upload_sec = time.perf_counter() - started
+
+    tasks = [split + (columns,) for split in plan_splits(uploaded)]
+    totals, read = {}, 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        for result, n in pool.map(scan_split, tasks):
+            read += n
+            for key, (count, battery) in result.items():
+                acc = totals.setdefault(key, [0, 0.0])
+                acc[0] += count
+                acc[1] += battery
+    return upload_sec, time.perf_counter() - started, read, totals
+
+
+def hive_run(parts, codec, columns):
+    """hdfs dfs -put и запрос в HiveServer2 по внешней таблице над каталогом кодека"""
+    dest, table = f"{BENCH_HDFS_PATH}/{codec}", f"{BENCH_TABLE}_{codec}"
+    start.run_cmd(f"hdfs dfs -rm -r -f {dest}")
+    start.run_cmd(f"hdfs dfs -mkdir -p {dest}")
+    started = time.perf_counter()
+    for path in parts:
+        start.upload_file(path, f"{dest}/{os.path.basename(path)}")
+    upload_sec = time.perf_counter() - started
+
+    ddl = ", ".join(f"`{c}` {'DOUBLE' if c == 'battery' else 'STRING'}" for c in columns)
+    client = hive_client.connect("hive", host=start.HIVE_HOST, port=10000, username="root")
+    try:
+        client.execute(f"DROP TABLE IF EXISTS {table}")
+        client.execute(f"CREATE EXTERNAL TABLE {table} ({ddl}) ROW FORMAT DELIMITED FIELDS TERMINATED BY ',' "
+                       f"STORED AS TEXTFILE LOCATION '{dest}'")
+        started = time.perf_counter()
+        _, _, batches = client.query(QUERY.format(table=table))
+        totals = {row[0]: [int(row[1]), float(row[2])] for rows in batches for row in rows}
+        query_sec = time.perf_counter() - started
+        client.execute(f"DROP TABLE IF EXISTS {table}")
+    finally:
+        client.close()
+    # TEXTFILE читается целиком: байты скана = размер каталога
+    return upload_sec, query_sec, sum(os.path.getsize(p) for p in parts), totals
+
+
+def run(src, codecs, backend="local", work_dir=WORK_DIR, workers=WORKERS):
+    columns = start.csv_columns(src)
+    rows, reference = [], None
+    for codec in codecs:
+        parts, prepare_sec = prepare(src, codec, work_dir)
+        stored = sum(os.path.getsize(p) for p in parts)
+        if backend == "hive":
+            upload_sec, query_sec, read, totals = hive_run(parts, codec, columns)
+        else:
+            upload_sec, query_sec, read, totals = local_run(parts, codec, columns, work_dir, workers)
+        # Все кодеки обязаны дать тот же ответ, что и несжатый текст
+        counts = {k: v[0] for k, v in totals.items()}
+        if reference is None:
+            reference = counts
+        elif counts != reference:
+            raise RuntimeError(f"{codec}: query result differs from {codecs[0]}: {counts} vs {reference}")
+        rows.append({
+            "Codec": codec,
+            "Parts": len(parts),
+            "StoredMB": stored / 1e6,
+            "ReadMB": read / 1e6,
+            "PrepareSec": prepare_sec,
+            "UploadSec": upload_sec,
+            "QuerySec": query_sec,
+            "Events": sum(counts.values()),
+        })
+        print(f"{codec:>6}: {len(parts)} part(s), {stored / 1e6:8.1f} MB stored, prepare {prepare_sec:6.2f}s, "
+              f"upload {upload_sec:6.2f}s, query {query_sec:6.2f}s")
+    df = pd.DataFrame(rows)
+    base = df["ReadMB"].iloc[0]
+    df["ReadVsFirst"] = df["ReadMB"] / base
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="исходный CSV (cp1251, как для start.py)")
+    parser.add_argument("--codecs", nargs="+", choices=CODECS, default=CODECS)
+    parser.add_argument("--backend", choices=["local", "hive"], default="local")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="local: процессов на скан")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+    # Перекодировка и запросы идут через start.py и hive_client, а они пишут телеметрию:
+    # прогоны кодеков остаются в CSV бенчмарка (TELEMETRY=1 — писать и в общий файл)
+    telemetry.disable_by_default()
+
+    df = run(args.input, args.codecs, args.backend, args.work_dir, args.workers)
+    print(df.round(3).to_string(index=False))
+    df.to_csv(args.output, index=False)
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
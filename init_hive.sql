@@ -1,3 +1,9 @@
+-- События читаются из обеих таблиц: events (CSV / TEXTFILE) и events_parquet
+-- (Parquet из headless_simulation.py --format parquet).
+-- since_batch — последняя партиция batch, уже перенесённая в events_store
+-- (start.py берёт её из ingest_manifest.json; -1 — перенести всё):
+--   beeline ... --hivevar since_batch=-1
+
 -- ВКЛЮЧАЕМ ЛОКАЛЬНЫЙ РЕЖИМ (если данных немного)
 SET hive.exec.mode.local.auto=true;
 SET mapreduce.framework.name=local;
@@ -7,9 +13,12 @@ SET hive.cli.print.header=true;
 CREATE DATABASE IF NOT EXISTS drone_db;
 USE drone_db;
 
--- 2. Таблица событий от дронов
-DROP TABLE IF EXISTS events;
-CREATE EXTERNAL TABLE events (
+-- 2. Таблица событий от дронов.
+-- Таблицы не пересоздаются: каждая загрузка start.py — новая партиция batch=N
+-- (см. ingest_manifest.json), заголовки CSV срезаются при загрузке.
+-- Крупные файлы приходят частями .gz/.bz2 (INGEST_COMPRESSION в start.py): TEXTFILE
+-- распаковывает их по расширению, каждая часть читается отдельным сплитом
+CREATE EXTERNAL TABLE IF NOT EXISTS events (
     `timestamp` DOUBLE, 
     event_type STRING,
     drone_id INT,
@@ -21,66 +30,210 @@ CREATE EXTERNAL TABLE events (
     `mode` INT,          
     mission_time DOUBLE
 )
+PARTITIONED BY (batch INT)
 ROW FORMAT DELIMITED
 FIELDS TERMINATED BY ','
 STORED AS TEXTFILE
 LOCATION '/drone_data'
-TBLPROPERTIES ('skip.header.line.count'='1', 'serialization.encoding'='UTF-8');
-
--- 3. Проверка данных
-SELECT 'Total rows in events:', COUNT(*) FROM events LIMIT 1;
-
--- 4. УЛУЧШЕННАЯ АНАЛИТИКА: Обогащённые данные о зонах и дронах
-DROP TABLE IF EXISTS drone_analytics;
-CREATE TABLE drone_analytics AS
-SELECT 
-    e.*,
-    -- Расстояние до центра поля (пример: центр = (800, 350))
-    SQRT(POW(e.x - 800, 2) + POW(e.y - 350, 2)) as dist_to_center,
-
-    -- Количество обработанных зон на дрон
-    COUNT(CASE WHEN e.event_type = 'zone_processed' THEN 1 END) 
-        OVER (PARTITION BY e.drone_id) as processed_zones,
-
-    -- Классифицируем приоритет зоны по координатам
-    CASE 
-        WHEN SQRT(POW(e.x - 800, 2) + POW(e.y - 350, 2)) < 200 THEN 'High'
-        WHEN SQRT(POW(e.x - 800, 2) + POW(e.y - 350, 2)) BETWEEN 200 AND 400 THEN 'Medium'
-        ELSE 'Low'
-    END as zone_priority_class,
-
-    -- Состояние батареи при событии
-    CASE 
-        WHEN e.battery > 70 THEN 'High'
-        WHEN e.battery BETWEEN 30 AND 70 THEN 'Medium'
-        ELSE 'Critical'
-    END as battery_status
-
-FROM events e;
-
--- 5. Промежуточная проверка
-SELECT 'Rows in drone_analytics:', COUNT(*) FROM drone_analytics LIMIT 1;
+TBLPROPERTIES ('serialization.encoding'='UTF-8');
 
--- 6. ВЫВОД: Аналитическая сводка
-SELECT 
-    drone_id,
-    MAX(drone_efficiency) as drone_efficiency,
-    MAX(processed_zones) as processed_zones,
-    AVG(battery) as avg_battery_during_mission,
-    COUNT(DISTINCT zone_id) as unique_zones_handled
+-- 2b. Колоночная таблица событий (Parquet: словари для event_type/state, mode = TINYINT).
+-- Читаются только нужные колонки, статистики row group'ов используются для пропуска блоков
+CREATE EXTERNAL TABLE IF NOT EXISTS events_parquet (
+    `timestamp` DOUBLE,
+    event_type STRING,
+    drone_id INT,
+    zone_id INT,
+    x DOUBLE,
+    y DOUBLE,
+    battery DOUBLE,
+    `state` STRING,
+    `mode` TINYINT,
+    mission_time DOUBLE
+)
+PARTITIONED BY (batch INT)
+STORED AS PARQUET
+LOCATION '/drone_data_parquet';
+
+-- 2c. Управляемое хранилище событий: ORC со статистиками и индексами,
+-- партиции batch / mode / event_type, бакеты по drone_id (отсортированы внутри)
+CREATE TABLE IF NOT EXISTS events_store (
+    `timestamp` DOUBLE,
+    drone_id INT,
+    zone_id INT,
+    x DOUBLE,
+    y DOUBLE,
+    battery DOUBLE,
+    `state` STRING,
+    mission_time DOUBLE
+)
+PARTITIONED BY (batch INT, `mode` TINYINT, event_type STRING)
+CLUSTERED BY (drone_id) SORTED BY (drone_id, `timestamp`) INTO 8 BUCKETS
+STORED AS ORC
+TBLPROPERTIES (
+    'orc.compress'='ZLIB',
+    'orc.create.index'='true',
+    'orc.bloom.filter.columns'='drone_id,zone_id'
+);
+
+-- 2d. Сводка по дронам: одна строка на дрон на партицию batch
+CREATE TABLE IF NOT EXISTS drone_summary (
+    drone_id INT,
+    events BIGINT,
+    claimed_zones BIGINT,
+    processed_zones BIGINT,
+    battery_sum DOUBLE,
+    battery_count BIGINT,
+    high_priority_events BIGINT,
+    medium_priority_events BIGINT,
+    low_priority_events BIGINT,
+    -- zone_claimed / zone_processed в зонах приоритета High
+    high_battery_sum DOUBLE,
+    high_battery_count BIGINT,
+    -- зоны High, взятые дроном: считаются по zone_claimed, поэтому зона попадает
+    -- ровно в одну партию, даже если её zone_processed ушёл в следующий batch
+    high_unique_zones BIGINT
+)
+PARTITIONED BY (batch INT)
+STORED AS ORC;
+
+-- 2e. Новые/устаревшие партиции (ALTER TABLE ... ADD/DROP PARTITION подставляет start.py)
+-- @INGEST_PARTITIONS
+
+-- 3. Конвертация сырых событий в events_store: один проход, только новые партиции batch
+-- Номера batch у events и events_parquet общие: новые партиции берутся из обеих таблиц,
+-- поэтому смешанная загрузка CSV + Parquet не теряет ни одну из них
+SET hive.exec.dynamic.partition=true;
+SET hive.exec.dynamic.partition.mode=nonstrict;
+SET hive.exec.max.dynamic.partitions=10000;
+SET hive.optimize.sort.dynamic.partition=true;
+SET hive.stats.autogather=true;
+SET hive.stats.column.autogather=true;
+
+INSERT OVERWRITE TABLE events_store PARTITION (batch, `mode`, event_type)
+SELECT
+    `timestamp`, drone_id, zone_id, x, y, battery, `state`, mission_time,
+    batch, `mode`, event_type
 FROM (
-    SELECT 
-        da.*,
-        -- Эффективность дрона: сколько зон обработал
-        CASE 
-            WHEN processed_zones >= 5 THEN 'Highly Effective'
-            WHEN processed_zones >= 2 THEN 'Effective'
-            ELSE 'Needs Optimization'
-        END as drone_efficiency
-    FROM drone_analytics da
-    WHERE zone_priority_class = 'High'
-      AND event_type IN ('zone_claimed', 'zone_processed')
-) t
+    SELECT
+        `timestamp`, drone_id, zone_id, x, y, battery, `state`, mission_time,
+        batch, CAST(`mode` AS TINYINT) AS `mode`, event_type
+    FROM events
+    WHERE batch > ${hivevar:since_batch}
+    UNION ALL
+    SELECT
+        `timestamp`, drone_id, zone_id, x, y, battery, `state`, mission_time,
+        batch, `mode`, event_type
+    FROM events_parquet
+    WHERE batch > ${hivevar:since_batch}
+) e;
+
+-- Дальше читаем только events_store: отсечение партиций + ORC predicate pushdown
+SET hive.optimize.ppd=true;
+SET hive.optimize.index.filter=true;
+SET hive.compute.query.using.stats=true;
+
+-- Проверка данных
+SELECT 'Total rows in events:', COUNT(*) FROM events_store LIMIT 1;
+
+-- 4. СВОДКА ПО ДРОНАМ: пересчитываются только новые партиции, старые остаются как есть.
+-- Дистанция до центра поля (центр = (800, 350)) считается один раз на строку.
+-- Перекос: все zone_discovered идут с drone_id = -1 (~треть строк) и одним ключом
+-- забивают один редьюсер. Разведчиков считаем отдельной веткой без DISTINCT —
+-- она схлопывается map-side агрегацией, а ветка рабочих дронов делится по drone_id
+-- равномерно (замер: python bench_skew.py)
+SET hive.map.aggr=true;
+
+WITH enriched AS (
+    SELECT
+        p.*,
+        zone_priority_class = 'High' AND event_type IN ('zone_claimed', 'zone_processed') as high_work
+    FROM (
+        SELECT
+            c.*,
+            -- Классифицируем приоритет зоны по координатам
+            CASE
+                WHEN dist_to_center < 200 THEN 'High'
+                WHEN dist_to_center BETWEEN 200 AND 400 THEN 'Medium'
+                ELSE 'Low'
+            END as zone_priority_class
+        FROM (
+            SELECT e.*, SQRT(POW(e.x - 800, 2) + POW(e.y - 350, 2)) as dist_to_center
+            FROM events_store e
+            WHERE e.batch > ${hivevar:since_batch}
+        ) c
+    ) p
+)
+FROM (
+    -- Рабочие дроны
+    SELECT
+        drone_id,
+        COUNT(*) as events,
+        SUM(IF(event_type = 'zone_claimed', 1, 0)) as claimed_zones,
+        SUM(IF(event_type = 'zone_processed', 1, 0)) as processed_zones,
+        SUM(battery) as battery_sum,
+        COUNT(battery) as battery_count,
+        SUM(IF(zone_priority_class = 'High', 1, 0)) as high_priority_events,
+        SUM(IF(zone_priority_class = 'Medium', 1, 0)) as medium_priority_events,
+        SUM(IF(zone_priority_class = 'Low', 1, 0)) as low_priority_events,
+        SUM(IF(high_work, battery, NULL)) as high_battery_sum,
+        COUNT(IF(high_work, battery, NULL)) as high_battery_count,
+        COUNT(DISTINCT IF(high_work AND event_type = 'zone_claimed', zone_id, NULL)) as high_unique_zones,
+        batch
+    FROM enriched
+    WHERE drone_id <> -1
+    GROUP BY batch, drone_id
+
+    UNION ALL
+
+    -- Разведчики (drone_id = -1): только zone_discovered, high_work всегда false
+    SELECT
+        -1 as drone_id,
+        COUNT(*) as events,
+        CAST(0 AS BIGINT) as claimed_zones,
+        CAST(0 AS BIGINT) as processed_zones,
+        SUM(battery) as battery_sum,
+        COUNT(battery) as battery_count,
+        SUM(IF(zone_priority_class = 'High', 1, 0)) as high_priority_events,
+        SUM(IF(zone_priority_class = 'Medium', 1, 0)) as medium_priority_events,
+        SUM(IF(zone_priority_class = 'Low', 1, 0)) as low_priority_events,
+        CAST(NULL AS DOUBLE) as high_battery_sum,
+        CAST(0 AS BIGINT) as high_battery_count,
+        CAST(0 AS BIGINT) as high_unique_zones,
+        batch
+    FROM enriched
+    WHERE drone_id = -1
+    GROUP BY batch
+) u
+INSERT OVERWRITE TABLE drone_summary PARTITION (batch)
+SELECT *;
+
+-- 5. Отчёт по дронам: свёртка нескольких сотен строк drone_summary.
+-- unique_zones_handled суммируется по партициям: каждая зона учтена один раз — в партии своего zone_claimed
+DROP VIEW IF EXISTS drone_report;
+CREATE VIEW drone_report AS
+SELECT
+    drone_id,
+    -- Эффективность дрона: сколько зон обработал
+    CASE
+        WHEN SUM(processed_zones) >= 5 THEN 'Highly Effective'
+        WHEN SUM(processed_zones) >= 2 THEN 'Effective'
+        ELSE 'Needs Optimization'
+    END as drone_efficiency,
+    SUM(processed_zones) as processed_zones,
+    SUM(high_battery_sum) / SUM(high_battery_count) as avg_battery_during_mission,
+    SUM(high_unique_zones) as unique_zones_handled
+FROM drone_summary
 GROUP BY drone_id
+HAVING SUM(high_battery_count) > 0;
+
+-- Дальше только контрольные выборки: start.py начинает экспорт drone_report, не дожидаясь их
+-- @REPORT_READY
+
+SELECT 'Rows in drone_summary:', COUNT(*) FROM drone_summary LIMIT 1;
+
+-- 6. ВЫВОД: Аналитическая сводка
+SELECT *
+FROM drone_report
 ORDER BY processed_zones DESC, avg_battery_during_mission DESC
 LIMIT 10;
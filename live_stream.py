@@ -0,0 +1,278 @@
+"""Живой режим: хвост каталога приёма (и/или TCP-сокет) → инкрементальные агрегаты → снимок для дашборда.
+
+Потребитель на asyncio раз в POLL_SEC смотрит каталог приёма: новые *.csv и строки,
+дописанные в уже известные файлы (берутся только полные строки, позиция запоминается
+по каждому файлу). Пакет сразу сворачивается в aggregation.RawAggregates (дроны, типы
+событий, пирамида плотности) и zone_lifecycle.ZoneLifecycleTracker (зоны). Вместе с
+каталогом или вместо него события можно слать JSON lines в TCP-порт. Раз в PUBLISH_SEC
+снимок атомарно заменяет LIVE_STORE — dashboard.py перечитывает его сам, не трогая
+drone_events_million.csv. При перезапуске каталог проигрывается с начала.
+
+Задержка событие → график: если в событии есть emitted_at (unix-время отправки, его
+ставит feed), она считается от него, иначе — от момента чтения. Снимок несёт
+перцентили задержки до публикации, дашборд добавляет к ним время до отрисовки.
+
+    python live_stream.py consume --landing landing --port 8766
+    python live_stream.py feed --source drone_events_million.csv --landing landing --rate 2000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import zone_lifecycle
+
+# --- ПАРАМЕТРЫ ---
+LANDING_DIR = "landing"
+LIVE_STORE = "live_aggregates.pkl"
+HOST = "127.0.0.1"
+PORT = 8766
+POLL_SEC = 0.2                        # как часто смотрим каталог приёма
+PUBLISH_SEC = 1.0                     # как часто пишем снимок для дашборда
+MAX_READ_BYTES = 16 * 1024 * 1024     # за один заход по одному файлу
+RECENT_ROWS = 20                      # последние события для предпросмотра
+LIFECYCLE_COLUMNS = ["timestamp", "event_type", "drone_id", "zone_id"]
+NUMERIC_COLUMNS = ["timestamp", "drone_id", "zone_id", "x", "y", "battery", "mode", "mission_time", "emitted_at"]
+REQUIRED_COLUMNS = ["timestamp", "drone_id", "zone_id"]   # без них событие не к чему отнести
+FEED_RATE = 2000                      # событий/с у feed
+FEED_TICK_SEC = 0.1
+FEED_ROTATE_SEC = 10                  # feed начинает новый файл раз в столько секунд
+
+
+class LiveAggregates:
+    """Всё, что дашборд показывает в живом режиме; обновляется пакетами по мере прихода"""
+
+    def __init__(self):
+        self.aggregates = aggregation.RawAggregates()
+        self.lifecycle = zone_lifecycle.ZoneLifecycleTracker()
+        self.recent = None
+        self.latency = zone_lifecycle.LatencyHistogram()   # публикация − отправка события
+        self.pending = []   # времена отправки событий, ещё не попавших в снимок
+
+    def update(self, chunk, arrived_at):
+        if chunk.empty:
+            return
+        self.aggregates.update(chunk[[c for c in aggregation.USECOLS if c in chunk]])
+        if set(LIFECYCLE_COLUMNS).issubset(chunk.columns):
+            self.lifecycle.update_frame(chunk)
+        events = chunk.drop(columns="emitted_at", errors="ignore")
+        self.recent = events.tail(RECENT_ROWS) if self.recent is None else \
+            pd.concat([self.recent, events.tail(RECENT_ROWS)], ignore_index=True).tail(RECENT_ROWS)
+        if "emitted_at" in chunk:
+            sent = pd.to_numeric(chunk["emitted_at"], errors="coerce").fillna(arrived_at).to_numpy(float)
+        else:
+            sent = np.full(len(chunk), arrived_at)
+        self.pending.append(sent)
+
+    @property
+    def dirty(self):
+        return bool(self.pending)
+
+    def snapshot(self):
+        now = time.time()
+        sent = np.concatenate(self.pending) if self.pending else np.empty(0)
+        self.pending = []
+        self.latency.add_many(now - sent)
+        return {
+            "published_at": now,
+            "aggregates": self.aggregates,
+            "lifecycle_latency": self.lifecycle.latency_table(),
+            "drone_throughput": self.lifecycle.drone_table(),
+            "open_zones": len(self.lifecycle.open),
+            "recent": self.recent,
+            "new_events": len(sent),
+            # Самое старое событие снимка: его путь до графика — худший среди новых
+            "oldest_new_sent": float(sent.min()) if len(sent) else None,
+            "publish_latency": self.latency.summary(),
+        }
+
+
+def coerce_events(chunk):
+    """Числовые колонки — к числам (мусор → NaN); строки без времени, дрона или зоны отбрасываются"""
+    for col in NUMERIC_COLUMNS:
+        if col in chunk and not pd.api.types.is_numeric_dtype(chunk[col]):
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+    valid = chunk.dropna(subset=[c for c in REQUIRED_COLUMNS if c in chunk])
+    if len(valid) < len(chunk):
+        print(f"Dropped {len(chunk) - len(valid):,} malformed event(s)")
+    return valid
+
+
+def dump_snapshot(snapshot):
+    # В потоке событий: агрегаты в снимке — живые объекты, пока идёт pickle, их нельзя менять
+    return pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_store(data, path=LIVE_STORE):
+    """Атомарная замена: дашборд видит либо старый, либо новый снимок целиком"""
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class DirectoryTail:
+    """Новые полные строки *.csv каталога; по каждому файлу — позиция и заголовок"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}   # путь → [позиция, колонки]
+
+    def poll(self):
+        chunks = []
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+            if not entry.name.endswith(".csv") or not entry.is_file():
+                continue
+            state = self.files.setdefault(entry.path, [0, None])
+            size = entry.stat().st_size
+            if size < state[0]:
+                state[:] = [0, None]   # файл переписан заново
+            if size == state[0]:
+                continue
+            with open(entry.path, "rb") as f:
+                f.seek(state[0])
+                data = f.read(MAX_READ_BYTES)
+            # Недописанная строка подождёт следующего захода
+            complete = data.rfind(b"\n") + 1
+            if not complete:
+                continue
+            data = data[:complete]
+            state[0] += complete
+            if state[1] is None:
+                header, _, data = data.partition(b"\n")
+                state[1] = header.decode("utf-8-sig").strip().split(",")
+            if data.strip():
+                # Строки не по заголовку пропускаются с предупреждением, остальные идут дальше
+                chunks.append(pd.read_csv(io.BytesIO(data), header=None, names=state[1], on_bad_lines="warn"))
+        return chunks
+
+
+async def socket_client(rows, reader, writer):
+    """JSON lines от клиента копятся в rows — их заберёт ближайший такт потребителя"""
+    try:
+        while line := await reader.readline():
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    writer.write((json.dumps({"error": f"bad json: {e}"}) + "\n").encode())
+    finally:
+        writer.close()
+
+
+async def consume(landing=LANDING_DIR, store=LIVE_STORE, port=None, poll_sec=POLL_SEC,
+                  publish_sec=PUBLISH_SEC, duration=None):
+    os.makedirs(landing, exist_ok=True)
+    live, tail, socket_rows = LiveAggregates(), DirectoryTail(landing), []
+    server = None
+    if port:
+        server = await asyncio.start_server(lambda r, w: socket_client(socket_rows, r, w), HOST, port)
+        print(f"Listening for JSON lines on {HOST}:{port}")
+    print(f"Tailing {landing}/*.csv -> {store}")
+
+    def ingest(chunk, source):
+        # Один битый пакет не должен останавливать приём: пишем в лог и идём дальше
+        try:
+            live.update(coerce_events(chunk), time.time())
+        except Exception as e:
+            print(f"Skipped a batch of {len(chunk):,} event(s) from {source}: {type(e).__name__}: {e}")
+
+    async def ingest_loop():
+        while True:
+            # Чтение файлов — в потоке, чтобы не держать сокет; агрегаты меняются только здесь
+            for chunk in await asyncio.to_thread(tail.poll):
+                ingest(chunk, landing)
+            if socket_rows:
+                batch = pd.DataFrame(socket_rows)
+                socket_rows.clear()
+                ingest(batch, "socket")
+            await asyncio.sleep(poll_sec)
+
+    async def publish_loop():
+        published = False
+        while True:
+            await asyncio.sleep(publish_sec)
+            if live.dirty or not published:
+                snapshot = live.snapshot()
+                await asyncio.to_thread(write_store, dump_snapshot(snapshot), store)
+                published = True
+                if not snapshot["new_events"]:
+                    continue
+                lag = snapshot["publish_latency"]
+                print(f"{live.aggregates.total_events:>12,} events  +{snapshot['new_events']:,}  "
+                      f"event->store p50 {lag['p50']:.3f}s p99 {lag['p99']:.3f}s")
+
+    tasks = [asyncio.create_task(ingest_loop()), asyncio.create_task(publish_loop())]
+    try:
+        # Упавший цикл не должен молча оставить второй работать: ошибка выходит наружу
+        done, _ = await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if server:
+            server.close()
+        if live.dirty:
+            write_store(dump_snapshot(live.snapshot()), store)
+
+
+def feed(source, landing=LANDING_DIR, rate=FEED_RATE, rotate_sec=FEED_ROTATE_SEC, limit=None):
+    """Проигрывает CSV в каталог приёма с заданным темпом, дописывая строки в текущий файл"""
+    os.makedirs(landing, exist_ok=True)
+    per_tick = max(1, int(rate * FEED_TICK_SEC))
+    out, opened_at, sent = None, 0.0, 0
+    started = time.perf_counter()
+    try:
+        for chunk in pd.read_csv(source, chunksize=per_tick, nrows=limit):
+            now = time.time()
+            if out is None or now - opened_at >= rotate_sec:
+                if out:
+                    out.close()
+                out = open(os.path.join(landing, f"events-{time.time_ns()}.csv"), "w", newline="", encoding="utf-8")
+                out.write(",".join(list(chunk.columns) + ["emitted_at"]) + "\n")
+                opened_at = now
+            chunk["emitted_at"] = now
+            chunk.to_csv(out, header=False, index=False)
+            out.flush()
+            sent += len(chunk)
+            # Темп по графику от старта, а не sleep(tick): не накапливает отставание
+            delay = started + sent / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        if out:
+            out.close()
+    print(f"Fed {sent:,} events into {landing} ({sent / (time.perf_counter() - started):,.0f} ev/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["consume", "feed"])
+    parser.add_argument("--landing", default=LANDING_DIR)
+    parser.add_argument("--store", default=LIVE_STORE)
+    parser.add_argument("--port", type=int, help="consume: ещё и JSON lines по TCP")
+    parser.add_argument("--publish-sec", type=float, default=PUBLISH_SEC)
+    parser.add_argument("--duration", type=float, help="consume: остановиться через столько секунд")
+    parser.add_argument("--source", default="drone_events_million.csv", help="feed: CSV для проигрывания")
+    parser.add_argument("--rate", type=float, default=FEED_RATE, help="feed: событий в секунду")
+    parser.add_argument("--limit", type=int, help="feed: не больше стольких событий")
+    args = parser.parse_args()
+
+    if args.command == "consume":
+        try:
+            asyncio.run(consume(args.landing, args.store, args.port, POLL_SEC, args.publish_sec, args.duration))
+        except KeyboardInterrupt:
+            pass
+    else:
+        feed(args.source, args.landing, args.rate, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Замер всех стадий конвейера на наборах 10k…10M строк → processing_benchmark.csv.
+
+Кластер не нужен: HDFS заменяет локальный каталог (<work-dir>/local_hdfs, туда
+пишет та же перекодировка, что и start.py), Hive — hive_client.LocalSqlClient на
+том же init_hive.sql. Каждая стадия идёт в отдельном процессе, поэтому пиковый
+RSS считается для неё одной (max по процессу и его пулу).
+
+Результат — длинная таблица Records, Stage, TimeSec, RowsPerSec, PeakRssMB
+(плюс Stage = total на каждый размер), её рисует раздел масштабируемости дашборда.
+Прошлые замеры тех же (Records, Stage) заменяются; с --max-regression прогон
+падает, если стадия стала медленнее прошлого замера больше чем на заданную долю.
+
+    python pipeline_benchmark.py --sizes 10000 100000
+    python pipeline_benchmark.py --stages generate aggregation --max-regression 0.25
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+
+import telemetry
+
+# --- ПАРАМЕТРЫ ---
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+STAGES = ["generate", "ingest", "hive", "enrichment", "aggregation", "dashboard_load", "train"]
+OUTPUT_FILE = "processing_benchmark.csv"
+WORK_DIR = "bench_data"
+CSV_NAME = "drone_events.csv"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class StageSkipped(Exception):
+    """Стадию нельзя выполнить в этом окружении (нет pyspark и т.п.)"""
+
+
+def csv_path(ctx):
+    return os.path.join(ctx["work_dir"], CSV_NAME)
+
+
+# --- Стадии: возвращают время основной работы (подготовка в замер не входит) ---
+
+def stage_generate(ctx):
+    import headless_simulation
+    started = time.perf_counter()
+    headless_simulation.generate(ctx["records"], output_file=csv_path(ctx), workers=ctx["workers"])
+    return time.perf_counter() - started
+
+
+def stage_ingest(ctx):
+    """Перекодировка (и сжатие по порогу) start.py в локальное зеркало HDFS (партиция batch=1)"""
+    import start
+    src = csv_path(ctx)
+    dest_dir = os.path.join(ctx["work_dir"], "local_hdfs", start.batch_path("csv", 1).lstrip("/"))
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    os.makedirs(dest_dir)
+    started = time.perf_counter()
+    begin, end = start.header_end(src), start.last_line_end(src, os.path.getsize(src))
+    prefix = os.path.join(dest_dir, os.path.splitext(CSV_NAME)[0])
+    with start.PartWriter(prefix, start.compression_for(end - begin)) as out:
+        start.transcode_stream(src, out, begin, end)
+    return time.perf_counter() - started
+
+
+def stage_hive(ctx):
+    """init_hive.sql целиком на SQLite-заглушке"""
+    import hive_client
+    import start
+    db = os.path.join(ctx["work_dir"], "local_hive.db")
+    if os.path.exists(db):
+        os.remove(db)
+    ingestor = start.Ingestor({"next_batch": 2, "hive_batch": 0, "files": {}})
+    ingestor.new_batches.append(("csv", 1))
+    with open(os.path.join(HERE, start.HIVE_SCRIPT_NAME), encoding="utf-8") as f:
+        script = f.read().replace(start.PARTITIONS_MARKER, "\n".join(ingestor.partition_statements()))
+    client = hive_client.connect("local", path=db, hdfs_root=os.path.join(ctx["work_dir"], "local_hdfs"),
+                                 log=lambda *_: None)
+    try:
+        started = time.perf_counter()
+        client.run_script(script, {"since_batch": 0})
+        return time.perf_counter() - started
+    finally:
+        client.close()
+
+
+def stage_enrichment(ctx):
+    import enrichment
+    import raw_events
+    df = raw_events.read_csv_typed(csv_path(ctx), usecols=["x", "y", "battery"])
+    started = time.perf_counter()
+    enrichment.enrich(df)
+    return time.perf_counter() - started
+
+
+def stage_aggregation(ctx):
+    import aggregation
+    import raw_events
+    # Честный холодный проход по CSV, без Feather-кеша
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(raw_events.sidecar_path(csv_path(ctx)))
+    started = time.perf_counter()
+    aggregation.aggregate(csv_path(ctx), workers=ctx["workers"])
+    return time.perf_counter() - started
+
+
+def stage_dashboard_load(ctx):
+    """Первая загрузка дашборда: типизированный разбор CSV + Feather-кеш + mmap"""
+    import raw_events
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(raw_events.sidecar_path(csv_path(ctx)))
+    started = time.perf_counter()
+    raw_events.load_events(csv_path(ctx))
+    return time.perf_counter() - started
+
+
+def stage_train(ctx):
+    """Pipeline из train_liquidity.py на локальном Spark (local[*]): признаки + обучение леса"""
+    try:
+        import train_liquidity
+    except ImportError:
+        raise StageSkipped("pyspark is not installed")
+    spark = train_liquidity.create_spark(master="local[*]")
+    try:
+        events = spark.read.csv(csv_path(ctx), header=True, inferSchema=True)
+        features = train_liquidity.build_features(events).cache()
+        features.count()
+        started = time.perf_counter()
+        train_liquidity.build_pipeline().fit(features)
+        return time.perf_counter() - started
+    finally:
+        spark.stop()
+
+
+def run_stage(name, ctx):
+    """Выполняется в отдельном процессе: (секунды, пиковый RSS МБ)"""
+    sys.path.insert(0, HERE)
+    with contextlib.redirect_stdout(io.StringIO()):  # прогресс генератора и т.п. не нужен
+        seconds = globals()[f"stage_{name}"](ctx)
+    rss = telemetry.peak_rss_mb(children=True)  # стадия и её пул
+    return seconds, float("nan") if rss is None else rss  # Windows: RSS не измеряем
+
+
+def measure(records, stages, work_dir, workers):
+    ctx = {"records": records, "work_dir": work_dir, "workers": workers}
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for name in stages:
+        # spawn — чистый процесс: RSS родителя не попадает в замер
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            try:
+                seconds, rss = pool.submit(run_stage, name, ctx).result()
+            except StageSkipped as e:
+                print(f"{records:>12,} {name:<15} skipped: {e}")
+                continue
+        results.append({"Records": records, "Stage": name, "TimeSec": round(seconds, 4),
+                        "RowsPerSec": round(records / max(seconds, 1e-9)), "PeakRssMB": round(rss, 1)})
+        print(f"{records:>12,} {name:<15} {seconds:9.3f}s {records / max(seconds, 1e-9):>14,.0f} rows/s "
+              f"{rss:9.1f} MB")
+    if results:
+        total = sum(r["TimeSec"] for r in results)
+        results.append({"Records": records, "Stage": "total", "TimeSec": round(total, 4),
+                        "RowsPerSec": round(records / max(total, 1e-9)),
+                        "PeakRssMB": max(r["PeakRssMB"] for r in results)})
+    return results
+
+
+def regressions(previous, current, max_ratio):
+    """Стадии, ставшие медленнее прошлого замера больше чем на max_ratio"""
+    # total зависит от набора стадий в прогоне — сравниваем только сами стадии
+    merged = current[current["Stage"] != "total"].merge(previous, on=["Records", "Stage"], suffixes=("", "_prev"))
+    slower = merged[merged["TimeSec"] > merged["TimeSec_prev"] * (1 + max_ratio)]
+    return slower[["Records", "Stage", "TimeSec_prev", "TimeSec"]]
+
+
+def save_results(current, output):
+    """Дописать замеры в CSV, заменив прошлые строки тех же (Records, Stage)"""
+    if os.path.exists(output):
+        previous = pd.read_csv(output)
+        if "Stage" not in previous.columns:
+            previous["Stage"] = "total"
+        keys = set(zip(current["Records"], current["Stage"]))
+        previous = previous[[k not in keys for k in zip(previous["Records"], previous["Stage"])]]
+        current = pd.concat([previous, current], ignore_index=True)
+    current.sort_values(["Stage", "Records"]).to_csv(output, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--max-regression", type=float,
+                        help="Допустимое замедление относительно прошлого замера (0.25 = +25%%)")
+    parser.add_argument("--keep-data", action="store_true", help="Не удалять сгенерированные данные")
+    args = parser.parse_args()
+    # Замеры бенчмарка идут в его CSV, рабочую телеметрию не смешиваем (TELEMETRY=1 — писать и её);
+    # процессы стадий получают выключатель через окружение
+    telemetry.disable_by_default()
+
+    # Стадиям нужны данные: без generate берём уже сгенерированный CSV в work-dir
+    stages = [s for s in STAGES if s in args.stages]
+    previous = pd.read_csv(args.output) if os.path.exists(args.output) else None
+    rows = []
+    for records in args.sizes:
+        work_dir = os.path.join(args.work_dir, str(records))
+        if "generate" not in stages and not os.path.exists(os.path.join(work_dir, CSV_NAME)):
+            parser.error(f"{work_dir}/{CSV_NAME} not found: include the generate stage")
+        rows += measure(records, stages, work_dir, args.workers)
+        if not args.keep_data and "generate" in stages:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    current = pd.DataFrame(rows)
+    if current.empty:
+        return
+    save_results(current, args.output)
+    print(f"Saved {len(current)} measurements to {args.output}")
+
+    if args.max_regression is not None and previous is not None and "Stage" in previous.columns:
+        slower = regressions(previous, current, args.max_regression)
+        if not slower.empty:
+            print(slower.to_string(index=False))
+            sys.exit(f"{len(slower)} stage(s) regressed by more than {args.max_regression:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Типизированная загрузка сырых событий и колоночный кеш рядом с CSV.
+
+pd.read_csv по умолчанию даёт object-строки для event_type/state и int64/float64
+для остального — ~100 байт на строку. Здесь: категории для event_type/state,
+int8/int32/int32 для mode/drone_id/zone_id, float32 для x/y/battery.
+
+Первая загрузка потоково переписывает CSV в несжатый Feather (Arrow IPC) рядом с
+файлом: <stem>.events.feather. Следующие загрузки открывают его через mmap без
+разбора текста. В метаданных Feather лежит (размер, mtime) CSV и версия типов — новый CSV
+или смена DTYPES кеш сбрасывает.
+
+    python raw_events.py drone_events_million.csv   # RSS до/после, CSV vs Feather
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # без pyarrow работает только типизированный read_csv
+    pa = feather = None
+
+try:
+    import psutil
+except ImportError:  # RSS читаем из /proc
+    psutil = None
+
+# --- ПАРАМЕТРЫ ---
+# Категории фиксированы (как EVENT_TYPES / STATES в headless_simulation): один словарь на весь файл
+EVENT_TYPES = ["zone_discovered", "zone_claimed", "zone_processed", "drone_disabled"]
+STATES = ["SCOUT", "CLAIMING", "WORKED", "PAINTED", "DISABLED"]
+DTYPES = {
+    "timestamp": "float64",      # секунды с мс — float32 теряет точность после ~16k с
+    "event_type": pd.CategoricalDtype(EVENT_TYPES),
+    "drone_id": "int32",         # events-режим генератора — до 100k дронов, int16 переполнится
+    "zone_id": "int32",
+    "x": "float32",
+    "y": "float32",
+    "battery": "float32",
+    "state": pd.CategoricalDtype(STATES),
+    "mode": "int8",
+    "mission_time": "float64",
+}
+SIDECAR_SUFFIX = ".events.feather"
+SIGNATURE_KEY = b"source_signature"
+DTYPES_VERSION = 2           # меняется вместе с DTYPES: кеши со старыми типами перестраиваются
+CHUNK_ROWS = 2_000_000
+
+
+def rss_mb():
+    """Текущая резидентная память процесса, МБ"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return float("nan")
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}:v{DTYPES_VERSION}"
+
+
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + SIDECAR_SUFFIX
+
+
+def typed_chunks(path, chunk_rows=CHUNK_ROWS, usecols=None, nrows=None):
+    """pd.read_csv с компактными типами, пакетами; неизвестная категория — ошибка, а не NaN"""
+    dtype = {c: (str if isinstance(t, pd.CategoricalDtype) else t) for c, t in DTYPES.items()}
+    for chunk in pd.read_csv(path, dtype=dtype, usecols=usecols, nrows=nrows, chunksize=chunk_rows):
+        for col, t in DTYPES.items():
+            if col in chunk and isinstance(t, pd.CategoricalDtype):
+                values = chunk[col].astype(t)
+                unknown = values.isna() & chunk[col].notna()
+                if unknown.any():
+                    raise ValueError(f"{path}: unknown {col} value {chunk[col][unknown].iloc[0]!r}")
+                chunk[col] = values
+        yield chunk
+
+
+def read_csv_typed(path, usecols=None, nrows=None):
+    return pd.concat(typed_chunks(path, usecols=usecols, nrows=nrows), ignore_index=True)
+
+
+def sidecar_fresh(path):
+    side = sidecar_path(path)
+    if feather is None or not os.path.exists(side):
+        return False
+    with pa.memory_map(side) as source:
+        meta = pa.ipc.open_file(source).schema.metadata or {}
+    return meta.get(SIGNATURE_KEY) == file_signature(path).encode()
+
+
+def build_sidecar(path, chunk_rows=CHUNK_ROWS):
+    """Потоково переписать CSV в несжатый Feather (пишем во .tmp, подменяем атомарно)"""
+    side = sidecar_path(path)
+    signature = file_signature(path)
+    writer = None
+    try:
+        for chunk in typed_chunks(path, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema.with_metadata({SIGNATURE_KEY: signature.encode()})
+                writer = pa.ipc.new_file(side + ".tmp", schema)
+            writer.write_table(table.replace_schema_metadata(schema.metadata))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return None
+    os.replace(side + ".tmp", side)
+    return side
+
+
+def load_events(path, columns=None, use_sidecar=True):
+    """Сырые события с компактными типами; при наличии pyarrow — через mmap-кеш"""
+    if not use_sidecar or feather is None:
+        return read_csv_typed(path, usecols=columns)
+    if not sidecar_fresh(path):
+        build_sidecar(path)
+    # Несжатый Feather + mmap: числовые колонки без NULL отдаются без копирования
+    table = feather.read_table(sidecar_path(path), columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("--rebuild", action="store_true", help="Пересобрать Feather-кеш")
+    args = parser.parse_args()
+
+    def report(title, load):
+        before = rss_mb()
+        started = time.perf_counter()
+        df = load()
+        elapsed = time.perf_counter() - started
+        print(f"{title:<24} {elapsed:7.2f}s  frame {frame_mb(df):8.1f} MB  "
+              f"RSS {before:8.1f} → {rss_mb():8.1f} MB")
+        return df
+
+    report("read_csv (defaults)", lambda: pd.read_csv(args.input))
+    report("read_csv (typed)", lambda: read_csv_typed(args.input))
+    if feather is None:
+        return
+    if args.rebuild or not sidecar_fresh(args.input):
+        started = time.perf_counter()
+        build_sidecar(args.input)
+        print(f"{'build sidecar':<24} {time.perf_counter() - started:7.2f}s  → {sidecar_path(args.input)}")
+    df = report("feather mmap", lambda: load_events(args.input))
+    print(df.dtypes.to_string())
+
+
+if __name__ == "__main__":
+    main()
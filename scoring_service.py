@@ -0,0 +1,219 @@
+"""Локальный сервис предсказания event_type по живым событиям дронов.
+
+Протокол — JSON lines по TCP: одна строка на событие (поля как в drone_events CSV,
+необязательный "id"), ответ — строка {"id", "event_type", "probability"} или {"id", "error"}.
+Запросы всех соединений копятся в микропакет (до MAX_BATCH событий или MAX_WAIT_MS)
+и считаются одним векторным проходом forest_export.Forest — без JVM.
+
+    python scoring_service.py serve --forest drone_forest.npz --port 8765
+    python scoring_service.py score --forest drone_forest.npz --input events.jsonl
+    python scoring_service.py bench --forest drone_forest.npz --events drone_events_million.csv
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from forest_export import Forest
+
+# --- ПАРАМЕТРЫ ---
+FOREST_FILE = "drone_forest.npz"
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH = 256
+MAX_WAIT_MS = 2.0      # сколько ждём добора пакета после первого запроса
+BENCH_CLIENTS = 64
+BENCH_REQUESTS = 20_000
+
+
+def score_batch(forest, events):
+    """Векторно по пакету; событие с ошибкой в признаках получает ошибку, остальные — ответ"""
+    results = [None] * len(events)
+    try:
+        rows, X = list(range(len(events))), forest.features(events)
+    except (KeyError, TypeError, ValueError):
+        # Есть плохое событие — отделяем его поштучно, остальные всё равно одним пакетом
+        rows, good = [], []
+        for i, event in enumerate(events):
+            try:
+                good.append(forest.features([event])[0])
+                rows.append(i)
+            except (KeyError, TypeError, ValueError) as e:
+                results[i] = {"error": f"{type(e).__name__}: {e}"}
+        X = np.array(good)
+    if rows:
+        proba = forest.predict_proba(X)
+        best = proba.argmax(axis=1)
+        for i, k, p in zip(rows, best, proba):
+            results[i] = {"event_type": forest.labels[k], "probability": round(float(p[k]), 4)}
+    return results
+
+
+def parse_event(line):
+    """Строка запроса → (событие, None) или (None, ответ с ошибкой)"""
+    try:
+        event = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, {"id": None, "error": f"bad json: {e}"}
+    if not isinstance(event, dict):
+        return None, {"id": None, "error": f"event must be a JSON object, got {type(event).__name__}"}
+    return event, None
+
+
+class MicroBatcher:
+    """Очередь запросов → пакеты → один predict_proba на пакет"""
+
+    def __init__(self, forest, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.forest = forest
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.arrived = asyncio.Event()
+        self.batches = 0
+        self.scored = 0
+
+    async def score(self, event):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((event, future))
+        self.arrived.set()
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Сначала забираем всё, что уже в очереди, потом ждём новых до конца окна
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self._collect()
+            for (_, future), result in zip(batch, score_batch(self.forest, [event for event, _ in batch])):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.scored += len(batch)
+
+
+async def handle_client(batcher, reader, writer):
+    pending = set()
+
+    async def answer(line):
+        event, result = parse_event(line)
+        if event is not None:
+            result = {"id": event.get("id"), **await batcher.score(event)}
+        writer.write((json.dumps(result) + "\n").encode())
+
+    try:
+        while line := await reader.readline():
+            if line.strip():
+                # Запросы одного соединения не ждут друг друга — ответы несут id
+                task = asyncio.create_task(answer(line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_server(forest, host=HOST, port=PORT, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+    batcher = MicroBatcher(forest, max_batch, max_wait_ms)
+    worker = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(lambda r, w: handle_client(batcher, r, w), host, port)
+    return server, batcher, worker
+
+
+# --- Нагрузочный замер ---
+
+def load_events(path, limit):
+    """События из JSON lines или CSV сырых событий"""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line, _ in zip(f, range(limit)) if line.strip()]
+    return pd.read_csv(path, nrows=limit).to_dict("records")
+
+
+async def bench_client(host, port, events, latencies):
+    """Закрытый цикл: следующий запрос — после ответа на предыдущий"""
+    reader, writer = await asyncio.open_connection(host, port)
+    for event in events:
+        started = time.perf_counter()
+        writer.write((json.dumps(event) + "\n").encode())
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+
+
+async def bench(forest, events, clients, max_batch, max_wait_ms, port):
+    server, batcher, worker = await start_server(forest, HOST, port, max_batch, max_wait_ms)
+    latencies = []
+    started = time.perf_counter()
+    async with server:
+        per_client = [events[i::clients] for i in range(clients)]
+        await asyncio.gather(*(bench_client(HOST, port, part, latencies) for part in per_client))
+    elapsed = time.perf_counter() - started
+    worker.cancel()
+    ms = np.array(latencies) * 1000
+    print(f"max_batch={max_batch:<4} clients={clients:<4} requests={len(ms):,}  "
+          f"p50={np.percentile(ms, 50):6.2f} ms  p99={np.percentile(ms, 99):6.2f} ms  "
+          f"throughput={len(ms) / elapsed:9,.0f} ev/s  avg batch={batcher.scored / max(batcher.batches, 1):6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["serve", "score", "bench"])
+    parser.add_argument("--input", help="score: JSON lines с событиями (по умолчанию stdin)")
+    parser.add_argument("--forest", default=FOREST_FILE)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--events", help="bench: CSV или JSON lines с событиями")
+    parser.add_argument("--clients", type=int, default=BENCH_CLIENTS)
+    parser.add_argument("--requests", type=int, default=BENCH_REQUESTS)
+    args = parser.parse_args()
+
+    forest = Forest.load(args.forest)
+    if args.command == "score":
+        # Офлайн: весь файл одним пакетом, ответы в stdout в порядке строк;
+        # нечитаемая строка получает ошибку, остальные считаются
+        with open(args.input, encoding="utf-8") if args.input else sys.stdin as f:
+            parsed = [parse_event(line) for line in f if line.strip()]
+        events = [event for event, _ in parsed if event is not None]
+        scored = iter(score_batch(forest, events))
+        for event, error in parsed:
+            print(json.dumps(error if event is None else {"id": event.get("id"), **next(scored)}))
+    elif args.command == "serve":
+        async def serve():
+            server, _, _ = await start_server(forest, HOST, args.port, args.max_batch, args.max_wait_ms)
+            print(f"Scoring on {HOST}:{args.port} (max batch {args.max_batch}, wait {args.max_wait_ms} ms)")
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve())
+    else:
+        if not args.events:
+            parser.error("bench needs --events")
+        events = load_events(args.events, args.requests)
+        # Без микропакетов (по одному событию) и с ними — на той же нагрузке
+        for max_batch in (1, args.max_batch):
+            asyncio.run(bench(forest, events, args.clients, max_batch, args.max_wait_ms, args.port))
+
+
+if __name__ == "__main__":
+    main()
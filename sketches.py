@@ -0,0 +1,514 @@
+"""Сливаемые скетчи событий: HyperLogLog, t-digest и bottom-k выборка.
+
+Скетч считается один раз на партию данных рядом с ней: start.py пишет его при
+загрузке партии batch=N (SKETCH_DIR/batch=N и HDFS), дашборд — рядом с каждым
+шардом сырых событий (<stem>.sketch.npz). Весит десятки КБ плюс немного на каждого
+дрона, а ответ по любому набору партий — слияние скетчей за миллисекунды, без
+пересчёта сырых данных:
+
+- HyperLogLog (HLL_PRECISION) — уникальные дроны и зоны, уникальные зоны высокого
+  приоритета по дрону (unique_zones_handled из drone_report); ошибка ~1.04/√2^p.
+  Пока уникальных мало (HLL_SPARSE_MAX), счётчик хранит сами хэши и считает точно —
+  у дрона с десятком зон это сотня байт, а не 4 КБ регистров;
+- t-digest (TDIGEST_COMPRESSION) — квантили батареи (общие и по дрону — с меньшим
+  DRONE_TDIGEST_COMPRESSION) и времени claim → process внутри партии: взятия ждут
+  своей обработки, пока идут пакеты, а зоны, обработанные уже в следующей партии, не учитываются;
+- bottom-k выборка (SAMPLE_ROWS) — равномерный предпросмотр; слияние — k наименьших ключей.
+
+    python sketches.py build drone_events_million.csv           # скетчи рядом с файлом/шардами
+    python sketches.py query drone_events_million.csv --check   # ответы + сверка с точным расчётом
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # нужен только для Parquet
+    pq = None
+
+import aggregation
+import spatial_index
+import zone_lifecycle
+
+# --- ПАРАМЕТРЫ ---
+HLL_PRECISION = 12           # 4096 регистров: ~1.6% ошибки, 4 КБ на счётчик
+HLL_SPARSE_MAX = 256         # до стольких уникальных — точный набор хэшей (до 2 КБ), дальше регистры
+TDIGEST_COMPRESSION = 200    # ~100 центроидов; хвосты (p1/p99) точнее середины
+DRONE_TDIGEST_COMPRESSION = 50   # по дрону: десятки тысяч дронов, хватит ~25 центроидов
+SAMPLE_ROWS = 1000
+CHUNK_ROWS = 1_000_000
+QUANTILES = (0.5, 0.95, 0.99)
+SKETCH_DIR = "sketches"      # партии start.py: sketches/batch=N/<файл>.npz
+SIGNATURE_KEY = "source_signature"
+WORK_EVENTS = (zone_lifecycle.CLAIMED, zone_lifecycle.PROCESSED)
+MAX_OPEN_CLAIMS = zone_lifecycle.MAX_OPEN_ZONES   # взятые без обработки — вытесняем самые старые
+
+
+def hash_ids(values):
+    """64-битные хэши целых id (zone_id, drone_id) — одинаковые при любом исходном типе"""
+    return pd.util.hash_array(np.asarray(values, dtype=np.int64))
+
+
+def bit_length(x):
+    """Число значащих бит каждого uint64 — точно, без перехода во float"""
+    x = x.astype(np.uint64)
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x = np.where(big, x >> np.uint64(shift), x)
+    return n + (x > 0)
+
+
+def split_groups(keys, *columns):
+    """(ключ, срезы колонок) по группам одним argsort — дешевле groupby на десятках тысяч групп"""
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    columns = [np.asarray(c)[order] for c in columns]
+    bounds = np.r_[np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]), len(keys)] if len(keys) else [0]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield (keys[start], *(c[start:end] for c in columns))
+
+
+class HyperLogLog:
+    """Уникальные значения: регистр = максимум ранга хэшей, слияние — поэлементный максимум.
+
+    Разреженный режим: пока уникальных хэшей не больше HLL_SPARSE_MAX, хранятся они сами
+    (registers is None) и счёт точный; дальше хэши переносятся в регистры."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None, hashes=None):
+        self.precision = precision
+        self.registers = registers
+        self.hashes = np.empty(0, dtype=np.uint64) if registers is None and hashes is None else hashes
+
+    def add(self, ids):
+        return self.add_hashes(hash_ids(ids)) if len(ids) else self
+
+    def add_hashes(self, hashes):
+        if self.registers is None:
+            self.hashes = np.union1d(self.hashes, hashes).astype(np.uint64)
+            if len(self.hashes) > HLL_SPARSE_MAX:
+                self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+                self._add_dense(self.hashes)
+                self.hashes = None
+        elif len(hashes):
+            self._add_dense(hashes)
+        return self
+
+    def _add_dense(self, hashes):
+        p = self.precision
+        idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rank = (64 - p) - bit_length(hashes & np.uint64((1 << (64 - p)) - 1)) + 1
+        # Максимум ранга по регистру без ufunc.at: есть ли ранг r в регистре i → старший из них
+        present = np.bincount(idx * 64 + rank, minlength=len(self.registers) * 64).reshape(-1, 64) > 0
+        top = np.where(present.any(axis=1), 63 - np.argmax(present[:, ::-1], axis=1), 0).astype(np.uint8)
+        np.maximum(self.registers, top, out=self.registers)
+
+    def merge(self, other):
+        if other.registers is None:
+            return self.add_hashes(other.hashes)
+        if self.registers is None:
+            hashes, self.registers, self.hashes = self.hashes, other.registers.copy(), None
+            self._add_dense(hashes)
+        else:
+            np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        if self.registers is None:
+            return len(self.hashes)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)   # малые множества: линейный подсчёт
+        return int(round(estimate))
+
+
+class TDigest:
+    """Квантили: центроиды с весами; кластер — точки с одним floor(k1(q))"""
+
+    def __init__(self, compression=TDIGEST_COMPRESSION, means=None, weights=None, bounds=(math.inf, -math.inf)):
+        self.compression = compression
+        self.means = np.empty(0) if means is None else means
+        self.weights = np.empty(0) if weights is None else weights
+        self.min, self.max = bounds
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+            self._compress(np.concatenate([self.means, values]),
+                           np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if len(other.means):
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cum = np.cumsum(weights)
+        q = (cum - weights / 2) / cum[-1]
+        # k1 = δ/2π·asin(2q−1): у краёв кластеры мельче, в середине крупнее
+        k = np.floor(self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, qs):
+        if not len(self.means):
+            return np.full(len(qs), np.nan)
+        centers = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return np.interp(qs, np.r_[0.0, centers, 1.0], np.r_[self.min, self.means, self.max])
+
+
+class BottomKSample:
+    """Равномерная выборка строк: у каждой строки случайный ключ, храним k наименьших"""
+
+    def __init__(self, k=SAMPLE_ROWS, frame=None, keys=None):
+        self.k = k
+        self.frame = frame
+        self.keys = np.empty(0) if keys is None else keys
+
+    def add(self, frame, rng):
+        keys = rng.random(len(frame))
+        if len(frame) > self.k:
+            keep = np.argpartition(keys, self.k)[:self.k]
+            frame, keys = frame.iloc[keep], keys[keep]
+        return self._combine(frame.reset_index(drop=True), keys)
+
+    def merge(self, other):
+        if other.frame is None:
+            return self
+        return self._combine(other.frame, other.keys)
+
+    def _combine(self, frame, keys):
+        if self.frame is not None:
+            frame = pd.concat([self.frame, frame], ignore_index=True)
+            keys = np.concatenate([self.keys, keys])
+        order = np.argsort(keys)[:self.k]
+        self.frame, self.keys = frame.iloc[order].reset_index(drop=True), keys[order]
+        return self
+
+
+class EventSketches:
+    """Набор скетчей одной партии событий; слияние партий — merge()"""
+
+    def __init__(self):
+        self.rows = 0
+        self.drones = HyperLogLog()
+        self.zones = HyperLogLog()
+        self.high_zones_by_drone = {}   # дрон → HLL зон высокого приоритета, взятых/обработанных им
+        self.battery = TDigest()
+        self.battery_by_drone = {}
+        self.claim_to_process = TDigest()
+        self.sample = BottomKSample()
+        self._open_claims = pd.Series(dtype=float)   # zone_id → момент взятия, обработки ещё не было
+        self.signature = None   # подпись исходного файла для скетча-спутника
+
+    def update(self, chunk, rng=None):
+        """Пакет строк сырых событий (отсутствующие колонки просто не учитываются)"""
+        self.rows += len(chunk)
+        self.sample.add(chunk, rng or np.random.default_rng())
+        if "drone_id" in chunk:
+            self.drones.add(chunk["drone_id"].dropna())
+        if "zone_id" in chunk:
+            zones = chunk["zone_id"].dropna()
+            self.zones.add(zones[zones >= 0])
+        if {"drone_id", "battery"}.issubset(chunk.columns):
+            self.battery.add(chunk["battery"])
+            # drone_id -1 — события обнаружения без дрона, в разрезе по дронам не нужны
+            known = chunk[(chunk["drone_id"] != -1) & chunk["drone_id"].notna()]
+            for drone, battery in split_groups(known["drone_id"], known["battery"]):
+                self.battery_by_drone.setdefault(int(drone), TDigest(DRONE_TDIGEST_COMPRESSION)).add(battery)
+        if {"drone_id", "zone_id", "event_type"}.issubset(chunk.columns):
+            work = chunk[chunk["event_type"].isin(WORK_EVENTS) & (chunk["drone_id"] != -1)]
+            if {"x", "y"}.issubset(chunk.columns):
+                # Как high_work в init_hive.sql: взятие/обработка зоны высокого приоритета
+                high = work[spatial_index.priority_codes(work["x"], work["y"]) == 0].dropna(subset=["drone_id"])
+                for drone, hashes in split_groups(high["drone_id"], hash_ids(high["zone_id"])):
+                    self.high_zones_by_drone.setdefault(int(drone), HyperLogLog()).add_hashes(hashes)
+            if "timestamp" in chunk:
+                self._match_claims(work)
+        return self
+
+    def _match_claims(self, work):
+        """claim → process по мере прихода: в памяти только взятые, но ещё не обработанные зоны"""
+        event = work["event_type"].astype(str)
+        claims = work.loc[event == zone_lifecycle.CLAIMED, ["zone_id", "timestamp"]]
+        claims = pd.concat([self._open_claims, claims.set_index("zone_id")["timestamp"]])
+        claims = claims[~claims.index.duplicated()]
+        processed = work.loc[event == zone_lifecycle.PROCESSED].drop_duplicates("zone_id")
+        latency = processed["timestamp"].to_numpy(float) - claims.reindex(processed["zone_id"]).to_numpy(float)
+        self.claim_to_process.add(latency[latency > 0])
+        claims = claims[~claims.index.isin(processed["zone_id"])]
+        self._open_claims = claims.iloc[-MAX_OPEN_CLAIMS:]
+
+    def finish(self):
+        """Конец партии: взятые без обработки зоны больше не ждём"""
+        self._open_claims = pd.Series(dtype=float)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.drones.merge(other.drones)
+        self.zones.merge(other.zones)
+        for name in ("high_zones_by_drone", "battery_by_drone"):
+            mine = getattr(self, name)
+            for drone, sketch in getattr(other, name).items():
+                if drone in mine:
+                    mine[drone].merge(sketch)
+                else:
+                    mine[drone] = sketch
+        self.battery.merge(other.battery)
+        self.claim_to_process.merge(other.claim_to_process)
+        self.sample.merge(other.sample)
+        return self
+
+    # --- ответы ---
+
+    def summary(self, quantiles=QUANTILES):
+        row = {"rows": self.rows, "unique_drones": self.drones.count(), "unique_zones": self.zones.count()}
+        for name, digest in (("battery", self.battery), ("claim_to_process", self.claim_to_process)):
+            for q, v in zip(quantiles, digest.quantile(quantiles)):
+                row[f"{name}_p{round(q * 100)}"] = v
+        return row
+
+    def drone_frame(self, quantiles=QUANTILES):
+        drones = sorted(set(self.battery_by_drone) | set(self.high_zones_by_drone))
+        rows = []
+        for drone in drones:
+            row = {"drone_id": drone}
+            hll = self.high_zones_by_drone.get(drone)
+            row["unique_zones_handled"] = hll.count() if hll else 0
+            digest = self.battery_by_drone.get(drone, TDigest())
+            for q, v in zip(quantiles, digest.quantile(quantiles)):
+                row[f"battery_p{round(q * 100)}"] = v
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    # --- хранение: .npz без pickle, метаданные — JSON ---
+
+    # Счётчики и дайджесты по дронам — не по массиву на дрона, а общими массивами со смещениями:
+    # десятки тысяч записей в zip весили больше самих данных
+
+    def save(self, path, signature=None):
+        arrays = {}
+        meta = {"rows": self.rows, "precision": HLL_PRECISION, "compression": TDIGEST_COMPRESSION,
+                "drone_compression": DRONE_TDIGEST_COMPRESSION, SIGNATURE_KEY: signature, "digests": {}}
+        for name, hll in (("drones", self.drones), ("zones", self.zones)):
+            arrays.update(pack_hlls(f"hll_{name}", [hll]))
+        high = sorted(self.high_zones_by_drone)
+        meta["high_zone_drones"] = high
+        arrays.update(pack_hlls("hll_high_zones", [self.high_zones_by_drone[d] for d in high]))
+        for name, digest in (("battery", self.battery), ("claim_to_process", self.claim_to_process)):
+            arrays[f"td_means/{name}"], arrays[f"td_weights/{name}"] = digest.means, digest.weights
+            meta["digests"][name] = [digest.min, digest.max]
+        by_drone = sorted(self.battery_by_drone)
+        digests = [self.battery_by_drone[d] for d in by_drone]
+        arrays["td_drone_ids"] = np.array(by_drone, dtype=np.int64)
+        arrays["td_drone_sizes"] = np.array([len(t.means) for t in digests], dtype=np.int64)
+        arrays["td_drone_means"] = np.concatenate([t.means for t in digests]) if digests else np.empty(0)
+        arrays["td_drone_weights"] = np.concatenate([t.weights for t in digests]) if digests else np.empty(0)
+        arrays["td_drone_bounds"] = np.array([[t.min, t.max] for t in digests], dtype=float).reshape(-1, 2)
+        if self.sample.frame is not None:
+            arrays["sample_keys"] = self.sample.keys
+            meta["sample_columns"] = list(self.sample.frame.columns)
+            for col in meta["sample_columns"]:
+                values = self.sample.frame[col]
+                numeric = pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype)
+                arrays[f"sample/{col}"] = values.to_numpy() if numeric else values.astype(str).to_numpy(dtype=str)
+        arrays["meta"] = np.array(json.dumps(meta))
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            p = meta["precision"]
+            sketches = cls()
+            sketches.rows = meta["rows"]
+            sketches.drones, = unpack_hlls(arrays, "hll_drones", p, 1)
+            sketches.zones, = unpack_hlls(arrays, "hll_zones", p, 1)
+            high = meta["high_zone_drones"]
+            sketches.high_zones_by_drone = dict(zip(high, unpack_hlls(arrays, "hll_high_zones", p, len(high))))
+            for name, bounds in meta["digests"].items():
+                digest = TDigest(meta["compression"], arrays[f"td_means/{name}"], arrays[f"td_weights/{name}"],
+                                 tuple(bounds))
+                if name.startswith("battery_by_drone/"):   # скетчи до упаковки по дронам
+                    sketches.battery_by_drone[int(name.split("/")[1])] = digest
+                else:
+                    setattr(sketches, name, digest)
+            if "td_drone_ids" in arrays:
+                ends = np.cumsum(arrays["td_drone_sizes"])
+                means = np.split(arrays["td_drone_means"], ends[:-1])
+                weights = np.split(arrays["td_drone_weights"], ends[:-1])
+                for drone, m, w, bounds in zip(arrays["td_drone_ids"].tolist(), means, weights,
+                                               arrays["td_drone_bounds"]):
+                    sketches.battery_by_drone[drone] = TDigest(meta["drone_compression"], m, w, tuple(bounds))
+            if "sample_columns" in meta:
+                frame = pd.DataFrame({col: arrays[f"sample/{col}"] for col in meta["sample_columns"]})
+                sketches.sample = BottomKSample(SAMPLE_ROWS, frame, arrays["sample_keys"])
+        sketches.signature = meta.get(SIGNATURE_KEY)
+        return sketches
+
+
+def pack_hlls(key, hlls):
+    """Список HLL в массивы: плотные — матрицей регистров, разреженные — хэши подряд + размеры"""
+    dense = [h for h in hlls if h.registers is not None]
+    sparse = [h for h in hlls if h.registers is None]
+    return {
+        key: np.stack([h.registers for h in dense]) if dense else np.zeros((0, 1 << HLL_PRECISION), dtype=np.uint8),
+        f"{key}/dense": np.array([h.registers is not None for h in hlls], dtype=bool),
+        f"{key}/hashes": np.concatenate([h.hashes for h in sparse]) if sparse else np.empty(0, dtype=np.uint64),
+        f"{key}/sizes": np.array([len(h.hashes) for h in sparse], dtype=np.int64),
+    }
+
+
+def unpack_hlls(arrays, key, precision, n):
+    """Обратно к списку HLL (в скетчах до разреженного режима все счётчики плотные)"""
+    registers = arrays[key]
+    if registers.ndim == 1:
+        registers = registers[None, :]
+    if f"{key}/dense" not in arrays:
+        return [HyperLogLog(precision, regs.copy()) for regs in registers[:n]]
+    sizes = arrays[f"{key}/sizes"]
+    sparse = iter(np.split(arrays[f"{key}/hashes"], np.cumsum(sizes)[:-1]) if len(sizes) else [])
+    dense = iter(registers)
+    return [HyperLogLog(precision, next(dense).copy()) if is_dense else HyperLogLog(precision, hashes=next(sparse))
+            for is_dense in arrays[f"{key}/dense"]]
+
+
+def merge_all(items):
+    total = EventSketches()
+    for sketches in items:
+        total.merge(sketches)
+    return total
+
+
+# --- Построение по файлам ---
+
+def sketch_chunks(chunks, seed=0):
+    rng = np.random.default_rng(seed)
+    sketches = EventSketches()
+    for chunk in chunks:
+        sketches.update(chunk, rng)
+    return sketches.finish()
+
+
+def file_chunks(path, names=None, chunk_rows=CHUNK_ROWS):
+    if isinstance(path, str) and path.endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError("pyarrow is required to sketch Parquet: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    # .gz/.bz2 (сжатые части start.py) pandas распаковывает по расширению
+    yield from pd.read_csv(path, header=None if names else "infer", names=names, chunksize=chunk_rows)
+
+
+def sketch_file(path, names=None, chunk_rows=CHUNK_ROWS):
+    """Скетчи CSV или Parquet (путь, открытый CSV-поток или список частей одной партии);
+    names — колонки для CSV без заголовка (staging-файлы и поток перекодировки start.py)"""
+    paths = path if isinstance(path, list) else [path]
+    return sketch_chunks(chunk for p in paths for chunk in file_chunks(p, names, chunk_rows))
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + ".sketch.npz"
+
+
+def load_or_build(path):
+    """Скетч-спутник файла: актуальный — читается, устаревший или отсутствующий — строится"""
+    side = sidecar_path(path)
+    if os.path.exists(side):
+        sketches = EventSketches.load(side)
+        if sketches.signature == file_signature(path):
+            return sketches
+    sketches = sketch_file(path)
+    sketches.save(side, file_signature(path))
+    return sketches
+
+
+def batch_sketch_dir(batch, root=SKETCH_DIR):
+    return os.path.join(root, f"batch={batch}")
+
+
+def batch_sketch_path(batch, file_name, root=SKETCH_DIR):
+    return os.path.join(batch_sketch_dir(batch, root), os.path.basename(file_name) + ".npz")
+
+
+def load_batches(root=SKETCH_DIR):
+    """{batch: EventSketches} по всем партиям start.py (файлы одной партии сливаются)"""
+    batches = {}
+    for path in glob.glob(os.path.join(root, "batch=*", "*.npz")):
+        batch = int(os.path.basename(os.path.dirname(path)).split("=")[1])
+        sketches = EventSketches.load(path)
+        batches[batch] = batches[batch].merge(sketches) if batch in batches else sketches
+    return dict(sorted(batches.items()))
+
+
+def check(paths, sketches):
+    """Точные значения по сырым данным против скетчей"""
+    df = pd.concat([pd.read_csv(p, usecols=["event_type", "drone_id", "zone_id", "x", "y", "battery"]) for p in paths],
+                   ignore_index=True)
+    exact = {"unique_drones": df["drone_id"].nunique(), "unique_zones": df.loc[df["zone_id"] >= 0, "zone_id"].nunique()}
+    summary = sketches.summary()
+    for q in QUANTILES:
+        exact[f"battery_p{round(q * 100)}"] = df["battery"].quantile(q)
+    for key, value in exact.items():
+        print(f"{key:>18}: exact {value:12.3f}  sketch {summary[key]:12.3f}  ({abs(summary[key] - value) / value:.2%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("input", help="CSV/Parquet или имя без -part-NNNNN для шардов")
+    parser.add_argument("--check", action="store_true", help="query: сверить с точным расчётом по сырым данным")
+    args = parser.parse_args()
+
+    paths = aggregation.resolve_inputs(args.input)
+    if not paths:
+        parser.error(f"{args.input} not found")
+    started = time.perf_counter()
+    parts = [load_or_build(p) for p in paths]
+    loaded = time.perf_counter()
+    sketches = merge_all(parts)
+    merged = time.perf_counter()
+    print(f"{len(paths)} sketch file(s): load/build {loaded - started:.2f}s, merge {(merged - loaded) * 1000:.1f} ms")
+    if args.command == "query":
+        print(pd.Series(sketches.summary()).round(3).to_string())
+        print(sketches.drone_frame().round(2).to_string(index=False))
+        if args.check:
+            check(paths, sketches)
+
+
+if __name__ == "__main__":
+    main()
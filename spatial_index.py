@@ -0,0 +1,323 @@
+"""Пространственный индекс событий: равномерная сетка ячеек CELL_SIZE x CELL_SIZE по полю.
+
+Номер ячейки точки: cell = ix * NY + iy внутри GRID_RANGE, OUTSIDE — вне его (и NaN).
+Приоритет зоны для ячейки известен заранее: если ячейка целиком лежит в одном кольце
+PRIORITY_BINS, класс берётся из таблицы CELL_PRIORITY, а по строке он считается
+только в ячейках, через которые проходит граница кольца.
+
+Индекс строится рядом с CSV сырых событий один раз (как Feather-кеш raw_events):
+- <stem>.cells.feather — те же строки плюс колонка cell, внутри каждого пакета
+  упорядоченные по ячейке (в ячейке — в исходном порядке);
+- <stem>.cells.npz — смещения строк каждой ячейки в каждом пакете и агрегаты по
+  ячейкам: события, батарея, типы событий, классы приоритета.
+Запрос по прямоугольнику складывает агрегаты ячеек, целиком лежащих внутри него, а
+строки читает через mmap только у ячеек на его границе.
+
+    python spatial_index.py build drone_events_million.csv
+    python spatial_index.py query drone_events_million.csv --bbox 600 1000 200 500 --check
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # без pyarrow индекс не строится, остаётся только таблица приоритетов
+    pa = None
+
+import density_tiles
+import enrichment
+import raw_events
+
+# --- ПАРАМЕТРЫ ---
+GRID_RANGE = density_tiles.GRID_RANGE   # поле + база отказавших дронов
+CELL_SIZE = 20
+NX = int((GRID_RANGE[0][1] - GRID_RANGE[0][0]) // CELL_SIZE)
+NY = int((GRID_RANGE[1][1] - GRID_RANGE[1][0]) // CELL_SIZE)
+N_CELLS = NX * NY
+OUTSIDE = N_CELLS                       # одна ячейка на всё, что вне сетки
+MIXED = -1                              # граница кольца приоритета проходит через ячейку
+EDGE_EPS = 1e-6                         # запас, чтобы округление hypot не меняло класс
+ROWS_SUFFIX = ".cells.feather"
+INDEX_SUFFIX = ".cells.npz"
+PREVIEW_ROWS = 1000
+EVENT_TYPES = raw_events.EVENT_TYPES
+AGG_FIELDS = ["events", "battery_sum", "battery_n", "event_counts", "priority_counts"]
+
+
+def cell_ids(x, y):
+    """Номер ячейки каждой точки; правая/верхняя граница сетки входит в крайнюю ячейку"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    (x0, x1), (y0, y1) = GRID_RANGE
+    with np.errstate(invalid="ignore"):
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        # Внутри сетки x - x0 >= 0: усечение до int совпадает с floor и заметно быстрее //
+        ix = np.minimum(((x - x0) / CELL_SIZE).astype(np.int32), NX - 1)
+        iy = np.minimum(((y - y0) / CELL_SIZE).astype(np.int32), NY - 1)
+    return np.where(inside, ix * NY + iy, OUTSIDE).astype(np.int32)
+
+
+def cell_bounds():
+    """(x0, x1, y0, y1) каждой ячейки сетки"""
+    cells = np.arange(N_CELLS)
+    cx0 = GRID_RANGE[0][0] + cells // NY * CELL_SIZE
+    cy0 = GRID_RANGE[1][0] + cells % NY * CELL_SIZE
+    return cx0, cx0 + CELL_SIZE, cy0, cy0 + CELL_SIZE
+
+
+def _cell_priority():
+    """Класс приоритета ячейки (индекс в PRIORITY_CLASSES) или MIXED"""
+    cx0, cx1, cy0, cy1 = cell_bounds()
+    fx, fy = enrichment.FIELD_CENTER
+    # Ближайшая и дальняя от центра поля точки прямоугольника
+    d_min = np.hypot(np.maximum(np.maximum(cx0 - fx, fx - cx1), 0), np.maximum(np.maximum(cy0 - fy, fy - cy1), 0))
+    d_max = np.hypot(np.maximum(abs(cx0 - fx), abs(cx1 - fx)), np.maximum(abs(cy0 - fy), abs(cy1 - fy)))
+    low, high = enrichment.PRIORITY_BINS
+    codes = np.full(N_CELLS + 1, MIXED, dtype=np.int8)
+    codes[:N_CELLS] = np.select(
+        [d_max < low - EDGE_EPS, (d_min >= low + EDGE_EPS) & (d_max <= high - EDGE_EPS), d_min > high + EDGE_EPS],
+        [0, 1, 2], MIXED)
+    return codes
+
+
+CELL_PRIORITY = _cell_priority()
+
+
+def priority_codes(x, y, cells=None):
+    """Индекс класса в enrichment.PRIORITY_CLASSES по таблице ячеек; по строке —
+    только в ячейках на границе колец и вне сетки (те же правила, что и в Hive)"""
+    cells = cell_ids(x, y) if cells is None else np.asarray(cells)
+    codes = CELL_PRIORITY[cells]
+    mixed = np.flatnonzero(codes == MIXED)
+    if len(mixed):
+        codes[mixed] = enrichment.zone_priority_code(np.asarray(x, dtype=float)[mixed], np.asarray(y, dtype=float)[mixed])
+    return codes
+
+
+def priority_class(x, y, cells=None):
+    return np.array(enrichment.PRIORITY_CLASSES, dtype=object)[priority_codes(x, y, cells)]
+
+
+def summarize(frame, cells):
+    """Агрегаты строк frame по ячейкам: {поле: массив [N_CELLS + 1, ...]}"""
+    n, k, p = N_CELLS + 1, len(EVENT_TYPES), len(enrichment.PRIORITY_CLASSES)
+    battery = frame["battery"].to_numpy(dtype=float)
+    known = ~np.isnan(battery)
+    events = pd.Categorical(frame["event_type"], categories=EVENT_TYPES).codes.astype(np.int64)
+    typed = events >= 0
+    priority = priority_codes(frame["x"], frame["y"], cells).astype(np.int64)
+    return {
+        "events": np.bincount(cells, minlength=n),
+        "battery_sum": np.bincount(cells[known], weights=battery[known], minlength=n),
+        "battery_n": np.bincount(cells[known], minlength=n),
+        "event_counts": np.bincount(cells[typed] * k + events[typed], minlength=n * k).reshape(n, k),
+        "priority_counts": np.bincount(cells * p + priority, minlength=n * p).reshape(n, p),
+    }
+
+
+def index_paths(path):
+    stem = os.path.splitext(path)[0]
+    return stem + ROWS_SUFFIX, stem + INDEX_SUFFIX
+
+
+def build(path, chunk_rows=raw_events.CHUNK_ROWS):
+    """Один проход по CSV: пакеты строк, упорядоченные по ячейке, смещения и агрегаты"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the spatial index: pip install pyarrow")
+    rows_path, index_path = index_paths(path)
+    signature = raw_events.file_signature(path)
+    writer, offsets, totals = None, [], None
+    try:
+        for chunk in raw_events.typed_chunks(path, chunk_rows):
+            if chunk.empty:
+                continue
+            cells = cell_ids(chunk["x"], chunk["y"])
+            order = np.argsort(cells, kind="stable")
+            chunk, cells = chunk.iloc[order].reset_index(drop=True), cells[order]
+            chunk["cell"] = cells.astype(np.int16)
+            offsets.append(np.searchsorted(cells, np.arange(N_CELLS + 2)))
+            part = summarize(chunk, cells)
+            totals = part if totals is None else {k: totals[k] + part[k] for k in AGG_FIELDS}
+            batch = pa.Table.from_pandas(chunk, preserve_index=False).combine_chunks().to_batches()[0]
+            if writer is None:
+                writer = pa.ipc.new_file(rows_path + ".tmp", batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"{path}: no events to index")
+    os.replace(rows_path + ".tmp", rows_path)
+    meta = {"source_signature": signature, "grid_range": GRID_RANGE, "cell_size": CELL_SIZE}
+    with open(index_path + ".tmp", "wb") as f:
+        np.savez(f, offsets=np.stack(offsets), meta=np.array(json.dumps(meta)), **totals)
+    os.replace(index_path + ".tmp", index_path)
+    return SpatialIndex(path)
+
+
+class SpatialIndex:
+    """Индекс одного CSV: агрегаты ячеек в памяти, строки — mmap Feather"""
+
+    def __init__(self, path):
+        rows_path, index_path = index_paths(path)
+        with np.load(index_path) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self.offsets = data["offsets"]
+            self.aggregates = {k: data[k] for k in AGG_FIELDS}
+        self.source = pa.memory_map(rows_path)
+        self.reader = pa.ipc.open_file(self.source)
+
+    @property
+    def total_rows(self):
+        return int(self.aggregates["events"].sum())
+
+    def fresh_for(self, path):
+        return (self.meta.get("source_signature") == raw_events.file_signature(path)
+                and self.meta.get("cell_size") == CELL_SIZE
+                and [list(r) for r in self.meta.get("grid_range", [])] == [list(r) for r in GRID_RANGE])
+
+    def read_cells(self, cells, limit=None):
+        """Строки выбранных ячеек: соседние номера ячеек сливаются в один срез пакета"""
+        cells = np.unique(cells)
+        if not len(cells):
+            return self.reader.schema.empty_table().to_pandas()
+        runs = np.split(cells, np.flatnonzero(np.diff(cells) != 1) + 1)
+        pieces, taken = [], 0
+        for b in range(self.reader.num_record_batches):
+            batch = self.reader.get_batch(b)
+            for run in runs:
+                begin, end = self.offsets[b, run[0]], self.offsets[b, run[-1] + 1]
+                if end > begin:
+                    pieces.append(batch.slice(begin, end - begin))
+                    taken += end - begin
+                if limit is not None and taken >= limit:
+                    break
+            if limit is not None and taken >= limit:
+                break
+        if not pieces:
+            return self.reader.schema.empty_table().to_pandas()
+        frame = pa.Table.from_batches(pieces).to_pandas()
+        return frame.head(limit) if limit is not None else frame
+
+    def query(self, bbox, preview_rows=PREVIEW_ROWS):
+        """Итоги по прямоугольнику ((x0, x1), (y0, y1)): внутренние ячейки — из агрегатов,
+        граничные — по своим строкам"""
+        interior, boundary = cells_in(bbox)
+        totals = {k: self.aggregates[k][interior].sum(axis=0) for k in AGG_FIELDS}
+        edge = self.read_cells(boundary)
+        rows_read = len(edge)
+        (bx0, bx1), (by0, by1) = bbox
+        edge = edge[edge["x"].between(bx0, bx1) & edge["y"].between(by0, by1)]
+        if len(edge):
+            part = summarize(edge, edge["cell"].to_numpy(dtype=np.int64))
+            totals = {k: totals[k] + part[k].sum(axis=0) for k in AGG_FIELDS}
+        preview = edge.head(preview_rows)
+        if len(preview) < preview_rows and len(interior):
+            preview = pd.concat([self.read_cells(interior, limit=preview_rows - len(preview)), preview],
+                                ignore_index=True)
+        return {**totals, "cells_interior": len(interior), "cells_boundary": len(boundary),
+                "rows_read": rows_read, "total_rows": self.total_rows, "preview": preview}
+
+    def close(self):
+        self.source.close()
+
+
+def cells_in(bbox):
+    """(ячейки целиком внутри прямоугольника, ячейки на его границе)"""
+    (bx0, bx1), (by0, by1) = bbox
+    cx0, cx1, cy0, cy1 = cell_bounds()
+    overlap = (cx1 >= bx0) & (cx0 <= bx1) & (cy1 >= by0) & (cy0 <= by1)
+    # Ячейка полуоткрыта [x0, x1), поэтому x1 <= bx1 — все её точки внутри
+    inside = (cx0 >= bx0) & (cx1 <= bx1) & (cy0 >= by0) & (cy1 <= by1)
+    return np.flatnonzero(inside), np.flatnonzero(overlap & ~inside)
+
+
+def load_or_build(path):
+    rows_path, index_path = index_paths(path)
+    if os.path.exists(rows_path) and os.path.exists(index_path):
+        index = SpatialIndex(path)
+        if index.fresh_for(path):
+            return index
+        index.close()
+    return build(path)
+
+
+def query_all(indexes, bbox, preview_rows=PREVIEW_ROWS):
+    """Запрос по нескольким шардам: итоги складываются, предпросмотр — из первых"""
+    total = None
+    for index in indexes:
+        result = index.query(bbox, preview_rows)
+        if total is None:
+            total = result
+            continue
+        for key in AGG_FIELDS + ["cells_interior", "cells_boundary", "rows_read", "total_rows"]:
+            total[key] = total[key] + result[key]
+        if len(total["preview"]) < preview_rows:
+            total["preview"] = pd.concat([total["preview"], result["preview"]], ignore_index=True).head(preview_rows)
+    return total
+
+
+def result_tables(result):
+    """Типы событий и классы приоритета из итогов запроса"""
+    events = pd.DataFrame({"event_type": EVENT_TYPES, "count": result["event_counts"]})
+    priority = pd.DataFrame({"zone_priority_class": enrichment.PRIORITY_CLASSES, "count": result["priority_counts"]})
+    return events[events["count"] > 0], priority
+
+
+def check(path, bbox, result):
+    """Тот же запрос полным проходом по CSV"""
+    df = raw_events.read_csv_typed(path, usecols=["event_type", "x", "y", "battery"])
+    (bx0, bx1), (by0, by1) = bbox
+    df = df[df["x"].between(bx0, bx1) & df["y"].between(by0, by1)]
+    exact = {"events": len(df), "battery_sum": float(df["battery"].astype(float).sum())}
+    got = {"events": int(result["events"]), "battery_sum": float(result["battery_sum"])}
+    exact_events = df["event_type"].value_counts().reindex(EVENT_TYPES, fill_value=0).to_numpy()
+    exact_priority = pd.Series(enrichment.zone_priority_class(df["x"], df["y"])).value_counts() \
+        .reindex(enrichment.PRIORITY_CLASSES, fill_value=0).to_numpy()
+    checks = {
+        "events": exact["events"] == got["events"],
+        "battery_sum": np.isclose(exact["battery_sum"], got["battery_sum"]),
+        "event_types": (exact_events == result["event_counts"]).all(),
+        "priority": (exact_priority == result["priority_counts"]).all(),
+    }
+    print(f"check: full scan {exact}, index {got}")
+    for name, passed in checks.items():
+        print(f"{name:>12}: {'ok' if passed else 'DIFFER'}")
+    ok = all(checks.values())
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("input", help="CSV сырых событий")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("X0", "X1", "Y0", "Y1"),
+                        default=[600, 1000, 200, 500])
+    parser.add_argument("--check", action="store_true", help="query: сверить с полным проходом по CSV")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = build(args.input) if args.command == "build" else load_or_build(args.input)
+    print(f"Index of {index.total_rows:,} rows ({NX}x{NY} cells of {CELL_SIZE}): {time.perf_counter() - started:.2f}s")
+    if args.command == "query":
+        bbox = (tuple(args.bbox[:2]), tuple(args.bbox[2:]))
+        started = time.perf_counter()
+        result = index.query(bbox)
+        elapsed = time.perf_counter() - started
+        events, priority = result_tables(result)
+        print(f"{int(result['events']):,} events in {bbox}: {result['cells_interior']} interior + "
+              f"{result['cells_boundary']} boundary cells, read {result['rows_read']:,} of "
+              f"{result['total_rows']:,} rows in {elapsed * 1000:.1f} ms")
+        print(events.to_string(index=False))
+        print(priority.to_string(index=False))
+        if args.check and not check(args.input, bbox, result):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
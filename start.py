@@ -1,20 +1,75 @@
+import bz2
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
 import subprocess
+import threading
 import time
 import socket
 import os
+import shutil
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import analytics_export
+import hive_client
+import sketches
+import telemetry
 
 # --- НАСТРОЙКИ ---
 # Файлы должны лежать РЯДОМ со скриптом внутри контейнера
 CSV_FILES = ["drone_events_million.csv"]
+# Колоночный вывод генератора (headless_simulation.py --format parquet): грузится без перекодировки
+PARQUET_FILES = ["drone_events_million.parquet"]
 HDFS_DATA_PATH = "/drone_data"
+HDFS_PARQUET_PATH = "/drone_data_parquet"
+HDFS_SKETCH_PATH = "/drone_sketches"  # скетчи партий: вне каталогов таблиц Hive
 HIVE_SCRIPT_NAME = "init_hive.sql"
+SOURCE_ENCODING = "cp1251"
+TRANSCODE_CHUNK_CHARS = 4 * 1024 * 1024  # размер куска при потоковой перекодировке
+# Сжатие CSV при загрузке: gzip, bzip2 или none. Новая часть файла меньше COMPRESS_MIN_MB
+# грузится как есть, больше — частями по COMPRESS_PART_MB несжатых данных: gzip не делится
+# на сплиты, поэтому каждая часть — отдельный файл и отдельный сплит Hive/Spark
+INGEST_COMPRESSION = os.environ.get("INGEST_COMPRESSION", "gzip")
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_MB", "64")) * 1024 * 1024
+COMPRESS_PART_BYTES = int(os.environ.get("COMPRESS_PART_MB", "128")) * 1024 * 1024
+CODECS = {"gzip": (gzip.open, ".gz", {"compresslevel": 6}), "bzip2": (bz2.open, ".bz2", {"compresslevel": 9})}
+UPLOAD_WORKERS = 4  # сколько файлов грузим в HDFS одновременно
+MANIFEST_FILE = "ingest_manifest.json"  # что уже загружено: хэши, смещения, партиции batch=N
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+PARTITIONS_MARKER = "-- @INGEST_PARTITIONS"  # сюда start.py подставляет ADD/DROP PARTITION
+REPORT_MARKER = "-- @REPORT_READY"  # drone_report готов: экспорт стартует, не дожидаясь хвоста скрипта
+STAGING_DIR = "staging"  # перекодированные CSV, пока кластер поднимается
+# Несжатый CSV по умолчанию перекодируется прямо в `hdfs dfs -put -` — без копии на диске, но после
+# готовности HDFS. INGEST_STAGING=1 — сначала в STAGING_DIR, пока кластер поднимается (ещё раз размер CSV на диске).
+# Сжатые части всегда собираются в STAGING_DIR
+STAGE_PLAIN_CSV = os.environ.get("INGEST_STAGING", "0") == "1"
+STATE_FILE = "pipeline_state.json"  # отметки завершённых стадий: повторный запуск продолжает с упавшей
+TIMINGS_FILE = "pipeline_timings.csv"
+RESTART = os.environ.get("PIPELINE_RESTART") == "1"  # игнорировать отметки и пройти все стадии заново
+PROBE_TIMEOUT_SEC = int(os.environ.get("PROBE_TIMEOUT_SEC", "300"))
+PROBE_BACKOFF = (0.5, 2.0, 15.0)  # первая пауза, множитель, максимальная пауза
+# "hive" — HiveServer2 через пул соединений, "local" — без кластера: SQLite-заглушка
+# (hive_client.LocalSqlClient) и каталог LOCAL_HDFS_ROOT вместо HDFS
+HIVE_BACKEND = os.environ.get("HIVE_BACKEND", "hive")
+LOCAL_HIVE_DB = "local_hive.db"
+LOCAL_HDFS_ROOT = "local_hdfs"  # пути HDFS от корня: local_hdfs/drone_data/batch=N/...
 FINAL_CSV_NAME = "drone_swarm_analytics.csv"
+SKETCH_SUMMARY_NAME = "drone_sketch_summary.csv"  # по дронам из слитых скетчей партий
+# Форматы экспорта через запятую: csv (Excel, с BOM), parquet, feather (для дашборда)
+EXPORT_FORMATS = os.environ.get("EXPORT_FORMATS", "csv,feather").split(",")
+EXPORT_LIMIT = int(os.environ.get("EXPORT_LIMIT", "1000"))  # 0 — без ограничения
 
 # Сетевые имена контейнеров (как они видны в docker network)
 HIVE_HOST = "hive-server"
 NAMENODE_HOST = "namenode"
 
+# Замеры стадий, перекодировки, загрузки и операторов Hive → telemetry.TELEMETRY_FILE
+metrics = telemetry.Recorder("start")
+
 def log(message, color="WHITE"):
     """Вывод с цветом"""
     colors = {
@@ -49,87 +104,710 @@ def check_hdfs_safemode():
     except:
         return False
 
-def wait_for_service(name, check_func, max_retries=30):
+def read_range(file_name, start, end, chunk_bytes=HASH_CHUNK_BYTES):
+    """Байты файла [start, end) кусками"""
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            raw = f.read(min(chunk_bytes, remaining))
+            if not raw:
+                break
+            remaining -= len(raw)
+            yield raw
+
+def last_line_end(file_name, size):
+    """Позиция сразу после последнего '\n' — недописанную строку не грузим"""
+    with open(file_name, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(HASH_CHUNK_BYTES, pos)
+            f.seek(pos - step)
+            idx = f.read(step).rfind(b"\n")
+            if idx >= 0:
+                return pos - step + idx + 1
+            pos -= step
+    return 0
+
+def csv_columns(file_name):
+    """Колонки из заголовка исходного CSV — в перекодированном куске заголовка нет"""
+    with open(file_name, encoding=SOURCE_ENCODING) as f:
+        return f.readline().strip().split(",")
+
+def header_end(file_name):
+    with open(file_name, "rb") as f:
+        f.readline()
+        return f.tell()
+
+def transcode_chunks(file_name, start, end, chunk_chars=TRANSCODE_CHUNK_CHARS, hasher=None):
+    """cp1251 -> UTF-8 кусками фиксированного размера для байтов [start, end): (UTF-8 байты, строк).
+    hasher (если задан) получает исходные байты"""
+    carry_cr = False
+    for raw in read_range(file_name, start, end, chunk_chars):
+        if hasher is not None:
+            hasher.update(raw)
+        # cp1251 однобайтная — границы кусков не режут символы
+        text = raw.decode(SOURCE_ENCODING)
+        if carry_cr and text.startswith("\n"):
+            text = text[1:]
+        carry_cr = text.endswith("\r")
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        yield text.encode("utf-8"), raw.count(b"\n")
+
+def transcode_stream(file_name, out, start, end, chunk_chars=TRANSCODE_CHUNK_CHARS, hasher=None):
+    """transcode_chunks в out. Возвращает (байт записано, строк)"""
+    written = rows = 0
+    for data, n in transcode_chunks(file_name, start, end, chunk_chars, hasher):
+        out.write(data)
+        written += len(data)
+        rows += n
+    return written, rows
+
+class ChunkReader(io.RawIOBase):
+    """Генератор байтовых кусков как файл для чтения: pandas разбирает поток без копии на диске"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def compression_for(size, codec=None):
+    """Кодек для новой части файла размером size байт; None — грузить несжатой"""
+    codec = codec or INGEST_COMPRESSION
+    if codec == "none" or size < COMPRESS_MIN_BYTES:
+        return None
+    if codec not in CODECS:
+        raise ValueError(f"Unknown INGEST_COMPRESSION={codec!r}: expected one of none, {', '.join(CODECS)}")
+    return codec
+
+class PartWriter:
+    """Приёмник transcode_stream: без кодека — один prefix.csv, с кодеком — сжатые части
+    prefix.part-NNNNN.gz/.bz2, разрезанные по границам строк. Часть появляется под
+    своим именем только дописанной целиком"""
+
+    def __init__(self, prefix, codec=None, part_bytes=COMPRESS_PART_BYTES):
+        self.prefix = prefix
+        self.codec = codec
+        self.part_bytes = part_bytes if codec else float("inf")
+        self.paths = []
+        self.out = None
+        self.size = 0
+
+    def _open(self):
+        if self.codec:
+            opener, ext, kwargs = CODECS[self.codec]
+            path = f"{self.prefix}.part-{len(self.paths):05d}{ext}"
+            self.out = opener(path + ".tmp", "wb", **kwargs)
+        else:
+            path = self.prefix + ".csv"
+            self.out = open(path + ".tmp", "wb")
+        self.paths.append(path)
+        self.size = 0
+
+    def _close(self):
+        self.out.close()
+        os.replace(self.paths[-1] + ".tmp", self.paths[-1])
+        self.out = None
+
+    def write(self, data):
+        while data:
+            if self.out is None:
+                self._open()
+            over = self.size + len(data) - self.part_bytes
+            # Часть закрывается на первом конце строки после лимита
+            cut = data.find(b"\n", len(data) - over) + 1 if over > 0 else 0
+            if not cut:
+                self.out.write(data)
+                self.size += len(data)
+                return
+            self.out.write(data[:cut])
+            self._close()
+            data = data[cut:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.out is not None:
+            if exc_type is None:
+                self._close()
+            else:
+                self.out.close()
+        return False
+
+def load_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return {"next_batch": 1, "hive_batch": 0, "hive_batches": [], "files": {}}
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if "hive_batches" not in manifest:
+        # Манифест без списка партиций Hive: зарегистрировано всё до hive_batch и ещё не снятые DROP
+        registered = {b for b in loaded_batches(manifest) if b[1] <= manifest["hive_batch"]}
+        registered |= {tuple(d) for d in manifest.pop("pending_drops", [])}
+        manifest["hive_batches"] = [list(b) for b in sorted(registered)]
+    return manifest
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def plan_ingest(file_name, kind, entry):
+    """Что грузить: ("skip",) | ("append", start, end, hasher) | ("full", start, end, hasher)"""
+    stat = os.stat(file_name)
+    if entry and entry.get("kind") == kind and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return ("skip",)
+    end = last_line_end(file_name, stat.st_size) if kind == "csv" else stat.st_size
+    hasher = hashlib.sha256()
+    if entry and entry.get("kind") == kind and 0 < entry["offset"] <= end:
+        for raw in read_range(file_name, 0, entry["offset"]):
+            hasher.update(raw)
+        if hasher.hexdigest() == entry["sha256"]:
+            if entry["offset"] == end:
+                return ("skip",)
+            # Старая часть не изменилась — дописываем только хвост (CSV)
+            if kind == "csv":
+                return ("append", entry["offset"], end, hasher)
+        hasher = hashlib.sha256()
+    start = header_end(file_name) if kind == "csv" else 0
+    for raw in read_range(file_name, 0, start):
+        hasher.update(raw)  # хэш всегда считается от начала файла, включая заголовок
+    return ("full", start, end, hasher)
+
+def batch_path(kind, batch):
+    root = HDFS_DATA_PATH if kind == "csv" else HDFS_PARQUET_PATH
+    return f"{root}/batch={batch}"
+
+# --- Операции с HDFS: при HIVE_BACKEND=local — те же пути в локальном каталоге ---
+
+def local_hdfs_path(path):
+    return os.path.join(LOCAL_HDFS_ROOT, path.lstrip("/"))
+
+def hdfs_mkdir(*paths):
+    if HIVE_BACKEND == "local":
+        for path in paths:
+            os.makedirs(local_hdfs_path(path), exist_ok=True)
+    else:
+        run_cmd(f"hdfs dfs -mkdir -p {' '.join(paths)}")
+
+def hdfs_remove(path):
+    if HIVE_BACKEND == "local":
+        shutil.rmtree(local_hdfs_path(path), ignore_errors=True)
+    else:
+        run_cmd(f"hdfs dfs -rm -r -f {path}")
+
+def hdfs_put(file_name, dest):
+    if HIVE_BACKEND == "local":
+        shutil.copyfile(file_name, local_hdfs_path(dest))
+    else:
+        run_cmd(f"hdfs dfs -put -f {file_name} {dest}")
+
+def hdfs_put_stream(write, dest):
+    """write(out) пишет содержимое dest: в HDFS через `hdfs dfs -put -f -`, без временного файла"""
+    if HIVE_BACKEND == "local":
+        with open(local_hdfs_path(dest), "wb") as out:
+            return write(out)
+    proc = subprocess.Popen(["hdfs", "dfs", "-put", "-f", "-", dest], stdin=subprocess.PIPE)
+    try:
+        result = write(proc.stdin)
+    except BrokenPipeError:
+        result = None  # hdfs завершился раньше времени — ошибка по коду возврата ниже
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            proc.stdin.close()
+        proc.wait()
+    if proc.returncode != 0 or result is None:
+        raise RuntimeError(f"hdfs dfs -put -f - {dest} failed with exit code {proc.returncode}")
+    return result
+
+def drop_batch_sketches(batch):
+    hdfs_remove(f"{HDFS_SKETCH_PATH}/batch={batch}")
+    shutil.rmtree(sketches.batch_sketch_dir(batch), ignore_errors=True)
+
+def upload_file(file_name, dest):
+    """hdfs dfs -put готового файла (CSV перекодирован заранее, Parquet — как есть)"""
+    log(f"Uploading {file_name} to {dest}...", "CYAN")
+    started = time.time()
+    size = os.path.getsize(file_name)
+    with metrics.timer("hdfs_upload", nbytes=size, file=dest):
+        hdfs_put(file_name, dest)
+    elapsed = time.time() - started
+    log(f"{file_name}: {size / 1e6:.1f} MB in {elapsed:.1f}s ({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)", "GREEN")
+
+def upload_csv_stream(job, dest):
+    """Несжатый CSV: перекодировка прямо в HDFS. Хэш сверяется с prepare() — файл не менялся"""
+    file_name = job["file"]
+    log(f"Streaming {file_name} [{job['start']}:{job['end']}] to {dest}...", "CYAN")
+    hasher = hashlib.sha256()
+    if job["start"] > 0:
+        for raw in read_range(file_name, 0, job["start"]):
+            hasher.update(raw)
+    with metrics.timer("hdfs_upload", nbytes=job["end"] - job["start"], file=dest, streamed=True) as span:
+        written, _ = hdfs_put_stream(lambda out: transcode_stream(file_name, out, job["start"], job["end"],
+                                                                  hasher=hasher), dest)
+        span["utf8_bytes"] = written
+    if hasher.hexdigest() != job["sha256"]:
+        raise RuntimeError(f"{file_name} changed while ingesting: rerun to pick up the new content")
+
+def partition_statements(new_batches, dropped_batches):
+    """HiveQL: добавить новые партиции и убрать устаревшие (без DROP TABLE)"""
+    tables = {"csv": "drone_db.events", "parquet": "drone_db.events_parquet"}
+    stmts = []
+    for kind, b in dropped_batches:
+        stmts.append(f"ALTER TABLE {tables[kind]} DROP IF EXISTS PARTITION (batch={b});")
+        stmts.append(f"ALTER TABLE drone_db.events_store DROP IF EXISTS PARTITION (batch={b});")
+        stmts.append(f"ALTER TABLE drone_db.drone_summary DROP IF EXISTS PARTITION (batch={b});")
+    stmts += [f"ALTER TABLE {tables[kind]} ADD IF NOT EXISTS PARTITION (batch={b}) "
+              f"LOCATION '{batch_path(kind, b)}';" for kind, b in new_batches]
+    return stmts
+
+def loaded_batches(manifest):
+    """Партиции (вид, batch), которые по манифесту лежат в HDFS"""
+    return {(entry["kind"], b) for entry in manifest["files"].values() for b in entry["batches"]}
+
+def pending_partitions(manifest):
+    """Расхождение HDFS и Hive: ADD — загружено, но не зарегистрировано, DROP — наоборот.
+    Считается заново из манифеста, поэтому упавший после загрузки прогон доберёт партиции"""
+    loaded = loaded_batches(manifest)
+    registered = {tuple(b) for b in manifest["hive_batches"]}
+    return sorted(loaded - registered), sorted(registered - loaded)
+
+class Ingestor:
+    """Инкрементальная загрузка по манифесту: новые данные уходят в новые партиции batch=N.
+    prepare() — только локальная работа (хэш, перекодировка и скетч в STAGING_DIR), upload() — HDFS.
+    Несжатый CSV без INGEST_STAGING=1 перекодируется в upload() прямо в HDFS, prepare() — хэш и скетч"""
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.lock = threading.Lock()
+        self.new_batches = []
+        self.dropped_batches = []
+
+    def _allocate_batch(self, kind):
+        with self.lock:
+            batch = self.manifest["next_batch"]
+            self.manifest["next_batch"] += 1
+            self.new_batches.append((kind, batch))
+            return batch
+
+    def prepare(self, file_name, kind):
+        """Задание на загрузку (JSON) или None, если файл не изменился"""
+        plan = plan_ingest(file_name, kind, self.manifest["files"].get(file_name))
+        if plan[0] == "skip":
+            log(f"{file_name}: unchanged, skipping", "GREEN")
+            return None
+        action, start, end, hasher = plan
+        job = {"file": file_name, "kind": kind, "action": action, "start": start, "end": end, "rows": None}
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        codec = compression_for(end - start) if kind == "csv" else None
+        if kind == "csv" and not codec and not STAGE_PLAIN_CSV:
+            # Без копии на диске: хэш и скетч — из потока перекодировки, сама загрузка — в upload()
+            def counted():
+                for data, n in transcode_chunks(file_name, start, end, hasher=hasher):
+                    job["rows"] += n
+                    yield data
+            job.update(rows=0, stream=file_name)
+            parts, source = [], io.BufferedReader(ChunkReader(counted()))
+        elif kind == "csv":
+            # Перекодировка (и сжатие) идёт, пока кластер ещё поднимается; хэш считается в том же проходе
+            prefix = os.path.join(STAGING_DIR, f"{file_name}.{start}-{end}")
+            log(f"Transcoding {file_name} [{start}:{end}] -> {prefix} ({codec or 'plain text'})...", "CYAN")
+            with metrics.timer("transcode", nbytes=end - start, file=file_name, codec=codec or "none") as span:
+                with PartWriter(prefix, codec) as out:
+                    written, job["rows"] = transcode_stream(file_name, out, start, end, hasher=hasher)
+                span.update(rows=job["rows"], out_bytes=sum(os.path.getsize(p) for p in out.paths),
+                            utf8_bytes=written)
+            # [локальный файл, имя в партиции]: по расширению .gz/.bz2 Hive сам выбирает кодек
+            parts = [[path, file_name + path[len(prefix):] if codec else file_name] for path in out.paths]
+            source = [path for path, _ in parts]
+        else:
+            parts = [[file_name, file_name]]
+            source = [file_name]
+            with metrics.timer("hash", nbytes=end - start, file=file_name):
+                for raw in read_range(file_name, start, end):
+                    hasher.update(raw)
+        # Скетч только новой части: партия batch=N получит свой, запросы сливают их
+        sketch = os.path.join(STAGING_DIR, f"{file_name}.{start}-{end}.sketch.npz")
+        with metrics.timer("sketch_build", file=file_name) as span:
+            sketches.sketch_file(source, names=csv_columns(file_name) if kind == "csv" else None).save(sketch)
+            span["rows"] = job["rows"]
+        stat = os.stat(file_name)
+        job.update(parts=parts, sketch=sketch, sha256=hasher.hexdigest(), size=stat.st_size, mtime=stat.st_mtime)
+        return job
+
+    def upload(self, job):
+        file_name = job["file"]
+        entry = self.manifest["files"].get(file_name)
+        if entry and entry["offset"] == job["end"] and entry["sha256"] == job["sha256"]:
+            log(f"{file_name}: already uploaded", "GREEN")  # продолжение после сбоя
+            return
+        if job["action"] == "full" and entry:
+            # Файл переписан целиком — старые партиции этого файла больше не актуальны
+            log(f"{file_name}: content changed, reloading", "YELLOW")
+            for batch in entry["batches"]:
+                hdfs_remove(batch_path(entry["kind"], batch))
+                drop_batch_sketches(batch)
+            # DROP PARTITION стадия hive выведет сама: этих партий больше нет в манифесте
+            with self.lock:
+                self.dropped_batches += [(entry["kind"], b) for b in entry["batches"]]
+            entry = None
+        batch = self._allocate_batch(job["kind"])
+        dest_dir = batch_path(job["kind"], batch)
+        hdfs_mkdir(dest_dir)
+        for path, name in job["parts"]:
+            upload_file(path, f"{dest_dir}/{name}")
+        if job.get("stream"):
+            upload_csv_stream(job, f"{dest_dir}/{job['stream']}")
+        hdfs_mkdir(f"{HDFS_SKETCH_PATH}/batch={batch}")
+        hdfs_put(job["sketch"], f"{HDFS_SKETCH_PATH}/batch={batch}/{file_name}.npz")
+        # Копия, а не перенос: при повторе после сбоя staging-скетч ещё понадобится
+        local_sketch = sketches.batch_sketch_path(batch, file_name)
+        os.makedirs(os.path.dirname(local_sketch), exist_ok=True)
+        shutil.copyfile(job["sketch"], local_sketch)
+        rows = job["rows"]
+        with self.lock:
+            self.manifest["files"][file_name] = {
+                "kind": job["kind"],
+                "size": job["size"],
+                "mtime": job["mtime"],
+                "offset": job["end"],
+                "sha256": job["sha256"],
+                "rows": (entry["rows"] if entry else 0) + rows if rows is not None else None,
+                "batches": (entry["batches"] if entry else []) + [batch],
+            }
+            save_manifest(self.manifest)
+
+    def ingest(self, file_name, kind):
+        job = self.prepare(file_name, kind)
+        if job:
+            self.upload(job)
+
+    def partition_statements(self):
+        return partition_statements(self.new_batches, self.dropped_batches)
+
+def render_hive_script(partition_stmts):
+    """init_hive.sql с подставленными ALTER TABLE ... PARTITION вместо маркера"""
+    with open(HIVE_SCRIPT_NAME, encoding="utf-8") as f:
+        script = f.read()
+    return script.replace(PARTITIONS_MARKER, "\n".join(partition_stmts))
+
+def parallel(func, items, label=lambda item: item[0], workers=UPLOAD_WORKERS):
+    """func по элементам в пуле потоков; ошибка любого — исключение после завершения остальных"""
+    if not items:
+        return []
+    results, errors = [], []
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        futures = {pool.submit(func, *item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                log(f"Error processing {label(futures[future])}: {e}", "RED")
+                errors.append(e)
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(items)} files failed")
+    return results
+
+def wait_for_service(name, check_func, timeout=PROBE_TIMEOUT_SEC):
+    """Опрос с экспоненциальной паузой: быстро ловит готовый сервис, не долбит поднимающийся"""
     log(f"Waiting for {name}...", "CYAN")
-    for i in range(1, max_retries + 1):
+    delay, factor, max_delay = PROBE_BACKOFF
+    deadline = time.time() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
         if check_func():
             log(f"{name} is ready!", "GREEN")
-            return True
-        print(f"Attempt {i}/{max_retries}: Waiting...")
-        time.sleep(5)
-    log(f"{name} failed to start.", "RED")
-    sys.exit(1)
+            metrics.count("probe_attempts", attempt, service=name)
+            return {"attempts": attempt}
+        if time.time() + delay > deadline:
+            raise RuntimeError(f"{name} failed to start within {timeout}s")
+        print(f"{name}: attempt {attempt}, next check in {delay:.1f}s")
+        time.sleep(delay)
+        delay = min(delay * factor, max_delay)
 
-def main():
-    # 0. Проверка наличия данных ВНУТРИ контейнера
-    for f in CSV_FILES + [HIVE_SCRIPT_NAME]:
-        if not os.path.exists(f):
-            log(f"ERROR: File '{f}' not found inside container!", "RED")
-            log("Did you allow time for copy? Run: docker cp local_file spark_master:/path", "YELLOW")
-            sys.exit(1)
+# ===================================================================
+#  DAG стадий: стадия стартует, как только готовы её зависимости
+# ===================================================================
 
-    # 1. ОЖИДАНИЕ СЕРВИСОВ
-    wait_for_service("HDFS", check_hdfs_safemode)
-    wait_for_service("Hive", check_hive_port)
+class Stage:
+    def __init__(self, name, func, deps=(), checkpoint=True):
+        self.name = name
+        self.func = func          # func(ctx, results) → JSON-результат
+        self.deps = list(deps)
+        self.checkpoint = checkpoint  # пробы кластера не отмечаются — его состояние живое
 
-    # 2. ПОДГОТОВКА HDFS (Прямые команды)
-    log("Preparing HDFS directories...", "CYAN")
-    # Используем || true, чтобы не падать, если папка уже есть
-    run_cmd(f"hdfs dfs -mkdir -p {HDFS_DATA_PATH} /user/hive/warehouse /tmp")
-    run_cmd("hdfs dfs -chmod g+w /user/hive/warehouse /tmp")
+def run_fingerprint(files):
+    """Входные файлы, скрипт Hive и настройки: изменилось что-то — отметки стадий недействительны"""
+    h = hashlib.sha256(f"{HIVE_BACKEND}|{','.join(EXPORT_FORMATS)}|{EXPORT_LIMIT}|{INGEST_COMPRESSION}\n".encode())
+    for f in files:
+        stat = os.stat(f)
+        h.update(f"{f}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+def load_state(fingerprint, path=STATE_FILE):
+    if not RESTART and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("fingerprint") == fingerprint:
+            return state
+    return {"fingerprint": fingerprint, "stages": {}}
+
+def save_state(state, path=STATE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def stage_done(stage, record):
+    """Отметка действительна, если результаты стадии (файлы outputs) на месте"""
+    if not stage.checkpoint or record is None:
+        return False
+    result = record["result"] if isinstance(record["result"], dict) else {}
+    return all(os.path.exists(p) for p in result.get("outputs", []))
 
-    # 3. ЗАГРУЗКА ДАННЫХ
-    for file_name in CSV_FILES:
-        log(f"Processing {file_name}...", "YELLOW")
-        
-        # Конвертация кодировки (Windows-1251 -> UTF-8 без BOM)
-        # Мы делаем это прямо здесь, создавая временный файл
-        tmp_file = f"ready_{file_name}"
+def run_stages(stages, ctx, state):
+    """Выполняет незавершённые стадии и нужные им зависимости.
+    Возвращает (результаты, замеры, (стадия, ошибка) или None)"""
+    stages = {s.name: s for s in stages}
+    results = {name: state["stages"][name]["result"] for name, stage in stages.items()
+               if stage_done(stage, state["stages"].get(name))}
+    todo = set()
+
+    def need(name):
+        if name in results or name in todo:
+            return
+        todo.add(name)
+        for dep in stages[name].deps:
+            need(dep)
+
+    for name, stage in stages.items():
+        if stage.checkpoint:
+            need(name)
+
+    run_started = time.time()
+    timings = [{"stage": name, "status": "reused", "start_sec": 0.0, "seconds": 0.0}
+               for name in stages if name in results]
+
+    def timed(stage):
+        started = time.time()
         try:
-            with open(file_name, "r", encoding="cp1251") as f_in:
-                lines = f_in.readlines()
-            
-            content = lines[1:] if len(lines) > 1 else [] # Skip header
-            
-            with open(tmp_file, "w", encoding="utf-8", newline='\n') as f_out:
-                f_out.writelines(content)
-            
-            # Загрузка в HDFS (напрямую)
-            log(f"Uploading {file_name} to HDFS...", "CYAN")
-            run_cmd(f"hdfs dfs -put -f {tmp_file} {HDFS_DATA_PATH}/{file_name}")
-            os.remove(tmp_file)
-            
+            return True, stage.func(ctx, results), started
         except Exception as e:
-            log(f"Error processing {file_name}: {e}", "RED")
+            return False, e, started
+
+    failed = None
+    pending, running = set(todo), {}
+    with ThreadPoolExecutor(max_workers=max(len(todo), 1)) as pool:
+        while pending or running:
+            if failed is None:
+                for name in sorted(n for n in pending if all(d in results for d in stages[n].deps)):
+                    pending.discard(name)
+                    running[pool.submit(timed, stages[name])] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                ok, result, started = future.result()
+                seconds = time.time() - started
+                timings.append({"stage": name, "status": "done" if ok else "failed",
+                                "start_sec": round(started - run_started, 3), "seconds": round(seconds, 3)})
+                metrics.timing("stage", seconds, stage=name, status="ok" if ok else "error")
+                if not ok:
+                    log(f"Stage {name} failed after {seconds:.1f}s: {result}", "RED")
+                    failed = failed or (name, result)
+                    continue
+                log(f"Stage {name} done in {seconds:.1f}s", "GREEN")
+                results[name] = result
+                if stages[name].checkpoint:
+                    state["stages"][name] = {"result": result, "seconds": round(seconds, 3)}
+                    save_state(state)
+    # При сбое зависимые стадии не запускались; готовые отмечены — повторный запуск продолжит отсюда
+    return results, timings, failed
 
-    # 4. HIVE (Через beeline, подключение к удаленному хосту)
+def save_timings(timings, run_id, path=TIMINGS_FILE):
+    """Дописать замеры прогона в CSV: run_id, stage, status, start_sec, seconds"""
+    new_file = not os.path.exists(path)
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["run_id", "stage", "status", "start_sec", "seconds"])
+        if new_file:
+            writer.writeheader()
+        for t in timings:
+            writer.writerow({"run_id": run_id, **t})
+
+def print_timings(timings):
+    for t in sorted(timings, key=lambda t: (t["start_sec"], t["stage"])):
+        end = t["start_sec"] + t["seconds"]
+        log(f"  {t['stage']:<14} {t['status']:<7} {t['start_sec']:8.1f}s -> {end:8.1f}s ({t['seconds']:.1f}s)")
+
+# --- Стадии ---
+
+def hive_connection(ctx):
+    """Одно подключение на прогон; создаётся первой стадией, которой нужен Hive"""
+    with ctx["lock"]:
+        if ctx.get("client") is None:
+            if HIVE_BACKEND == "local":
+                ctx["client"] = hive_client.connect("local", path=LOCAL_HIVE_DB, hdfs_root=LOCAL_HDFS_ROOT,
+                                                    metrics=metrics)
+            else:
+                ctx["client"] = hive_client.connect("hive", host=HIVE_HOST, port=10000, username="root",
+                                                    metrics=metrics)
+        return ctx["client"]
+
+def stage_transcode(ctx, results):
+    """Локальная подготовка файлов — параллельно с ожиданием кластера"""
+    ingestor = Ingestor(ctx["manifest"])  # prepare() манифест только читает
+    jobs = parallel(ingestor.prepare, [(f, "csv") for f in ctx["csv_files"]] +
+                    [(f, "parquet") for f in ctx["parquet_files"]])
+    return {"jobs": [job for job in jobs if job]}
+
+def stage_hdfs_dirs(ctx, results):
+    log("Preparing HDFS directories...", "CYAN")
+    run_cmd(f"hdfs dfs -mkdir -p {HDFS_DATA_PATH} {HDFS_PARQUET_PATH} {HDFS_SKETCH_PATH} /user/hive/warehouse /tmp")
+    run_cmd("hdfs dfs -chmod g+w /user/hive/warehouse /tmp")
+
+def stage_upload(ctx, results):
+    ingestor = Ingestor(ctx["manifest"])
+    parallel(ingestor.upload, [(job,) for job in results["transcode"]["jobs"]], label=lambda item: item[0]["file"])
+    return {"new_batches": ingestor.new_batches, "dropped_batches": ingestor.dropped_batches}
+
+def split_hive_script(script):
+    """До REPORT_MARKER — построение таблиц и drone_report, после — контрольные выборки"""
+    build, _, checks = script.partition(REPORT_MARKER)
+    return build, checks
+
+def stage_hive(ctx, results):
+    manifest = ctx["manifest"]
+    new, dropped = pending_partitions(manifest)
+    if not (new or dropped or manifest["hive_batch"] != manifest["next_batch"] - 1):
+        log("No new data since last run, Hive tables are up to date", "GREEN")
+        return {"since_batch": manifest["hive_batch"]}
     log("Executing Hive Script...", "YELLOW")
-    # Обратите внимание: connect string указывает на HIVE_HOST
-    # -u jdbc:hive2://hive-server:10000
-    beeline_cmd = f"beeline -u jdbc:hive2://{HIVE_HOST}:10000 -n root --silent=true"
-    
-    run_cmd(f"{beeline_cmd} -f {HIVE_SCRIPT_NAME}")
-# 5. ЭКСПОРТ
+    # Партиции регистрируем точечно прямо в скрипте, таблицы не пересоздаются
+    build, _ = split_hive_script(render_hive_script(partition_statements(new, dropped)))
+    since = manifest["hive_batch"]
+    hive_connection(ctx).run_script(build, {"since_batch": since})
+    manifest["hive_batch"] = manifest["next_batch"] - 1
+    manifest["hive_batches"] = [list(b) for b in sorted(loaded_batches(manifest))]
+    save_manifest(manifest)
+    return {"since_batch": since}
+
+def stage_hive_checks(ctx, results):
+    """Контрольные SELECT из хвоста init_hive.sql — экспорт их не ждёт"""
+    _, checks = split_hive_script(render_hive_script([]))
+    hive_connection(ctx).run_script(checks)
+
+def stage_export(ctx, results):
+    # Потоково, пакетами; CSV сразу с BOM для Excel
     log(f"Exporting analytics to {FINAL_CSV_NAME}...", "CYAN")
     hive_query = (
-        "SET hive.cli.print.header=true; "
         "SELECT drone_id, drone_efficiency, processed_zones, "
-        "CAST(avg_battery_during_mission AS DECIMAL(5,2)), unique_zones_handled "
-        "FROM drone_db.drone_analytics LIMIT 1000"
+        "CAST(avg_battery_during_mission AS DECIMAL(5,2)) AS avg_battery_during_mission, unique_zones_handled "
+        "FROM drone_db.drone_report"
     )
-    
-    run_cmd(f"{beeline_cmd} --outputformat=csv2 -e '{hive_query}' > {FINAL_CSV_NAME}")
+    with metrics.timer("export_query", formats=",".join(EXPORT_FORMATS)) as span:
+        rows, paths = analytics_export.export_query(hive_connection(ctx), hive_query, FINAL_CSV_NAME,
+                                                    formats=EXPORT_FORMATS, limit=EXPORT_LIMIT)
+        span["rows"] = rows
+    log(f"Success! {rows} rows saved inside container at: {', '.join(paths.values())}", "GREEN")
+    # В отметку стадии — только записанные файлы, иначе stage_done не признает её выполненной
+    outputs = [p for p in paths.values() if os.path.exists(p)]
+    # Быстрые ответы по всем партиям — слияние скетчей, без прохода по событиям
+    batches = sketches.load_batches()
+    if batches:
+        with metrics.timer("sketch_merge", batches=len(batches)):
+            merged = sketches.merge_all(batches.values())
+        merged.drone_frame().round(2).to_csv(SKETCH_SUMMARY_NAME, index=False, encoding="utf-8-sig")
+        summary = merged.summary()
+        log(f"Sketches of {len(batches)} batch(es) -> {SKETCH_SUMMARY_NAME}: ~{summary['unique_drones']} drones, "
+            f"~{summary['unique_zones']} zones, battery p50 {summary['battery_p50']:.1f}", "GREEN")
+        outputs.append(SKETCH_SUMMARY_NAME)
+    return {"rows": rows, "outputs": outputs}
 
-    # 6. КОДИРОВКА ДЛЯ EXCEL (Добавляем BOM)
-    if os.path.exists(FINAL_CSV_NAME):
-        try:
-            with open(FINAL_CSV_NAME, "r", encoding="utf-8") as f:
-                content = f.read()
-            with open(FINAL_CSV_NAME, "w", encoding="utf-8-sig", newline='\n') as f:
-                f.write(content)
-            log(f"Success! Result saved inside container at: /{FINAL_CSV_NAME}", "GREEN")
-        except Exception as e:
-            log(f"Error fix encoding: {e}", "RED")
+def build_stages():
+    """HDFS/Hive ждём параллельно друг с другом и с перекодировкой; экспорт — сразу после drone_report.
+    HIVE_BACKEND=local: кластера нет — ни проб, ни каталогов HDFS, загрузка в LOCAL_HDFS_ROOT"""
+    hive_deps = ["upload"]
+    stages = [Stage("transcode", stage_transcode)]
+    if HIVE_BACKEND == "local":
+        stages.append(Stage("upload", stage_upload, ["transcode"]))
+    else:
+        stages += [
+            Stage("probe_hdfs", lambda ctx, results: wait_for_service("HDFS", check_hdfs_safemode),
+                  checkpoint=False),
+            Stage("hdfs_dirs", stage_hdfs_dirs, ["probe_hdfs"]),
+            Stage("upload", stage_upload, ["transcode", "hdfs_dirs"]),
+            Stage("probe_hive", lambda ctx, results: wait_for_service("Hive", check_hive_port), checkpoint=False),
+        ]
+        hive_deps.append("probe_hive")
+    stages += [
+        Stage("hive", stage_hive, hive_deps),
+        Stage("export", stage_export, ["hive"]),
+        # Пул HiveServer2 даёт второе соединение; у SQLite одно — проверки после экспорта
+        Stage("hive_checks", stage_hive_checks, ["hive"] if HIVE_BACKEND == "hive" else ["export"]),
+    ]
+    return stages
+
+def main():
+    # 0. Проверка наличия данных ВНУТРИ контейнера
+    csv_files = [f for f in CSV_FILES if os.path.exists(f)]
+    parquet_files = [f for f in PARQUET_FILES if os.path.exists(f)]
+    missing = [] if csv_files or parquet_files else CSV_FILES + PARQUET_FILES
+    if not os.path.exists(HIVE_SCRIPT_NAME):
+        missing.append(HIVE_SCRIPT_NAME)
+    for f in missing:
+        log(f"ERROR: File '{f}' not found inside container!", "RED")
+        log("Did you allow time for copy? Run: docker cp local_file spark_master:/path", "YELLOW")
+    if missing:
+        sys.exit(1)
+
+    state = load_state(run_fingerprint(csv_files + parquet_files + [HIVE_SCRIPT_NAME]))
+    ctx = {
+        "csv_files": csv_files,
+        "parquet_files": parquet_files,
+        "manifest": load_manifest(),
+        "lock": threading.Lock(),
+    }
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    metrics.run_id = f"start-{run_id}"
+    started = time.time()
+    try:
+        results, timings, failed = run_stages(build_stages(), ctx, state)
+    finally:
+        if ctx.get("client") is not None:
+            ctx["client"].close()
+    save_timings(timings, run_id)
+    metrics.timing("pipeline", time.time() - started, status="error" if failed else "ok")
+    metrics.peak_memory()
+    if failed:
+        print_timings(timings)
+        log(f"Stage {failed[0]} failed: {failed[1]}. Completed stages are saved in {STATE_FILE}: "
+            f"rerun to resume.", "RED")
+        sys.exit(1)
+    # Всё загружено — перекодированные копии больше не нужны
+    for job in results["transcode"]["jobs"]:
+        for path, _ in job["parts"]:
+            if path != job["file"] and os.path.exists(path):
+                os.remove(path)
+        if os.path.exists(job.get("sketch", "")):
+            os.remove(job["sketch"])
+    log(f"Pipeline finished in {time.time() - started:.1f}s (timings appended to {TIMINGS_FILE}):", "GREEN")
+    print_timings(timings)
 
 if __name__ == "__main__":
     main()
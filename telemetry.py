@@ -0,0 +1,210 @@
+"""Телеметрия конвейера: таймеры, счётчики, строки и пиковая память → JSON lines.
+
+Каждая точка входа (start.py, headless_simulation.py, train_liquidity.py, dashboard.py)
+держит свой Recorder и дописывает записи в общий TELEMETRY_FILE — по строке на замер:
+
+    {"ts": ..., "run_id": "start-20261017T120000-4242", "component": "start",
+     "metric": "transcode", "kind": "timer", "value": 3.21, "unit": "s",
+     "rows": 1000000, "bytes": 61234567, "rows_per_sec": ..., "mb_per_sec": ..., "file": ...}
+
+Дашборд строит по файлу раздел «Телеметрия» по всем прогонам. TELEMETRY=0 выключает запись.
+
+    python telemetry.py                       # сводка таймеров по компонентам и метрикам
+    python telemetry.py --component start --last 3
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: пиковой памяти процесса не будет
+    resource = None
+
+# --- ПАРАМЕТРЫ ---
+TELEMETRY_FILE = os.environ.get("TELEMETRY_FILE", "telemetry.jsonl")
+# Общий выключатель: бенчмарки гасят его, чтобы не смешивать свои прогоны с рабочими
+ENABLED = os.environ.get("TELEMETRY", "1") != "0"
+STATEMENT_CHARS = 80  # сколько символов оператора Hive попадает в тег
+
+
+def peak_rss_mb(children=False):
+    """Пиковый RSS процесса в МБ или None; children=True — с учётом завершённых
+    дочерних процессов (пулы стадий бенчмарка)"""
+    if resource is None:
+        return None
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # macOS отдаёт байты, Linux — КБ
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / scale
+
+
+def disable_by_default():
+    """Для бенчмарков: без явного TELEMETRY=1 запись выключена — в этом процессе
+    и в запущенных из него (выключатель уходит им через окружение)"""
+    global ENABLED
+    os.environ.setdefault("TELEMETRY", "0")
+    ENABLED = os.environ["TELEMETRY"] != "0"
+
+
+def statement_tag(statement):
+    """Оператор в одну строку и с обрезкой — тег для замера Hive"""
+    return " ".join(statement.split())[:STATEMENT_CHARS]
+
+
+class Recorder:
+    """Замеры одного процесса: все записи несут run_id и компонент.
+
+    Запись — одна строка через O_APPEND под блокировкой, поэтому стадии из потоков
+    start.py и параллельные процессы пишут в один файл, не перемешивая строки."""
+
+    def __init__(self, component, path=None, run_id=None):
+        self.component = component
+        self.path = path or TELEMETRY_FILE
+        self.run_id = run_id or f"{component}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def emit(self, metric, kind, value, unit, **fields):
+        if not ENABLED:
+            return
+        record = {"ts": round(time.time(), 3), "run_id": self.run_id, "component": self.component,
+                  "metric": metric, "kind": kind, "value": value, "unit": unit}
+        record.update((k, v) for k, v in fields.items() if v is not None)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def timing(self, metric, seconds, rows=None, nbytes=None, **tags):
+        """Готовый замер времени; по rows/nbytes добавляются строк/с и МБ/с"""
+        rate = max(seconds, 1e-9)
+        self.emit(metric, "timer", round(seconds, 6), "s", rows=rows, bytes=nbytes,
+                  rows_per_sec=round(rows / rate, 1) if rows is not None else None,
+                  mb_per_sec=round(nbytes / 1e6 / rate, 3) if nbytes is not None else None,
+                  peak_rss_mb=peak_rss_mb(), **tags)
+
+    @contextmanager
+    def timer(self, metric, rows=None, nbytes=None, **tags):
+        """with recorder.timer("transcode", file=f) as span: ...; span["rows"] = n
+
+        span — словарь тегов: rows/nbytes и прочее можно дописать внутри блока.
+        Исключение внутри блока даёт запись со status="error" и пробрасывается дальше."""
+        span = {"rows": rows, "nbytes": nbytes, **tags}
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield span
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.timing(metric, time.perf_counter() - started, status=status, **span)
+
+    def count(self, metric, value=1, unit="count", **tags):
+        self.emit(metric, "counter", value, unit, **tags)
+
+    def gauge(self, metric, value, unit, **tags):
+        self.emit(metric, "gauge", value, unit, **tags)
+
+    def peak_memory(self, metric="peak_rss", **tags):
+        """Пиковый RSS процесса к этому моменту"""
+        rss = peak_rss_mb()
+        if rss is not None:
+            self.gauge(metric, round(rss, 1), "MB", **tags)
+
+
+class Tail:
+    """Дописываемый файл телеметрии: каждый read() разбирает только строки, появившиеся
+    после прошлого вызова (дашборд сам дописывает замер на каждой перерисовке)"""
+
+    def __init__(self, path=TELEMETRY_FILE):
+        self.path = path
+        self.frame = pd.DataFrame()
+        self._offset = 0
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        """Кадр всех записей (битые строки пропускаются, недописанная — ждёт следующего вызова)"""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_ino != self._inode or stat.st_size < self._offset:
+                # Файл удалён, пересоздан или обрезан — читаем с начала
+                self.frame, self._offset = pd.DataFrame(), 0
+                self._inode = stat and stat.st_ino
+            if stat is None or stat.st_size == self._offset:
+                return self.frame
+            records = []
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offset += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+            if records:
+                new = pd.DataFrame.from_records(records)
+                new["time"] = pd.to_datetime(new["ts"], unit="s")
+                self.frame = new if self.frame.empty else pd.concat([self.frame, new], ignore_index=True)
+            return self.frame
+
+
+def load(path=TELEMETRY_FILE):
+    """Записи телеметрии кадром (битые и недописанные строки пропускаются)"""
+    return Tail(path).read()
+
+
+def run_totals(frame):
+    """Таймеры по прогонам: компонент × метрика → сумма секунд, число замеров, строк"""
+    timers = frame[frame["kind"] == "timer"]
+    if timers.empty:
+        return pd.DataFrame(columns=["run_id", "component", "metric", "seconds", "calls", "started"])
+    if "rows" not in timers.columns:
+        timers = timers.assign(rows=None)
+    return timers.groupby(["run_id", "component", "metric"], as_index=False).agg(
+        seconds=("value", "sum"), calls=("value", "size"), rows=("rows", "sum"), started=("time", "min"),
+    ).sort_values("started")
+
+
+def summary(frame, component=None, last=None):
+    """Среднее по прогонам: сколько секунд метрика занимает в одном прогоне компонента"""
+    totals = run_totals(frame)
+    if component:
+        totals = totals[totals["component"] == component]
+    if last:
+        runs = totals.drop_duplicates("run_id")["run_id"].tail(last)
+        totals = totals[totals["run_id"].isin(runs)]
+    return totals.groupby(["component", "metric"]).agg(
+        runs=("run_id", "nunique"), calls=("calls", "sum"), sec_per_run=("seconds", "mean"),
+        sec_max=("seconds", "max"),
+    ).sort_values("sec_per_run", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=TELEMETRY_FILE)
+    parser.add_argument("--component", default=None, help="только этот компонент (start, simulation, ...)")
+    parser.add_argument("--last", type=int, default=None, help="только последние N прогонов")
+    args = parser.parse_args()
+
+    frame = load(args.file)
+    if frame.empty:
+        raise SystemExit(f"{args.file}: no telemetry yet")
+    print(summary(frame, args.component, args.last).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
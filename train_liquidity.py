@@ -1,123 +1,308 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, when, count, avg, lit, unix_timestamp
+from pyspark.sql.functions import col, when, count, avg, lit, unix_timestamp, pandas_udf
+from pyspark.sql.functions import min as spark_min, sum as spark_sum, struct, expr
 from pyspark.ml.feature import VectorAssembler, StringIndexer, OneHotEncoder
 from pyspark.ml.classification import RandomForestClassifier
 from pyspark.ml.evaluation import MulticlassClassificationEvaluator
-from pyspark.ml import Pipeline
+from pyspark.ml import Pipeline, PipelineModel
+from pyspark import StorageLevel
+import hashlib
+import os
 import sys
+import time
+from contextlib import contextmanager
 
-# Инициализация Spark
-spark = SparkSession.builder \
-    .appName("DroneSwarmAnalysis") \
-    .config("spark.sql.warehouse.dir", "hdfs://namenode:9000/user/hive/warehouse") \
-    .config("hive.metastore.uris", "thrift://hive-metastore:9083") \
-    .enableHiveSupport() \
-    .getOrCreate()
+import pandas as pd
 
-print(">>> Loading drone events from Hive...")
-# Читаем все события из Hive
-df = spark.sql("SELECT * FROM drone_db.events")
+import enrichment
+import forest_export
+import telemetry
+import zone_lifecycle
 
-# Удаляем строки с пропусками
-df = df.na.drop()
+# Таблица-источник: drone_db.events_store (ORC, партиции batch/mode/event_type) —
+# сырые drone_db.events / drone_db.events_parquet тоже подходят
+EVENTS_TABLE = os.environ.get("EVENTS_TABLE", "drone_db.events_store")
+# Признаки и модели версионируются отпечатком входа: <root>/<fingerprint>
+FEATURES_ROOT = os.environ.get("FEATURES_ROOT", "hdfs://namenode:9000/user/drone/features")
+MODELS_ROOT = os.environ.get("MODELS_ROOT", "hdfs://namenode:9000/user/drone/models")
+FORCE_RETRAIN = os.environ.get("FORCE_RETRAIN") == "1"
+# Лес в массивах NumPy для scoring_service.py (локальный файл на драйвере)
+FOREST_FILE = os.environ.get("FOREST_FILE", "drone_forest.npz")
+# Меняется при изменении признаков или модели — старые версии не переиспользуются
+FEATURE_VERSION = "2"
 
-print(">>> Original schema:")
-df.printSchema()
-print(">>> Sample data:")
-df.show(5)
+EVENT_COLUMNS = ["timestamp", "event_type", "drone_id", "zone_id", "x", "y", "battery", "state", "mode",
+                 "mission_time"]
+FEATURE_COLUMNS = ["drone_id", "zone_id", "x", "y", "battery", "state_index", "mode_index", "mission_time",
+                   "dist_to_center", "priority_index"]
 
-# 1. FEATURE ENGINEERING
+# Время шагов обучения и число Spark-задач под каждым → telemetry.TELEMETRY_FILE
+metrics = telemetry.Recorder("training")
 
-# Преобразуем event_type в числовой признак (label для классификации)
-indexer_event = StringIndexer(inputCol="event_type", outputCol="label")
-df_indexed = indexer_event.fit(df).transform(df)
 
-# Добавим категориальные признаки: state, mode
-indexer_state = StringIndexer(inputCol="state", outputCol="state_index")
-df_indexed = indexer_state.fit(df_indexed).transform(df_indexed)
+def create_spark(master=None):
+    builder = SparkSession.builder.appName("DroneSwarmAnalysis")
+    if master:
+        builder = builder.master(master)
+    else:
+        builder = builder \
+            .config("spark.sql.warehouse.dir", "hdfs://namenode:9000/user/hive/warehouse") \
+            .config("hive.metastore.uris", "thrift://hive-metastore:9083") \
+            .enableHiveSupport()
+    spark = builder \
+        .config("spark.sql.hive.convertMetastoreOrc", "true") \
+        .config("spark.sql.orc.filterPushdown", "true") \
+        .config("spark.sql.adaptive.enabled", "true") \
+        .config("spark.sql.adaptive.skewJoin.enabled", "true") \
+        .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
+        .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
+        .getOrCreate()
+    # Правила обогащения — те же, что в дашборде и init_hive.sql; модуль уезжает на экзекьюторы
+    spark.sparkContext.addPyFile(enrichment.__file__)
+    return spark
 
-indexer_mode = StringIndexer(inputCol="mode", outputCol="mode_index")
-df_indexed = indexer_mode.fit(df_indexed).transform(df_indexed)
 
-# Кодируем категориальные переменные (One-Hot не обязателен для деревьев, но можно)
-# encoder = OneHotEncoder(inputCols=["state_index", "mode_index"], outputCols=["state_vec", "mode_vec"])
+# Векторные UDF: Arrow отдаёт колонки пакетами, enrichment считает их в NumPy
+@pandas_udf("double")
+def dist_to_center_udf(x: pd.Series, y: pd.Series) -> pd.Series:
+    return pd.Series(enrichment.distance_to_center(x, y))
 
-# Собираем числовые признаки
-assembler = VectorAssembler(
-    inputCols=[
+
+@pandas_udf("string")
+def zone_priority_udf(x: pd.Series, y: pd.Series) -> pd.Series:
+    return pd.Series(enrichment.zone_priority_class(x, y))
+
+
+@pandas_udf("string")
+def battery_status_udf(battery: pd.Series) -> pd.Series:
+    return pd.Series(enrichment.battery_status(battery))
+
+
+@contextmanager
+def spark_stage(spark, name, **tags):
+    """Шаг драйвера в телеметрию: время и сколько Spark jobs/stages запущено под его группой"""
+    sc = spark.sparkContext
+    sc.setJobGroup(name, name)
+    with metrics.timer("spark_stage", stage=name, **tags) as span:
+        yield span
+        tracker = sc.statusTracker()
+        jobs = [tracker.getJobInfo(j) for j in tracker.getJobIdsForGroup(name)]
+        span["spark_jobs"] = len(jobs)
+        span["spark_stages"] = sum(len(job.stageIds) for job in jobs if job is not None)
+
+
+def hadoop_path(spark, path):
+    jvm = spark.sparkContext._jvm
+    p = jvm.org.apache.hadoop.fs.Path(path)
+    return p, p.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+
+
+def path_exists(spark, path):
+    p, fs = hadoop_path(spark, path)
+    return fs.exists(p)
+
+
+def replace_path(spark, src, dst):
+    """Переименовать готовый каталог на место dst (старый dst удаляется)"""
+    (s, fs), (d, _) = hadoop_path(spark, src), hadoop_path(spark, dst)
+    if fs.exists(d):
+        fs.delete(d, True)
+    if not fs.rename(s, d):
+        raise IOError(f"cannot rename {src} -> {dst}")
+
+
+def input_fingerprint(spark, df):
+    """Отпечаток входа: файлы партиций с размером и временем изменения + версия признаков"""
+    h = hashlib.sha256(f"{EVENTS_TABLE}|{FEATURE_VERSION}\n".encode())
+    for f in sorted(df.inputFiles()):
+        p, fs = hadoop_path(spark, f)
+        status = fs.getFileStatus(p)
+        h.update(f"{f}|{status.getLen()}|{status.getModificationTime()}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def build_features(df):
+    """Чистка и обогащение: расстояние до центра, приоритет зоны, состояние батареи"""
+    return df.na.drop() \
+        .withColumn("dist_to_center", dist_to_center_udf("x", "y")) \
+        .withColumn("zone_priority_class", zone_priority_udf("x", "y")) \
+        .withColumn("battery_status", battery_status_udf("battery"))
+
+
+def load_features(spark, df, path):
+    """Признаки из Parquet-кеша; нет кеша — считаем и пишем.
+    Чтение обратно из Parquet обрезает lineage (checkpoint) — UDF не пересчитываются.
+    Кеш готов только с маркером _SUCCESS: каталог упавшей записи пересчитывается"""
+    if not path_exists(spark, f"{path}/_SUCCESS"):
+        print(f">>> Building features -> {path}")
+        build_features(df).write.mode("overwrite").parquet(path)
+    else:
+        print(f">>> Reusing features from {path}")
+    return spark.read.parquet(path).persist(StorageLevel.MEMORY_AND_DISK)
+
+
+def build_pipeline():
+    """Один Pipeline: все индексаторы одним StringIndexer (один проход), сборка вектора, лес"""
+    indexer = StringIndexer(
+        inputCols=["event_type", "state", "mode", "zone_priority_class"],
+        outputCols=["label", "state_index", "mode_index", "priority_index"],
+    )
+    assembler = VectorAssembler(inputCols=FEATURE_COLUMNS, outputCol="features")
+    # Random Forest (лучше для категориальных данных и интерпретируемости)
+    rf = RandomForestClassifier(
+        labelCol="label",
+        featuresCol="features",
+        numTrees=50,
+        maxDepth=10,
+        seed=42
+    )
+    return Pipeline(stages=[indexer, assembler, rf])
+
+
+def load_or_train(train_data, path):
+    """Сохранённая PipelineModel для этой версии входа или обучение и сохранение новой"""
+    spark = train_data.sparkSession
+    if not FORCE_RETRAIN and path_exists(spark, path):
+        print(f">>> Reusing model from {path}")
+        return PipelineModel.load(path)
+    print(">>> Training Random Forest classifier to predict event_type...")
+    model = build_pipeline().fit(train_data)
+    # metadata/ пишется раньше стадий, поэтому сохраняем рядом и подменяем каталог целиком
+    tmp = f"{path}._tmp"
+    model.write().overwrite().save(tmp)
+    replace_path(spark, tmp, path)
+    print(f">>> Model saved to {path}")
+    return model
+
+
+def zone_lifecycle_batch(features):
+    """Жизненный цикл зон одним groupBy по zone_id вместо join claimed × processed:
+    частичная агрегация схлопывает события зоны до shuffle, дальше — одна строка на зону.
+    Возвращает (перцентили задержек по стадиям, производительность дронов) как pandas"""
+    def first_at(event_type):
+        return spark_min(when(col("event_type") == event_type, col("timestamp")))
+
+    zones = features.filter(col("zone_id") >= 0).groupBy("zone_id").agg(
+        first_at(zone_lifecycle.DISCOVERED).alias("discovered_at"),
+        first_at(zone_lifecycle.CLAIMED).alias("claimed_at"),
+        first_at(zone_lifecycle.PROCESSED).alias("processed_at"),
+        # Дрон самого раннего взятия: min по (timestamp, drone_id)
+        spark_min(when(col("event_type") == zone_lifecycle.CLAIMED, struct("timestamp", "drone_id")))
+        .getField("drone_id").alias("drone_id"),
+    ).select(
         "drone_id",
-        "zone_id",
-        "x",
-        "y",
-        "battery",
-        "state_index",
-        "mode_index",
-        "mission_time"
-    ],
-    outputCol="features"
-)
-data = assembler.transform(df_indexed)
-
-# Разделим данные
-train_data, test_data = data.randomSplit([0.8, 0.2], seed=42)
-
-# 2. МОДЕЛЬ: Random Forest (лучше для категориальных данных и интерпретируемости)
-print(">>> Training Random Forest classifier to predict event_type...")
-rf = RandomForestClassifier(
-    labelCol="label",
-    featuresCol="features",
-    numTrees=50,
-    maxDepth=10,
-    seed=42
-)
-
-model = rf.fit(train_data)
-
-# 3. ОЦЕНКА ТОЧНОСТИ
-result = model.transform(test_data)
-evaluator = MulticlassClassificationEvaluator(
-    labelCol="label",
-    predictionCol="prediction",
-    metricName="accuracy"
-)
-accuracy = evaluator.evaluate(result)
-print(f">>> Model Accuracy (predicting event_type): {accuracy:.4f}")
-
-# Покажем соответствие меток
-label_mapping = indexer_event.fit(df).labels
-print(">>> Label mapping (index -> event_type):")
-for idx, label in enumerate(label_mapping):
-    print(f"  {idx} -> {label}")
-
-# Примеры предсказаний
-print(">>> Prediction examples:")
-result.select(
-    "event_type", "prediction", "drone_id", "zone_id", "battery", "state"
-).show(10)
-
-# 4. ДОПОЛНИТЕЛЬНЫЙ АНАЛИЗ: Время обработки зоны
-print("\n>>> Analyzing zone processing time...")
-
-# Найдём время между 'zone_claimed' и 'zone_processed'
-claimed = df.filter(col("event_type") == "zone_claimed").select(
-    "zone_id", "timestamp", "drone_id"
-).withColumnRenamed("timestamp", "claimed_at")
-
-processed = df.filter(col("event_type") == "zone_processed").select(
-    "zone_id", "timestamp"
-).withColumnRenamed("timestamp", "processed_at")
-
-processing_time = claimed.join(processed, "zone_id") \
-    .withColumn("processing_duration_sec", col("processed_at") - col("claimed_at")) \
-    .filter(col("processing_duration_sec") > 0)
-
-avg_time = processing_time.agg(avg("processing_duration_sec")).collect()[0][0]
-print(f"Average zone processing time: {avg_time:.2f} seconds")
-
-# Сохраняем модель (опционально)
-# model.write().overwrite().save("/tmp/drone_event_classifier")
-
-spark.stop()
-print(">>> Analysis completed successfully!")
+        (col("claimed_at") - col("discovered_at")).alias("discover_to_claim"),
+        (col("processed_at") - col("claimed_at")).alias("claim_to_process"),
+        (col("processed_at") - col("discovered_at")).alias("discover_to_process"),
+    ).persist(StorageLevel.MEMORY_AND_DISK)
+
+    # Все стадии одним проходом: неположительные задержки (нарушен порядок) → null и не учитываются
+    # percentile_approx — SQL-функцией: Python-обёртка есть только с Spark 3.1
+    quantiles = [p / 100 for p in zone_lifecycle.PERCENTILES]
+    aggs = []
+    for stage in zone_lifecycle.STAGES:
+        valid = when(col(stage) > 0, col(stage))
+        pct = f"percentile_approx(CASE WHEN {stage} > 0 THEN {stage} END, array({', '.join(map(str, quantiles))}))"
+        aggs += [count(valid).alias(f"{stage}|count"), avg(valid).alias(f"{stage}|mean"),
+                 expr(pct).alias(f"{stage}|pct")]
+    row = zones.agg(*aggs).collect()[0]
+    latency = {}
+    for stage in zone_lifecycle.STAGES:
+        pct = row[f"{stage}|pct"] or [None] * len(quantiles)
+        latency[stage] = {"count": row[f"{stage}|count"], "mean": row[f"{stage}|mean"],
+                          **{f"p{p}": v for p, v in zip(zone_lifecycle.PERCENTILES, pct)}}
+    latency = pd.DataFrame(latency).T
+
+    drones = zones.filter(col("claim_to_process") > 0).groupBy("drone_id").agg(
+        count(lit(1)).alias("zones_processed"),
+        spark_sum("claim_to_process").alias("busy_sec"),
+    ).orderBy("drone_id").toPandas()
+    zones.unpersist()
+    drones["avg_process_sec"] = drones["busy_sec"] / drones["zones_processed"]
+    drones["zones_per_busy_hour"] = drones["zones_processed"] / drones["busy_sec"] * 3600
+    return latency, drones
+
+
+def main():
+    started = time.time()
+    with metrics.timer("spark_session"):
+        spark = create_spark()
+
+    print(f">>> Loading drone events from Hive ({EVENTS_TABLE})...")
+    # Только нужные колонки — ORC читает их без остальных
+    with spark_stage(spark, "load_input", table=EVENTS_TABLE):
+        df = spark.table(EVENTS_TABLE).select(*EVENT_COLUMNS)
+        version = input_fingerprint(spark, df)
+    print(f">>> Input version: {version}")
+
+    # 1. FEATURE ENGINEERING (кеш в Parquet, переиспользуется, пока не изменились партиции)
+    with spark_stage(spark, "features", version=version) as span:
+        features = load_features(spark, df, f"{FEATURES_ROOT}/{version}")
+        span["rows"] = features.count()
+
+    print(">>> Feature schema:")
+    features.printSchema()
+    print(">>> Sample data:")
+    features.show(5)
+
+    # Разделим данные
+    train_data, test_data = features.randomSplit([0.8, 0.2], seed=42)
+
+    # 2. МОДЕЛЬ: сохраняется и версионируется вместе с признаками
+    with spark_stage(spark, "train", version=version):
+        model = load_or_train(train_data, f"{MODELS_ROOT}/{version}")
+
+    # 3. ОЦЕНКА ТОЧНОСТИ
+    result = model.transform(test_data)
+    evaluator = MulticlassClassificationEvaluator(
+        labelCol="label",
+        predictionCol="prediction",
+        metricName="accuracy"
+    )
+    with spark_stage(spark, "evaluate"):
+        accuracy = evaluator.evaluate(result)
+    metrics.gauge("accuracy", round(accuracy, 4), "ratio", version=version)
+    print(f">>> Model Accuracy (predicting event_type): {accuracy:.4f}")
+
+    # Соответствие меток — из уже обученного индексатора, без повторного fit
+    label_mapping = model.stages[0].labelsArray[0]
+    print(">>> Label mapping (index -> event_type):")
+    for idx, label in enumerate(label_mapping):
+        print(f"  {idx} -> {label}")
+
+    # Примеры предсказаний
+    print(">>> Prediction examples:")
+    result.select(
+        "event_type", "prediction", "drone_id", "zone_id", "battery", "state"
+    ).show(10)
+
+    # Выгрузка леса для сервиса без JVM и сверка его предсказаний со Spark
+    with spark_stage(spark, "export_forest") as span:
+        forest_export.export_pipeline(model, FOREST_FILE, FEATURE_COLUMNS)
+        checked, mismatches = forest_export.verify_against_spark(model, forest_export.Forest.load(FOREST_FILE),
+                                                                 test_data)
+        span.update(rows=checked, mismatches=mismatches)
+    print(f">>> Forest exported to {FOREST_FILE}: {mismatches} mismatches vs Spark on {checked} rows")
+    if mismatches:
+        print(">>> WARNING: exported forest disagrees with Spark, do not serve it", file=sys.stderr)
+
+    # 4. ДОПОЛНИТЕЛЬНЫЙ АНАЛИЗ: жизненный цикл зон
+    print("\n>>> Analyzing zone lifecycle (discover -> claim -> process)...")
+    with spark_stage(spark, "zone_lifecycle"):
+        latency, drones = zone_lifecycle_batch(features)
+    print(latency.round(3).to_string())
+    print(f"Average zone processing time: {latency.loc['claim_to_process', 'mean']:.2f} seconds")
+    print(">>> Drone throughput:")
+    print(drones.round(2).to_string(index=False))
+
+    features.unpersist()
+    spark.stop()
+    metrics.timing("training", time.time() - started, version=version)
+    metrics.peak_memory()
+    print(">>> Analysis completed successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Жизненный цикл зон: обнаружение → взятие → обработка за один проход по событиям.
+
+ZoneLifecycleTracker держит состояние только незавершённых зон и на каждое событие
+делает O(1) работы: задержки discover→claim, claim→process, discover→process
+сразу уходят в логарифмические гистограммы (перцентили с точностью ~1%),
+производительность дронов копится счётчиками. Трекеры частей сливаются через merge().
+Пакетный вариант для Spark — train_liquidity.zone_lifecycle_batch (один groupBy по зоне
+вместо join claimed × processed).
+
+    python zone_lifecycle.py drone_events_million.csv
+    python zone_lifecycle.py drone_events_million.csv --check   # поток vs пакетный pandas
+"""
+import argparse
+import math
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+import raw_events
+
+# --- ПАРАМЕТРЫ ---
+DISCOVERED, CLAIMED, PROCESSED = "zone_discovered", "zone_claimed", "zone_processed"
+STAGES = ["discover_to_claim", "claim_to_process", "discover_to_process"]
+PERCENTILES = (50, 90, 99)
+MAX_OPEN_ZONES = 1_000_000   # зоны без обработки (10% так и не берутся) — вытесняем самые старые
+HIST_MIN_SEC = 1e-3
+HIST_MAX_SEC = 1e6
+HIST_RELATIVE_ERROR = 0.01
+
+
+class LatencyHistogram:
+    """Логарифмические бины: O(1) на значение, фиксированная память, слияние сложением"""
+
+    def __init__(self, min_value=HIST_MIN_SEC, max_value=HIST_MAX_SEC, relative_error=HIST_RELATIVE_ERROR):
+        self.min_value = min_value
+        self.log_base = math.log1p(2 * relative_error)
+        self.counts = np.zeros(int(math.log(max_value / min_value) / self.log_base) + 2, dtype=np.int64)
+        self.total = 0.0
+        self.n = 0
+
+    def _bin(self, value):
+        if value <= self.min_value:
+            return 0
+        return min(int(math.log(value / self.min_value) / self.log_base) + 1, len(self.counts) - 1)
+
+    def add(self, value):
+        self.counts[self._bin(value)] += 1
+        self.total += value
+        self.n += 1
+
+    def add_many(self, values):
+        """Пакет значений одним np.add.at"""
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        bins = np.zeros(len(values), dtype=np.int64)
+        above = values > self.min_value
+        bins[above] = np.log(values[above] / self.min_value) // self.log_base + 1
+        np.add.at(self.counts, np.minimum(bins, len(self.counts) - 1), 1)
+        self.total += float(values.sum())
+        self.n += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.n += other.n
+        return self
+
+    def quantile(self, q):
+        """Середина бина (геометрическая), в котором лежит q-квантиль"""
+        if not self.n:
+            return float("nan")
+        i = int(np.searchsorted(np.cumsum(self.counts), q * self.n, side="left"))
+        if i == 0:
+            return self.min_value
+        lo = self.min_value * math.exp((i - 1) * self.log_base)
+        return lo * math.exp(self.log_base / 2)
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float("nan")
+
+    def summary(self, percentiles=PERCENTILES):
+        row = {"count": self.n, "mean": self.mean}
+        row.update({f"p{p}": self.quantile(p / 100) for p in percentiles})
+        return row
+
+
+class ZoneLifecycleTracker:
+    """Потоковый трекер: состояние незавершённых зон + гистограммы задержек + счётчики дронов"""
+
+    def __init__(self, max_open_zones=MAX_OPEN_ZONES):
+        self.max_open_zones = max_open_zones
+        self.open = OrderedDict()   # zone_id → [t_discovered, t_claimed, drone_id]
+        self.latency = {stage: LatencyHistogram() for stage in STAGES}
+        self.drone_processed = defaultdict(int)
+        self.drone_busy_sec = defaultdict(float)
+        self.events = 0
+        self.evicted = 0
+        self.out_of_order = 0      # обработка раньше взятия и т.п. (неположительная задержка)
+
+    def _record(self, stage, start, end):
+        if start is None or end is None:
+            return
+        if end > start:
+            self.latency[stage].add(end - start)
+        else:
+            self.out_of_order += 1
+
+    def update(self, timestamp, event_type, drone_id, zone_id):
+        self.events += 1
+        if zone_id < 0:
+            return  # drone_disabled и прочие события без зоны
+        state = self.open.get(zone_id)
+        if state is None:
+            if len(self.open) >= self.max_open_zones:
+                self.open.popitem(last=False)
+                self.evicted += 1
+            state = self.open[zone_id] = [None, None, None]
+        if event_type == DISCOVERED:
+            state[0] = timestamp
+            self._record("discover_to_claim", timestamp, state[1])
+        elif event_type == CLAIMED:
+            state[1], state[2] = timestamp, drone_id
+            self._record("discover_to_claim", state[0], timestamp)
+        elif event_type == PROCESSED:
+            self._record("claim_to_process", state[1], timestamp)
+            self._record("discover_to_process", state[0], timestamp)
+            if state[1] is not None and timestamp > state[1]:
+                drone = state[2] if state[2] is not None else drone_id
+                self.drone_processed[drone] += 1
+                self.drone_busy_sec[drone] += timestamp - state[1]
+            if state[0] is not None and state[1] is not None:
+                del self.open[zone_id]  # цикл зоны завершён — состояние больше не нужно
+
+    def update_frame(self, df):
+        """Пакет событий в порядке следования (колонки timestamp, event_type, drone_id, zone_id)"""
+        for row in zip(df["timestamp"].tolist(), df["event_type"].astype(str).tolist(),
+                       df["drone_id"].tolist(), df["zone_id"].tolist()):
+            self.update(*row)
+        return self
+
+    def merge(self, other):
+        """Слить трекер другой части потока (зоны не должны пересекаться между частями)"""
+        for stage in STAGES:
+            self.latency[stage].merge(other.latency[stage])
+        for drone, n in other.drone_processed.items():
+            self.drone_processed[drone] += n
+        for drone, sec in other.drone_busy_sec.items():
+            self.drone_busy_sec[drone] += sec
+        self.open.update(other.open)
+        self.events += other.events
+        self.evicted += other.evicted
+        self.out_of_order += other.out_of_order
+        return self
+
+    def latency_table(self):
+        return pd.DataFrame({stage: hist.summary() for stage, hist in self.latency.items()}).T
+
+    def drone_table(self):
+        drones = sorted(self.drone_processed)
+        processed = np.array([self.drone_processed[d] for d in drones])
+        busy = np.array([self.drone_busy_sec[d] for d in drones])
+        return pd.DataFrame({
+            "drone_id": drones,
+            "zones_processed": processed,
+            "busy_sec": busy,
+            "avg_process_sec": busy / np.maximum(processed, 1),
+            "zones_per_busy_hour": processed / np.maximum(busy, 1e-9) * 3600,
+        })
+
+
+def lifecycle_frame(df):
+    """Пакетный вариант на pandas: по строке на зону с моментами трёх событий"""
+    zones = df[df["zone_id"] >= 0]
+    times = zones.pivot_table(index="zone_id", columns="event_type", values="timestamp",
+                              aggfunc="min", observed=True)
+    claims = zones[zones["event_type"] == CLAIMED].sort_values("timestamp").drop_duplicates("zone_id")
+    times["drone_id"] = claims.set_index("zone_id")["drone_id"]
+    return times.reindex(columns=[DISCOVERED, CLAIMED, PROCESSED, "drone_id"])
+
+
+def check(path, tracker):
+    """Сверка потокового трекера с пакетным расчётом по тому же файлу"""
+    zones = lifecycle_frame(raw_events.read_csv_typed(path, usecols=["timestamp", "event_type", "drone_id",
+                                                                         "zone_id"]))
+    pairs = {"discover_to_claim": (DISCOVERED, CLAIMED), "claim_to_process": (CLAIMED, PROCESSED),
+             "discover_to_process": (DISCOVERED, PROCESSED)}
+    ok = True
+    for stage, (start, end) in pairs.items():
+        lat = (zones[end] - zones[start]).dropna()
+        lat = lat[lat > 0]
+        hist = tracker.latency[stage]
+        for p in PERCENTILES:
+            exact, approx = np.percentile(lat, p), hist.quantile(p / 100)
+            rel = abs(approx - exact) / exact
+            ok &= len(lat) == hist.n and rel <= 2 * HIST_RELATIVE_ERROR
+            print(f"{stage:>20} p{p}: exact {exact:9.3f}  histogram {approx:9.3f}  ({rel:.2%})  n={len(lat):,}")
+    if not ok:
+        raise SystemExit("streaming tracker diverges from batch computation")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("--check", action="store_true", help="Сверить с пакетным расчётом на pandas")
+    args = parser.parse_args()
+
+    tracker = ZoneLifecycleTracker()
+    started = time.perf_counter()
+    for chunk in raw_events.typed_chunks(args.input, usecols=["timestamp", "event_type", "drone_id", "zone_id"]):
+        tracker.update_frame(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"Events: {tracker.events:,} in {elapsed:.1f}s ({tracker.events / elapsed:,.0f} ev/s), "
+          f"open zones: {len(tracker.open):,}, evicted: {tracker.evicted:,}, out of order: {tracker.out_of_order:,}")
+    print(tracker.latency_table().round(3).to_string())
+    print(tracker.drone_table().round(2).to_string(index=False))
+    if args.check:
+        check(args.input, tracker)
+
+
+if __name__ == "__main__":
+    main()